@@ -8,7 +8,11 @@ load_dotenv()
 
 from langchain_community.callbacks import get_openai_callback
 from src.retrieval import get_advanced_retriever
-from src.generation import get_rag_chain, format_docs, rewrite_query_with_history
+from src.generation import get_rag_chain, format_docs, needs_rewrite, rewrite_query, rewrite_stats
+from src.ingestion_jobs import IngestionJobRunner, FAILED, SUCCEEDED
+from src.clients import connection_stats
+from src.query_cache import cache_stats
+from src.speculative_retrieval import SPECULATIVE_RETRIEVAL, SpeculativeRetrieval, speculation_stats
 from src.logging_config import setup_logging
 
 # Initialize logging
@@ -22,6 +26,12 @@ if "messages" not in st.session_state:
 if "selected_sources" not in st.session_state:
     st.session_state["selected_sources"] = []
 
+if "available_sources" not in st.session_state:
+    st.session_state["available_sources"] = []
+
+if "submitted_uploads" not in st.session_state:
+    st.session_state["submitted_uploads"] = {}
+
 if "session_stats" not in st.session_state:
     st.session_state["session_stats"] = {
         "queries": 0,
@@ -30,6 +40,20 @@ if "session_stats" not in st.session_state:
         "total_time": 0.0,
     }
 
+
+@st.cache_resource
+def get_ingestion_runner():
+    """
+    One job runner shared by all sessions.
+
+    It owns the retriever, so an upload swaps the index in for everyone without
+    clearing st.cache_resource.
+    """
+    return IngestionJobRunner(retriever_factory=lambda: get_advanced_retriever(k=3))
+
+
+ingestion_runner = get_ingestion_runner()
+
 st.title("Oncology Trial Library RAG Demo")
 
 # Example questions
@@ -64,6 +88,7 @@ with st.sidebar:
                     st.markdown(f"📄 {f}")
 
             st.session_state["selected_sources"] = selected_docs
+            st.session_state["available_sources"] = pdf_files
 
             if not selected_docs:
                 st.warning("⚠️ No documents selected - select at least one to ask questions")
@@ -77,18 +102,35 @@ with st.sidebar:
     # File Upload
     st.subheader("Add Document")
     uploaded_file = st.file_uploader("Upload PDF", type="pdf")
-    if uploaded_file:
+    # The uploader keeps its file across reruns, so only queue each upload once
+    if uploaded_file and (uploaded_file.name, uploaded_file.size) not in st.session_state["submitted_uploads"]:
         save_path = os.path.join("./data", uploaded_file.name)
         with open(save_path, "wb") as f:
             f.write(uploaded_file.getbuffer())
-        st.success(f"Saved {uploaded_file.name}")
-
-        with st.spinner("Ingesting new document..."):
-            from src.ingestion import ingest_docs
-            ingest_docs()
-            st.cache_resource.clear()
-            st.success("Ingestion complete!")
+        job = ingestion_runner.submit(uploaded_file.name)
+        st.session_state["submitted_uploads"][(uploaded_file.name, uploaded_file.size)] = job.job_id
+        st.success(f"Saved {uploaded_file.name}, ingesting in the background")
+
+    my_job_ids = set(st.session_state["submitted_uploads"].values())
+
+    @st.fragment(run_every=2 if ingestion_runner.has_pending_jobs() else None)
+    def show_ingestion_jobs():
+        jobs = ingestion_runner.list_jobs()
+        for job in jobs[:5]:
+            if job.status == SUCCEEDED:
+                st.caption(f"✅ {job.file_name} indexed")
+            elif job.status == FAILED:
+                st.error(f"Ingestion of {job.file_name} failed: {job.error}")
+            else:
+                st.progress(job.progress, text=f"{job.file_name}: {job.stage}")
+        # Rerun the whole page once this session's jobs finish to refresh the document list
+        mine_pending = any(not job.done for job in jobs if job.job_id in my_job_ids)
+        if st.session_state.get("jobs_running") and not mine_pending:
+            st.session_state["jobs_running"] = False
             st.rerun()
+        st.session_state["jobs_running"] = mine_pending
+
+    show_ingestion_jobs()
 
     st.divider()
 
@@ -103,6 +145,24 @@ with st.sidebar:
         col1.metric("Avg Time", f"{stats['total_time']/stats['queries']:.2f}s")
         col2.metric("Total Tokens", f"{stats['total_tokens']:,}")
 
+    # Process-wide query caches (shared by all sessions)
+    caches = cache_stats()
+    st.caption(f"Cache hit rate: retrieval {caches['retrieval']['hit_rate']:.0%} "
+               f"({caches['retrieval']['entries']}/{caches['retrieval']['max_entries']} entries), "
+               f"query embeddings {caches['query_embeddings']['hit_rate']:.0%}")
+    rewrites = rewrite_stats()
+    if rewrites["skipped"] + rewrites["cached"] + rewrites["llm"]:
+        st.caption(f"Query rewrites: {rewrites['llm']} LLM, {rewrites['skipped']} skipped, "
+                   f"{rewrites['cached']} cached, saving ~{rewrites['time_saved']:.1f}s")
+    speculation = speculation_stats()
+    if speculation["total"]:
+        st.caption(f"Speculative retrieval reused {speculation['reuse_rate']:.0%} of {speculation['total']} "
+                   f"follow-ups, saving {speculation['time_saved']:.1f}s")
+    pools = {name: pool for name, pool in connection_stats().items() if pool["requests"]}
+    if pools:
+        st.caption("Connection reuse: " + ", ".join(
+            f"{name} {pool['reuse_rate']:.0%} of {pool['requests']} requests" for name, pool in pools.items()))
+
     st.divider()
 
     col1, col2 = st.columns(2)
@@ -121,17 +181,10 @@ with st.sidebar:
 def load_rag_chain():
     return get_rag_chain()
 
-@st.cache_resource
-def load_retriever():
-    """
-    Load retriever once and cache it.
-    Important: Milvus Lite doesn't support multiple connections to the same DB file.
-    """
-    return get_advanced_retriever(k=3)
-
 try:
     rag_chain = load_rag_chain()
-    base_retriever = load_retriever()
+    # Current index; a finished ingestion job swaps in a new one between queries
+    base_retriever = ingestion_runner.get_retriever()
 except Exception as e:
     st.error(f"Failed to load RAG components. Make sure you have set .env correctly. Error: {e}")
     st.stop()
@@ -149,8 +202,9 @@ for msg in st.session_state["messages"]:
         # Display metrics if available
         if "metrics" in msg:
             metrics = msg["metrics"]
+            rewrite_note = f", rewrite: {metrics['rewrite']}" if metrics.get("rewrite") else ""
             st.caption(
-                f"⏱️ {metrics['total_time']:.2f}s (retrieval: {metrics['retrieval_time']:.2f}s) | "
+                f"⏱️ {metrics['total_time']:.2f}s (retrieval: {metrics['retrieval_time']:.2f}s{rewrite_note}) | "
                 f"📊 {metrics['llm_tokens']:,} LLM tokens | "
                 f"💰 ${metrics['llm_cost']:.5f} LLM cost"
             )
@@ -177,15 +231,32 @@ if user_input:
             try:
                 query_start_time = time.time()
                 selected_sources = st.session_state["selected_sources"]
+                # Only filter when some documents are deselected: an unfiltered search is
+                # cheaper and also works on collections ingested before doc_key existed
+                all_selected = set(selected_sources) >= set(st.session_state["available_sources"])
+                retrieval_sources = None if all_selected else selected_sources
 
                 # Get conversation history (excluding current question)
                 chat_history = st.session_state["messages"][:-1]  # Exclude the just-added user message
 
+                # Follow-ups: start retrieving for the raw question while it is
+                # rewritten; the results are reused if the rewrite barely changes it
+                speculation = None
+                if SPECULATIVE_RETRIEVAL and chat_history and needs_rewrite(user_input):
+                    speculation = SpeculativeRetrieval(base_retriever, user_input, sources=retrieval_sources).start()
+
                 # Rewrite query with conversation history for better retrieval
                 # Track the rewriting cost
                 rewrite_start = time.time()
                 with get_openai_callback() as rewrite_cb:
-                    rewritten_query = rewrite_query_with_history(user_input, chat_history)
+                    rewrite = rewrite_query(user_input, chat_history)
+                rewritten_query = rewrite.query
+                if rewrite.source == "llm":
+                    rewrite_summary = f"{rewrite.elapsed:.2f}s"
+                elif rewrite.source in ("skipped", "cached"):
+                    rewrite_summary = f"{rewrite.source}, saved ~{rewrite.saved:.2f}s"
+                else:
+                    rewrite_summary = ""
                 rewrite_time = time.time() - rewrite_start
 
                 # Calculate rewrite cost (gpt-4o-mini pricing) - only if there was a rewrite
@@ -200,23 +271,25 @@ if user_input:
                 # Retrieve documents ONCE using rewritten query
                 # This ensures UI shows exactly what the LLM saw
                 # Use cached retriever to avoid Milvus Lite connection issues
+                # A partial source selection is pushed down into Milvus and BM25, so
+                # all k slots go to the selected documents
+                # With speculation, retrieval_time is only the wait after the rewrite
                 retrieval_start = time.time()
                 try:
-                    docs = base_retriever.invoke(rewritten_query)
+                    if speculation is not None:
+                        docs = speculation.resolve(rewritten_query)
+                    else:
+                        docs = base_retriever.invoke(rewritten_query, sources=retrieval_sources)
                     retrieval_time = time.time() - retrieval_start
                 except Exception as e:
                     st.error(f"Retrieval error: {e}")
                     st.warning("This may be an embedding API issue. Check your OPENAI_API_KEY and OPENAI_API_BASE settings.")
                     raise
 
-                # Filter docs by selected sources (post-retrieval filtering)
-                if selected_sources:
-                    filtered_docs = []
-                    for doc in docs:
-                        source = os.path.basename(doc.metadata.get("source", ""))
-                        if source in selected_sources:
-                            filtered_docs.append(doc)
-                    docs = filtered_docs
+                # Never send a deselected document to the LLM, whatever the retriever did
+                # with the filter (older chunks have no doc_key, only a source path)
+                docs = [doc for doc in docs
+                        if doc.metadata.get("doc_key", os.path.basename(doc.metadata.get("source", ""))) in selected_sources]
 
                 if not docs:
                     answer = "I could not find relevant information in the selected documents. Please try rephrasing your question or selecting different documents."
@@ -291,8 +364,9 @@ if user_input:
                 st.session_state["session_stats"]["total_time"] += total_time
 
                 # Show per-query metrics
+                rewrite_note = f", rewrite: {rewrite_summary}" if rewrite_summary else ""
                 st.caption(
-                    f"⏱️ {total_time:.2f}s (retrieval: {retrieval_time:.2f}s) | "
+                    f"⏱️ {total_time:.2f}s (retrieval: {retrieval_time:.2f}s{rewrite_note}) | "
                     f"📊 {llm_tokens:,} LLM tokens | "
                     f"💰 ${llm_cost:.5f} LLM cost"
                 )
@@ -304,6 +378,7 @@ if user_input:
                 # Set default values for metrics in case of error
                 total_time = 0.0
                 retrieval_time = 0.0
+                rewrite_summary = ""
                 llm_tokens = 0
                 llm_cost = 0.0
 
@@ -315,6 +390,7 @@ if user_input:
             "metrics": {
                 "total_time": total_time,
                 "retrieval_time": retrieval_time,
+                "rewrite": rewrite_summary,
                 "llm_tokens": llm_tokens,
                 "llm_cost": llm_cost,
             }
@@ -0,0 +1,116 @@
+"""
+Active index pointer: which index generation queries are served from.
+
+A full rebuild used to drop the live Milvus collection (or local store) and
+BM25 index and refill them while queries were still being answered from them.
+Instead every rebuild now writes a new generation next to the live one:
+
+- Milvus: collection LangChainCollection_<n> in the same database file
+- local backend: directory <LOCAL_VECTOR_DIR>-<n>
+- BM25: directory <BM25_INDEX_PATH>-<n>
+
+and only when it is complete does activate_index() atomically replace the
+small pointer file. Retrievers are built from the active generation, so they
+see either the old index or the new one, never a half-built one. Generation 0
+is the pre-generation layout (default collection and paths), so existing
+indexes keep working.
+
+A retired generation is kept until the following activation: retrievers built
+before the swap may still be answering queries from it.
+
+Key Components:
+- IndexLocation: Collection/directory/BM25 path of one generation
+- get_active_index: Location queries should be served from
+- next_index: Staging location for the next rebuild
+- activate_index: Atomic switch to a staged generation
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from src import bm25_index, local_vectorstore
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+ACTIVE_INDEX_PATH = os.getenv("ACTIVE_INDEX_PATH", "./active_index.json")
+# langchain_milvus' default collection name, used by generation 0
+MILVUS_COLLECTION = "LangChainCollection"
+
+
+@dataclass(frozen=True)
+class IndexLocation:
+    """Where one index generation lives."""
+
+    generation: int
+    collection: str
+    local_dir: str
+    bm25_path: str
+
+
+def index_location(generation: int) -> IndexLocation:
+    """Location of an index generation."""
+    # Read through the modules so runtime overrides of the base paths apply
+    if generation == 0:
+        return IndexLocation(0, MILVUS_COLLECTION, local_vectorstore.LOCAL_VECTOR_DIR, bm25_index.BM25_INDEX_PATH)
+    root, ext = os.path.splitext(bm25_index.BM25_INDEX_PATH)
+    return IndexLocation(
+        generation=generation,
+        collection=f"{MILVUS_COLLECTION}_{generation}",
+        local_dir=f"{local_vectorstore.LOCAL_VECTOR_DIR.rstrip('/')}-{generation:06d}",
+        bm25_path=f"{root}-{generation:06d}{ext}",
+    )
+
+
+def _read_pointer() -> Dict[str, Any]:
+    if not os.path.exists(ACTIVE_INDEX_PATH):
+        return {"generation": 0, "previous": None}
+    try:
+        with open(ACTIVE_INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        # Never guess another generation: serving generation 0 may be empty, but is never half-built
+        logger.warning(f"Unreadable active index pointer {ACTIVE_INDEX_PATH}, using generation 0: {e}")
+        return {"generation": 0, "previous": None}
+
+
+def get_active_index() -> IndexLocation:
+    """Location of the generation queries should be served from."""
+    return index_location(_read_pointer()["generation"])
+
+
+def next_index() -> IndexLocation:
+    """
+    Staging location for the next rebuild.
+
+    Never the active or the retained previous generation, so it can be
+    dropped and refilled freely (e.g. after an aborted rebuild).
+    """
+    pointer = _read_pointer()
+    return index_location(max(pointer["generation"], pointer["previous"] or 0) + 1)
+
+
+def activate_index(location: IndexLocation) -> Optional[IndexLocation]:
+    """
+    Atomically make a staged generation the active one.
+
+    Args:
+        location: Fully built generation (from next_index())
+
+    Returns:
+        The generation retired by the previous activation, which no retriever
+        is built from anymore and can now be dropped (None if there is none)
+    """
+    pointer = _read_pointer()
+    tmp_path = f"{ACTIVE_INDEX_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"generation": location.generation, "previous": pointer["generation"]}, f)
+    os.replace(tmp_path, ACTIVE_INDEX_PATH)
+    logger.info(f"Activated index generation {location.generation} (previous: {pointer['generation']})")
+
+    retired = pointer["previous"]
+    if retired is None or retired == location.generation:
+        return None
+    return index_location(retired)
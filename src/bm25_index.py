@@ -0,0 +1,684 @@
+"""
+Persistent BM25 index built at ingestion time.
+
+The hybrid retriever used to rebuild BM25 on every cold start by pulling the
+whole corpus out of Milvus with similarity_search("", k=10000): an embedding
+API call, a full collection scan and a silent 10k-chunk cap. Instead the
+ingestion pipeline maintains the BM25 statistics (per-chunk term frequencies,
+document frequencies, chunk lengths) next to the Milvus collection and saves
+them to disk, so the retriever only has to load them.
+
+The index is updated incrementally by doc_key, mirroring the Milvus deletes
+and inserts of incremental ingestion.
+
+Queries are scored by BM25Engine, an inverted index compiled into NumPy
+arrays (term-major, CSC-style) with the full BM25 weight of every posting
+precomputed. A query only touches the postings of its own terms and top-k
+selection uses argpartition, instead of rank_bm25's per-document Python loop
+over the whole corpus for every query term.
+
+An index is saved as a directory: the raw statistics (including doc_len and
+doc_freqs) and the compiled postings (indptr/doc_ids, and weights with idf and
+length normalization folded in) as .npy files, plus the chunks as a JSON-lines file with an offset sidecar. Loading memory-maps them,
+so startup neither recompiles the postings nor reads every chunk into RAM.
+While ingesting, add_documents() appends each batch's postings and chunks to
+spool files on disk instead of keeping the streamed Documents in memory.
+
+Key Components:
+- BM25Index: Corpus statistics with add/remove by doc_key and save/load
+- BM25Engine: Vectorized postings scorer (Okapi BM25, rank_bm25-compatible idf)
+- BM25IndexRetriever: LangChain retriever over a BM25Engine, with an optional
+  per-request source filter applied as a mask before top-k selection
+- tokenize: Tokenizer shared by indexing and querying
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import weakref
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from src.chunk_ids import chunk_doc_key
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "./bm25_index")
+FORMAT_VERSION = 2
+
+# Chunks this short (after stripping) carry no useful lexical signal
+MIN_CHUNK_CHARS = 10
+
+# Below this many postings per corpus chunk a query is accumulated sparsely
+# (np.unique over its postings) rather than into a dense per-chunk score array.
+# Measured crossover on a 1M-chunk synthetic corpus was ~0.08: dense queries
+# take 3-8 ms there, sparse ones well under 1 ms for rare terms.
+SPARSE_QUERY_RATIO = 0.1
+
+
+def tokenize(text: str) -> List[str]:
+    """Whitespace tokenizer (same as BM25Retriever's default preprocessing)."""
+    return text.split()
+
+
+class ChunkStore:
+    """
+    Chunks stored as JSON lines in one file and read back by row.
+
+    Indexes hold chunks here instead of as Document objects in memory: only
+    the byte offsets of the rows are kept, and a chunk is parsed when a
+    retriever returns it. Rows can be appended while the store is read.
+    """
+
+    def __init__(self, path: str, offsets: Optional[Iterable[int]] = None):
+        self.path = path
+        self._offsets = array("q", offsets if offsets is not None else [0])
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self._fd = os.open(path, os.O_RDONLY)
+        weakref.finalize(self, os.close, self._fd)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> Document:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        record = json.loads(os.pread(self._fd, end - start, start))
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def __iter__(self) -> Iterator[Document]:
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return np.frombuffer(self._offsets, dtype=np.int64)
+
+    def append(self, docs: List[Document]) -> None:
+        """Append chunks (one write for the whole batch)."""
+        rows = [json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}).encode("utf-8") + b"\n"
+                for doc in docs]
+        with open(self.path, "ab") as f:
+            f.write(b"".join(rows))
+        for row in rows:
+            self._offsets.append(self._offsets[-1] + len(row))
+
+
+class BM25Index:
+    """
+    BM25 corpus statistics that can be updated, persisted and reloaded.
+
+    Postings are kept chunk-major on disk while the index is built: the term
+    ids and term frequencies of chunk i are term_ids/tfs[chunk_indptr[i]:
+    chunk_indptr[i + 1]], appended to spool files batch by batch, and chunk
+    texts go to a ChunkStore. Memory therefore holds only the vocabulary
+    (doc_freqs per term) and a few integers per chunk, however large the
+    corpus is.
+
+    save() compiles the term-major BM25Engine postings once and writes them
+    next to the raw statistics; load() maps them with np.load(mmap_mode="r"),
+    so a saved index is ready for queries without recompiling anything.
+
+    Layout of a saved index directory (as in src.local_vectorstore):
+    - meta.json: format version, current generation, counts (replaced atomically, written last)
+    - gen-NNNNNN/: raw statistics (terms.json, doc_freqs, chunk_indptr, term_ids,
+      tfs, doc_len, doc_key_codes + doc_keys.json), compiled postings (indptr,
+      doc_ids, weights) as .npy, and the chunks (docs.jsonl + doc_offsets.npy)
+    """
+
+    def __init__(self, docs: Optional[Iterable[Document]] = None):
+        self._spool = tempfile.mkdtemp(prefix="bm25-")
+        weakref.finalize(self, shutil.rmtree, self._spool, True)
+        self.terms: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self._doc_freqs: List[int] = []
+        self.doc_keys: List[str] = []
+        self._doc_key_ids: Dict[str, int] = {}
+        self._doc_key_codes = array("i")
+        self._doc_len = array("i")
+        self._chunk_indptr = array("q", [0])
+        self.docs = ChunkStore(os.path.join(self._spool, "docs.jsonl"))
+        # Set by load(): saved generation the index still reads from (copied on first change)
+        self._loaded_dir: Optional[str] = None
+        # Set by load(): directory with compiled postings matching the current contents
+        self._compiled_dir: Optional[str] = None
+        self._positive: Optional[bool] = None
+        if docs:
+            self.add_documents(docs)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @property
+    def doc_freqs(self) -> Dict[str, int]:
+        """Term -> number of chunks containing it."""
+        return {term: df for term, df in zip(self.terms, self._doc_freqs) if df}
+
+    @property
+    def doc_len(self) -> np.ndarray:
+        return np.frombuffer(self._doc_len, dtype=np.int32)
+
+    @property
+    def doc_key_codes(self) -> np.ndarray:
+        """Per-chunk index into doc_keys."""
+        return np.frombuffer(self._doc_key_codes, dtype=np.int32)
+
+    @property
+    def chunk_indptr(self) -> np.ndarray:
+        return np.frombuffer(self._chunk_indptr, dtype=np.int64)
+
+    def _spool_path(self, name: str) -> str:
+        return os.path.join(self._spool, name)
+
+    def raw_postings(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Chunk-major (term_ids, tfs) of every chunk."""
+        if self._loaded_dir is not None:
+            return tuple(np.load(os.path.join(self._loaded_dir, f"{name}.npy"), mmap_mode="r")
+                         for name in ("term_ids", "tfs"))
+        return tuple(np.fromfile(self._spool_path(f"{name}.bin"), dtype=np.int32) if len(self)
+                     else np.empty(0, dtype=np.int32) for name in ("term_ids", "tfs"))
+
+    def _make_writable(self) -> None:
+        """Copy a loaded generation into the spool before changing it (the saved files stay untouched)."""
+        if self._loaded_dir is None:
+            return
+        term_ids, tfs = self.raw_postings()
+        np.asarray(term_ids).tofile(self._spool_path("term_ids.bin"))
+        np.asarray(tfs).tofile(self._spool_path("tfs.bin"))
+        docs_path = self._spool_path("docs.jsonl")
+        shutil.copyfile(self.docs.path, docs_path)
+        self.docs = ChunkStore(docs_path, self.docs.offsets.tolist())
+        self._loaded_dir = None
+        self._compiled_dir = None
+
+    def add_documents(self, docs: Iterable[Document]) -> None:
+        """Index chunks (too-short chunks are skipped); their texts and postings go to disk."""
+        self._make_writable()
+        kept: List[Document] = []
+        term_ids: List[int] = []
+        tfs: List[int] = []
+        for doc in docs:
+            if not doc.page_content or len(doc.page_content.strip()) <= MIN_CHUNK_CHARS:
+                continue
+            tokens = tokenize(doc.page_content)
+            frequencies: Dict[str, int] = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for term, count in frequencies.items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    term_id = self.vocab[term] = len(self.terms)
+                    self.terms.append(term)
+                    self._doc_freqs.append(0)
+                self._doc_freqs[term_id] += 1
+                term_ids.append(term_id)
+                tfs.append(count)
+            doc_key = chunk_doc_key(doc)
+            if doc_key not in self._doc_key_ids:
+                self._doc_key_ids[doc_key] = len(self.doc_keys)
+                self.doc_keys.append(doc_key)
+            self._doc_key_codes.append(self._doc_key_ids[doc_key])
+            self._doc_len.append(len(tokens))
+            self._chunk_indptr.append(self._chunk_indptr[-1] + len(frequencies))
+            kept.append(doc)
+        if not kept:
+            return
+
+        with open(self._spool_path("term_ids.bin"), "ab") as f:
+            f.write(array("i", term_ids).tobytes())
+        with open(self._spool_path("tfs.bin"), "ab") as f:
+            f.write(array("i", tfs).tobytes())
+        self.docs.append(kept)
+        self._compiled_dir = None
+
+    def remove_doc_keys(self, doc_keys: Iterable[str]) -> int:
+        """
+        Drop every chunk belonging to the given doc keys.
+
+        Returns:
+            Number of chunks removed
+        """
+        codes = [self._doc_key_ids[key] for key in set(doc_keys) if key in self._doc_key_ids]
+        if not codes:
+            return 0
+        keep = ~np.isin(self.doc_key_codes, np.asarray(codes, dtype=np.int32))
+        removed = int(len(keep) - keep.sum())
+        if not removed:
+            return 0
+        self._make_writable()
+
+        term_ids, tfs = self.raw_postings()
+        lengths = np.diff(self.chunk_indptr)
+        keep_postings = np.repeat(keep, lengths)
+        doc_freqs = np.asarray(self._doc_freqs, dtype=np.int64)
+        doc_freqs -= np.bincount(term_ids[~keep_postings], minlength=len(doc_freqs))
+        # Compact the vocabulary so unused terms don't shift the idf floor
+        kept_terms = np.flatnonzero(doc_freqs > 0)
+        remap = np.full(len(doc_freqs), -1, dtype=np.int32)
+        remap[kept_terms] = np.arange(len(kept_terms), dtype=np.int32)
+
+        remap[term_ids[keep_postings]].tofile(self._spool_path("term_ids.bin"))
+        tfs[keep_postings].tofile(self._spool_path("tfs.bin"))
+        self.terms = [self.terms[t] for t in kept_terms]
+        self.vocab = {term: i for i, term in enumerate(self.terms)}
+        self._doc_freqs = doc_freqs[kept_terms].tolist()
+        self._doc_len = array("i", self.doc_len[keep].tobytes())
+        self._doc_key_codes = array("i", self.doc_key_codes[keep].tobytes())
+        indptr = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+        np.cumsum(lengths[keep], out=indptr[1:])
+        self._chunk_indptr = array("q", indptr.tobytes())
+
+        # Copy the kept chunk rows into a fresh store
+        old_docs, offsets = self.docs, self.docs.offsets
+        new_path = self._spool_path(f"docs-{time.monotonic_ns()}.jsonl")
+        with open(old_docs.path, "rb") as src, open(new_path, "wb") as dst:
+            for i in np.flatnonzero(keep):
+                src.seek(offsets[i])
+                dst.write(src.read(offsets[i + 1] - offsets[i]))
+        row_lengths = np.diff(offsets)[keep]
+        new_offsets = np.zeros(len(row_lengths) + 1, dtype=np.int64)
+        np.cumsum(row_lengths, out=new_offsets[1:])
+        self.docs = ChunkStore(new_path, new_offsets.tolist())
+        self._compiled_dir = None
+        return removed
+
+    def as_retriever(self, k: int = 3) -> "BM25IndexRetriever":
+        """Retriever over this index (postings of a loaded index are used as saved, otherwise compiled once)."""
+        if self._compiled_dir is not None:
+            engine = BM25Engine.load(self._compiled_dir, self.vocab, len(self), self._positive)
+        else:
+            engine = BM25Engine.from_index(self)
+        return BM25IndexRetriever(engine=engine, docs=self.docs, doc_keys=self.doc_keys,
+                                  doc_key_codes=self.doc_key_codes, k=k)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Write the index as a new generation of the directory at path, then
+        switch meta.json to it (readers of the previous generation keep their mapped files).
+        """
+        path = path or BM25_INDEX_PATH
+        start = time.perf_counter()
+        meta_path = os.path.join(path, "meta.json")
+        previous = _read_meta(meta_path) if os.path.exists(meta_path) else None
+        generation = (previous or {}).get("generation", 0) + 1
+        gen_dir = os.path.join(path, f"gen-{generation:06d}")
+        if os.path.exists(gen_dir):
+            shutil.rmtree(gen_dir)
+        os.makedirs(gen_dir)
+
+        term_ids, tfs = self.raw_postings()
+        engine = BM25Engine.from_index(self, term_ids=term_ids, tfs=tfs)
+        arrays = {
+            "doc_freqs": np.asarray(self._doc_freqs, dtype=np.int32),
+            "chunk_indptr": self.chunk_indptr,
+            "term_ids": term_ids,
+            "tfs": tfs,
+            "doc_len": self.doc_len,
+            "doc_key_codes": self.doc_key_codes,
+            "doc_offsets": self.docs.offsets,
+            "indptr": engine.indptr,
+            "doc_ids": engine.doc_ids,
+            "weights": engine.weights,
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(gen_dir, f"{name}.npy"), values)
+        for name, values in (("terms", self.terms), ("doc_keys", self.doc_keys)):
+            with open(os.path.join(gen_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+                json.dump(values, f)
+        shutil.copyfile(self.docs.path, os.path.join(gen_dir, "docs.jsonl"))
+
+        meta = {"version": FORMAT_VERSION, "generation": generation, "chunks": len(self),
+                "terms": len(self.terms), "postings": int(len(term_ids)), "positive": engine.positive}
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        for name in os.listdir(path):
+            if name.startswith("gen-") and name != os.path.basename(gen_dir):
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        if self._loaded_dir is not None:
+            # The generation it was loaded from may just have been removed
+            self.docs = ChunkStore(os.path.join(gen_dir, "docs.jsonl"), self.docs.offsets.tolist())
+            self._loaded_dir = gen_dir
+        self._compiled_dir, self._positive = gen_dir, engine.positive
+        logger.info(f"Saved BM25 index with {len(self)} chunks to {path} in {time.perf_counter() - start:.3f}s")
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> Optional["BM25Index"]:
+        """Load a saved index, or None if it is missing, unreadable or from another format version."""
+        path = path or BM25_INDEX_PATH
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            if os.path.isfile(path):
+                logger.warning(f"Ignoring BM25 index {path} in the old single-file format")
+            return None
+
+        start = time.perf_counter()
+        meta = _read_meta(meta_path)
+        if meta is None:
+            logger.warning(f"Ignoring unreadable BM25 index {path}")
+            return None
+        if meta.get("version") != FORMAT_VERSION:
+            logger.warning(f"Ignoring BM25 index {path} with format version {meta.get('version')}")
+            return None
+
+        gen_dir = os.path.join(path, f"gen-{meta['generation']:06d}")
+        try:
+            arrays = {name: np.load(os.path.join(gen_dir, f"{name}.npy"), mmap_mode="r")
+                      for name in ("doc_freqs", "chunk_indptr", "doc_len", "doc_key_codes", "doc_offsets")}
+            with open(os.path.join(gen_dir, "terms.json"), "r", encoding="utf-8") as f:
+                terms = json.load(f)
+            with open(os.path.join(gen_dir, "doc_keys.json"), "r", encoding="utf-8") as f:
+                doc_keys = json.load(f)
+            docs = ChunkStore(os.path.join(gen_dir, "docs.jsonl"), arrays["doc_offsets"].tolist())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable BM25 index {path}: {e}")
+            return None
+
+        index = cls()
+        index.terms = terms
+        index.vocab = {term: i for i, term in enumerate(terms)}
+        index._doc_freqs = arrays["doc_freqs"].tolist()
+        index.doc_keys = doc_keys
+        index._doc_key_ids = {key: i for i, key in enumerate(doc_keys)}
+        index._doc_key_codes = array("i", arrays["doc_key_codes"].tobytes())
+        index._doc_len = array("i", arrays["doc_len"].tobytes())
+        index._chunk_indptr = array("q", arrays["chunk_indptr"].tobytes())
+        index.docs = docs
+        index._loaded_dir = gen_dir
+        index._compiled_dir = gen_dir
+        index._positive = meta.get("positive")
+        logger.info(f"Loaded BM25 index with {len(index)} chunks in {time.perf_counter() - start:.3f}s")
+        return index
+
+
+def _read_meta(meta_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class BM25Engine:
+    """
+    Okapi BM25 over an inverted index held in NumPy arrays.
+
+    Postings are grouped by term: the chunks containing term t are
+    doc_ids[indptr[t]:indptr[t + 1]] (ascending) with their precomputed BM25
+    term weights in weights[...]. Scoring a query is then a gather-and-add over
+    the postings of its terms. Parameters and the idf floor match rank_bm25's
+    BM25Okapi, so rankings equal BM25Retriever's.
+    """
+
+    def __init__(self, vocab: Dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray,
+                 weights: np.ndarray, num_docs: int, positive: Optional[bool] = None):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.num_docs = num_docs
+        # Tiny corpora can produce idf <= 0; otherwise a zero score means "no match"
+        self.positive = bool(len(weights) == 0 or weights.min() > 0) if positive is None else positive
+
+    @classmethod
+    def load(cls, directory: str, vocab: Dict[str, int], num_docs: int,
+             positive: Optional[bool] = None) -> "BM25Engine":
+        """Map postings saved by BM25Index.save() (no recompilation, pages are read on demand)."""
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                  for name in ("indptr", "doc_ids", "weights")]
+        return cls(vocab, *arrays, num_docs=num_docs, positive=positive)
+
+    @classmethod
+    def from_index(cls, index: BM25Index, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                   term_ids: Optional[np.ndarray] = None, tfs: Optional[np.ndarray] = None) -> "BM25Engine":
+        """Compile a BM25Index into postings arrays (term_ids/tfs: its raw postings, if already read)."""
+        start = time.perf_counter()
+        if term_ids is None or tfs is None:
+            term_ids, tfs = index.raw_postings()
+        vocab = dict(index.vocab)
+        num_docs = len(index)
+        num_postings = len(term_ids)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        tfs = np.asarray(tfs, dtype=np.float64)
+        doc_ids = np.repeat(np.arange(num_docs, dtype=np.int32), np.diff(index.chunk_indptr))
+
+        # Okapi idf with rank_bm25's floor: negative idfs become epsilon * mean idf
+        df = np.asarray(index._doc_freqs, dtype=np.float64)
+        idf = np.log(num_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+
+        doc_len = np.asarray(index.doc_len, dtype=np.float64)
+        avgdl = doc_len.mean() if num_docs else 1.0
+        norm = k1 * (1 - b + b * doc_len[doc_ids] / avgdl)
+        weights = idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)
+
+        # Term-major order; stable sort keeps doc_ids ascending within a term
+        order = np.argsort(term_ids, kind="stable")
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=indptr[1:])
+
+        logger.debug(f"Compiled BM25 postings ({num_docs} chunks, {len(vocab)} terms, "
+                     f"{num_postings} postings) in {time.perf_counter() - start:.3f}s")
+        return cls(vocab, indptr, doc_ids[order], weights[order].astype(np.float32), num_docs)
+
+    def _spans(self, tokens: List[str]) -> List[Tuple[int, int]]:
+        return [(self.indptr[t], self.indptr[t + 1]) for t in (self.vocab.get(token) for token in tokens)
+                if t is not None]
+
+    def _dense_scores(self, spans: List[Tuple[int, int]]) -> Tuple[np.ndarray, float]:
+        """
+        Per-chunk scores over the whole corpus.
+
+        Returns:
+            (scores, floor): chunks matching no query term score exactly floor,
+            which is below every real score
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for lo, hi in spans:
+            np.add.at(scores, self.doc_ids[lo:hi], self.weights[lo:hi])
+        if self.positive:
+            return scores, 0.0
+
+        hit = np.zeros(self.num_docs, dtype=bool)
+        for lo, hi in spans:
+            hit[self.doc_ids[lo:hi]] = True
+        scores[~hit] = -np.inf
+        return scores, -np.inf
+
+    def score(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every chunk that contains at least one query token.
+
+        Repeated query tokens count once per occurrence, as in rank_bm25.
+
+        Returns:
+            (chunk indices, scores), chunk indices ascending
+        """
+        spans = self._spans(tokens)
+        if not spans:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        if len(spans) == 1:
+            lo, hi = spans[0]
+            return self.doc_ids[lo:hi], self.weights[lo:hi]
+
+        num_postings = sum(hi - lo for lo, hi in spans)
+        if num_postings < SPARSE_QUERY_RATIO * self.num_docs:
+            doc_ids = np.concatenate([self.doc_ids[lo:hi] for lo, hi in spans])
+            weights = np.concatenate([self.weights[lo:hi] for lo, hi in spans])
+            matched, inverse = np.unique(doc_ids, return_inverse=True)
+            return matched, np.bincount(inverse, weights=weights).astype(np.float32)
+
+        scores, floor = self._dense_scores(spans)
+        matched = np.flatnonzero(scores > floor)
+        return matched, scores[matched]
+
+    def top_k(self, tokens: List[str], k: int,
+              mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Highest-scoring chunks for a tokenized query.
+
+        Only chunks matching a query term are returned (so possibly fewer than
+        k); ties are broken by chunk order.
+
+        Args:
+            tokens: Tokenized query
+            k: Number of chunks to return
+            mask: Optional boolean array over chunks; only chunks where it is
+                True are eligible (applied before top-k selection)
+
+        Returns:
+            [(chunk index, score)] by descending score
+        """
+        spans = self._spans(tokens)
+        num_postings = sum(hi - lo for lo, hi in spans)
+        if len(spans) > 1 and num_postings >= SPARSE_QUERY_RATIO * self.num_docs:
+            # Select straight from the dense array instead of compacting matches first
+            scores, floor = self._dense_scores(spans)
+            if mask is not None:
+                scores[~mask] = floor
+            doc_ids = np.argpartition(-scores, k - 1)[:k] if self.num_docs > k else np.arange(self.num_docs)
+            scores = scores[doc_ids]
+            doc_ids, scores = doc_ids[scores > floor], scores[scores > floor]
+        else:
+            doc_ids, scores = self.score(tokens)
+            if mask is not None:
+                keep = mask[doc_ids]
+                doc_ids, scores = doc_ids[keep], scores[keep]
+            if len(doc_ids) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                doc_ids, scores = doc_ids[top], scores[top]
+        order = np.lexsort((doc_ids, -scores))
+        return [(int(doc_ids[i]), float(scores[i])) for i in order]
+
+    def top_k_batch(self, token_lists: List[List[str]], k: int,
+                    mask: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """
+        top_k for several tokenized queries in one pass over their postings.
+
+        Query variations share most of their terms, so the postings of every
+        distinct term are gathered once and all queries are scored together
+        with a single bincount over (query, chunk) cells.
+
+        Args:
+            token_lists: Tokenized queries
+            k: Number of chunks to return per query
+            mask: Optional eligibility mask over chunks, as in top_k
+
+        Returns:
+            One top_k result list per query, in input order
+        """
+        term_lists = [[t for t in (self.vocab.get(token) for token in tokens) if t is not None]
+                      for tokens in token_lists]
+        terms = sorted({t for term_ids in term_lists for t in term_ids})
+        if not terms:
+            return [[] for _ in token_lists]
+
+        # counts[q, j]: occurrences of terms[j] in query q
+        column = {t: j for j, t in enumerate(terms)}
+        counts = np.zeros((len(term_lists), len(terms)), dtype=np.float64)
+        for q, term_ids in enumerate(term_lists):
+            for t in term_ids:
+                counts[q, column[t]] += 1
+
+        lengths = [self.indptr[t + 1] - self.indptr[t] for t in terms]
+        doc_ids = np.concatenate([self.doc_ids[self.indptr[t]:self.indptr[t + 1]] for t in terms])
+        weights = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] for t in terms])
+        term_columns = np.repeat(np.arange(len(terms)), lengths)
+
+        if len(doc_ids) >= SPARSE_QUERY_RATIO * self.num_docs:
+            matched, inverse = None, doc_ids
+            num_cells = self.num_docs
+        else:
+            matched, inverse = np.unique(doc_ids, return_inverse=True)
+            num_cells = len(matched)
+
+        per_query = counts[:, term_columns]
+        cells = (np.arange(len(term_lists))[:, None] * num_cells + inverse[None, :]).ravel()
+        size = len(term_lists) * num_cells
+        scores = np.bincount(cells, weights=(per_query * weights).ravel(), minlength=size)
+        hits = np.bincount(cells, weights=(per_query > 0).ravel(), minlength=size) > 0
+        scores = scores.astype(np.float32).reshape(len(term_lists), num_cells)
+        hits = hits.reshape(len(term_lists), num_cells)
+        if mask is not None:
+            hits &= (mask if matched is None else mask[matched])[None, :]
+
+        results = []
+        for row_scores, row_hits in zip(scores, hits):
+            cell_ids = np.flatnonzero(row_hits)
+            row_scores = row_scores[cell_ids]
+            if len(cell_ids) > k:
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                cell_ids, row_scores = cell_ids[top], row_scores[top]
+            row_docs = cell_ids if matched is None else matched[cell_ids]
+            order = np.lexsort((row_docs, -row_scores))
+            results.append([(int(row_docs[i]), float(row_scores[i])) for i in order])
+        return results
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """
+    Drop-in BM25 retriever (same role as BM25Retriever) backed by a BM25Engine.
+
+    Pass sources=[doc_key, ...] to invoke() to restrict results to those
+    documents. The filter is applied as a mask before top-k selection, so a
+    filtered query still returns up to k matching chunks.
+    """
+
+    engine: Any
+    docs: Any  # ChunkStore (or any sequence of Documents)
+    doc_keys: List[str]
+    doc_key_codes: Any  # np.ndarray: per-chunk index into doc_keys
+    k: int = 3
+
+    _doc_key_ids: Optional[Dict[str, int]] = PrivateAttr(default=None)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        mask = self.source_mask(sources)
+        return [self.docs[i] for i, _ in self.engine.top_k(tokenize(query), self.k, mask)]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        # CPU-bound scoring runs in a worker thread to keep the event loop free
+        return await asyncio.to_thread(self._get_relevant_documents, query, sources=sources)
+
+    def search_batch(self, queries: List[str], sources: Optional[List[str]] = None) -> List[List[Document]]:
+        """Top-k chunks for several queries at once (one list per query, in order)."""
+        mask = self.source_mask(sources)
+        return [[self.docs[i] for i, _ in hits]
+                for hits in self.engine.top_k_batch([tokenize(query) for query in queries], self.k, mask)]
+
+    def source_mask(self, sources: Optional[List[str]]) -> Optional[np.ndarray]:
+        """
+        Boolean mask over chunks whose doc_key is in sources.
+
+        Chunks without a doc_key (legacy indexes) are keyed by the basename of
+        their source path, which is what doc_key is.
+
+        Returns:
+            None when sources is None (no filtering)
+        """
+        if sources is None:
+            return None
+        if self._doc_key_ids is None:
+            self._doc_key_ids = {key: i for i, key in enumerate(self.doc_keys)}
+        wanted = [self._doc_key_ids[key] for key in sources if key in self._doc_key_ids]
+        return np.isin(self.doc_key_codes, np.asarray(wanted, dtype=np.int32))
@@ -0,0 +1,45 @@
+"""
+Stable, content-derived chunk IDs.
+
+Retrieval used to deduplicate with id(doc), but the same chunk comes back as
+a different Document object from BM25, from Milvus and from every multi-query
+variation, so duplicates reached the prompt. Every chunk now carries a
+"chunk_id" in metadata, derived from its document key and text: the same chunk
+gets the same ID on every re-ingestion and in every index.
+
+Key Components:
+- compute_chunk_id: ID for a (doc_key, text) pair
+- assign_chunk_ids: Tag chunks with their IDs at ingestion
+- get_chunk_id: ID of a retrieved chunk (computed for chunks ingested before IDs existed)
+- chunk_doc_key: Document key of a chunk
+"""
+
+import hashlib
+import os
+from typing import Iterable
+
+from langchain_core.documents import Document
+
+# Bump when the ID derivation changes (stored IDs then no longer match)
+CHUNK_ID_VERSION = 1
+
+
+def chunk_doc_key(doc: Document) -> str:
+    """doc_key metadata, or the basename of the source path for chunks that predate it."""
+    return doc.metadata.get("doc_key") or os.path.basename(doc.metadata.get("source", ""))
+
+
+def compute_chunk_id(doc_key: str, text: str) -> str:
+    """128-bit hex ID of a chunk: SHA-256 over its document key and text."""
+    return hashlib.sha256(f"{doc_key}\x00{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def assign_chunk_ids(docs: Iterable[Document]) -> None:
+    """Store each chunk's ID in metadata["chunk_id"] (call after doc_key is set)."""
+    for doc in docs:
+        doc.metadata["chunk_id"] = compute_chunk_id(chunk_doc_key(doc), doc.page_content)
+
+
+def get_chunk_id(doc: Document) -> str:
+    """Chunk ID from metadata, computed on the fly when the chunk was ingested without one."""
+    return doc.metadata.get("chunk_id") or compute_chunk_id(chunk_doc_key(doc), doc.page_content)
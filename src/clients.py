@@ -0,0 +1,338 @@
+"""
+Shared LLM and embedding clients.
+
+ChatOpenAI and TrackedOpenAIEmbeddings used to be constructed wherever they
+were needed (retrieval, generation, ingestion, evaluation), each with its own
+HTTP connection pool, so every new client paid TCP and TLS setup again. This
+registry hands out one client per configuration, all on a small number of
+process-wide pools:
+
+- "llm": every ChatOpenAI (query expansion, rewrites, answers, evaluation)
+- "embeddings": every TrackedOpenAIEmbeddings
+
+Pools keep connections alive and speak HTTP/2 when the h2 package is installed
+(concurrent requests are multiplexed over one connection), falling back to
+HTTP/1.1 otherwise. Each pool counts requests and newly opened connections, so
+connection_stats() shows how often a request reused a warm connection.
+
+Async connections belong to the event loop that opened them, while Streamlit
+reruns and asyncio.run() each start a new loop. The shared async clients are
+therefore backed by one connection pool per event loop (LoopLocalAsyncTransport);
+pools of closed loops are discarded.
+
+Key Components:
+- get_llm: Shared ChatOpenAI per (model, temperature)
+- get_embeddings: Shared TrackedOpenAIEmbeddings per model
+- get_http_client / get_async_http_client: Pooled httpx clients per pool
+- connection_stats: Requests, new connections and reuse rate per pool
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from src.tracked_embeddings import EMBEDDING_MAX_CONCURRENCY, TrackedOpenAIEmbeddings
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+LLM_MODEL = "openai/gpt-4o-mini"
+EMBEDDING_MODEL = "qwen/qwen3-embedding-8b"
+
+LLM_POOL = "llm"
+EMBEDDING_POOL = "embeddings"
+
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+
+# httpcore trace event emitted once per newly opened TCP connection
+_CONNECT_EVENT = "connection.connect_tcp.complete"
+
+_registry_lock = threading.Lock()
+_pool_stats: Dict[str, "PoolStats"] = {}
+_transports: Dict[Tuple[str, bool], httpx.BaseTransport] = {}
+_http_clients: Dict[Tuple[str, bool], Any] = {}
+_llms: Dict[Tuple[str, float], ChatOpenAI] = {}
+_embeddings: Dict[str, TrackedOpenAIEmbeddings] = {}
+_http2: Optional[bool] = None
+
+
+def _api_base() -> str:
+    return os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
+
+
+def _use_http2() -> bool:
+    """HTTP2_ENABLED, provided the h2 package is importable (checked once)."""
+    global _http2
+    if _http2 is None:
+        _http2 = HTTP2_ENABLED
+        if _http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1")
+                _http2 = False
+    return _http2
+
+
+class PoolStats:
+    """
+    Request and connection counters of one connection pool.
+
+    A request that did not open a TCP connection went over a pooled
+    keep-alive (or multiplexed HTTP/2) connection.
+
+    Thread-safe.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._requests = 0
+        self._connections = 0
+        self._http2_responses = 0
+        self._lock = threading.Lock()
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._requests += 1
+
+    def record_connection(self) -> None:
+        with self._lock:
+            self._connections += 1
+
+    def record_response(self, response: httpx.Response) -> None:
+        if response.extensions.get("http_version") == b"HTTP/2":
+            with self._lock:
+                self._http2_responses += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            reused = max(0, self._requests - self._connections)
+            return {
+                "requests": self._requests,
+                "connections": self._connections,
+                "reused": reused,
+                "reuse_rate": reused / self._requests if self._requests else 0.0,
+                "http2_responses": self._http2_responses,
+            }
+
+
+def _trace_hook(stats: PoolStats, previous: Optional[Callable]) -> Callable:
+    def trace(event: str, info: Dict[str, Any]) -> None:
+        if event == _CONNECT_EVENT:
+            stats.record_connection()
+        if previous is not None:
+            previous(event, info)
+    return trace
+
+
+def _async_trace_hook(stats: PoolStats, previous: Optional[Callable]) -> Callable:
+    async def trace(event: str, info: Dict[str, Any]) -> None:
+        if event == _CONNECT_EVENT:
+            stats.record_connection()
+        if previous is not None:
+            await previous(event, info)
+    return trace
+
+
+class CountingHTTPTransport(httpx.HTTPTransport):
+    """Pooled transport that reports requests and new connections to a PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.record_request()
+        request.extensions["trace"] = _trace_hook(self._stats, request.extensions.get("trace"))
+        response = super().handle_request(request)
+        self._stats.record_response(response)
+        return response
+
+
+class CountingAsyncHTTPTransport(httpx.AsyncHTTPTransport):
+    """Async counterpart of CountingHTTPTransport, feeding the same PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.record_request()
+        request.extensions["trace"] = _async_trace_hook(self._stats, request.extensions.get("trace"))
+        response = await super().handle_async_request(request)
+        self._stats.record_response(response)
+        return response
+
+
+class LoopLocalAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport with a separate connection pool per event loop.
+
+    httpx.AsyncClient itself can be shared across loops, but its pooled
+    connections cannot: using them from another loop fails or hangs. Each
+    loop gets its own CountingAsyncHTTPTransport (all feeding the pool's
+    PoolStats), created on first use in that loop.
+    """
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self._stats = stats
+        self._kwargs = kwargs
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, CountingAsyncHTTPTransport]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _for_running_loop(self) -> CountingAsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                # Connections of finished loops can never be used again
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = CountingAsyncHTTPTransport(self._stats, **self._kwargs)
+                self._transports[loop] = transport
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._for_running_loop().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Close the connections of the running loop's pool."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def _pool_limits(pool: str) -> httpx.Limits:
+    max_connections = HTTP_MAX_CONNECTIONS
+    if pool == EMBEDDING_POOL:
+        # Concurrent embedding batches must not queue behind each other for a connection
+        max_connections = max(max_connections, EMBEDDING_MAX_CONCURRENCY)
+    return httpx.Limits(max_connections=max_connections,
+                        max_keepalive_connections=min(HTTP_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS)
+
+
+def _get_transport(pool: str, is_async: bool) -> httpx.BaseTransport:
+    """The shared transport (connection pool) of a pool; callers hold _registry_lock."""
+    key = (pool, is_async)
+    if key not in _transports:
+        stats = _pool_stats.setdefault(pool, PoolStats(pool))
+        transport_class = LoopLocalAsyncTransport if is_async else CountingHTTPTransport
+        _transports[key] = transport_class(stats, http2=_use_http2(), limits=_pool_limits(pool))
+    return _transports[key]
+
+
+def get_http_client(pool: str = LLM_POOL) -> httpx.Client:
+    """
+    Shared httpx.Client on the pool's keep-alive connections.
+
+    Args:
+        pool: Pool name (LLM_POOL or EMBEDDING_POOL)
+
+    Returns:
+        The process-wide client of that pool
+    """
+    with _registry_lock:
+        key = (pool, False)
+        if key not in _http_clients:
+            _http_clients[key] = httpx.Client(transport=_get_transport(pool, False), timeout=HTTP_TIMEOUT_SECONDS)
+        return _http_clients[key]
+
+
+def get_async_http_client(pool: str = LLM_POOL) -> httpx.AsyncClient:
+    """
+    Shared httpx.AsyncClient on the pool's keep-alive connections.
+
+    Safe to use from any event loop: connections are pooled per loop.
+
+    Args:
+        pool: Pool name (LLM_POOL or EMBEDDING_POOL)
+
+    Returns:
+        The process-wide async client of that pool
+    """
+    with _registry_lock:
+        key = (pool, True)
+        if key not in _http_clients:
+            _http_clients[key] = httpx.AsyncClient(transport=_get_transport(pool, True),
+                                                   timeout=HTTP_TIMEOUT_SECONDS)
+        return _http_clients[key]
+
+
+def get_llm(temperature: float = 0.0, model: str = LLM_MODEL) -> ChatOpenAI:
+    """
+    Shared chat model client.
+
+    Instances are cached per (model, temperature); all of them send their
+    requests over the "llm" pool.
+
+    Args:
+        temperature: Sampling temperature
+        model: Model name on the OpenAI-compatible endpoint
+
+    Returns:
+        ChatOpenAI instance (safe to share across threads and sessions)
+    """
+    key = (model, float(temperature))
+    llm = _llms.get(key)
+    if llm is None:
+        http_client = get_http_client(LLM_POOL)
+        http_async_client = get_async_http_client(LLM_POOL)
+        with _registry_lock:
+            llm = _llms.get(key)
+            if llm is None:
+                llm = ChatOpenAI(
+                    model=model,
+                    temperature=temperature,
+                    base_url=_api_base(),
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                )
+                _llms[key] = llm
+    return llm
+
+
+def get_embeddings(model: str = EMBEDDING_MODEL) -> TrackedOpenAIEmbeddings:
+    """
+    Shared embedding client.
+
+    One instance per model, with the persistent embedding cache enabled and
+    requests sent over the "embeddings" pool.
+
+    Args:
+        model: Embedding model name
+
+    Returns:
+        TrackedOpenAIEmbeddings instance (safe to share across threads)
+    """
+    with _registry_lock:
+        embeddings = _embeddings.get(model)
+        if embeddings is None:
+            embeddings = TrackedOpenAIEmbeddings(
+                model=model,
+                base_url=_api_base(),
+                api_key=os.getenv("OPENAI_API_KEY"),
+                transport=_get_transport(EMBEDDING_POOL, False),
+                async_transport=_get_transport(EMBEDDING_POOL, True),
+            )
+            _embeddings[model] = embeddings
+        return embeddings
+
+
+def connection_stats() -> Dict[str, Dict[str, float]]:
+    """Requests, new connections, reused requests and reuse rate per pool (sync and async combined)."""
+    with _registry_lock:
+        return {name: stats.snapshot() for name, stats in _pool_stats.items()}
@@ -0,0 +1,164 @@
+"""
+Near-duplicate chunk elimination between chunking and embedding.
+
+Clinical guidelines repeat footers, disclaimers, table headers and other
+boilerplate on many pages. Embedding every copy wastes API spend and index
+space, and lets copies of the same text crowd out the top-k. This module
+collapses duplicates to their first occurrence and records where the other
+copies were in a provenance field.
+
+Two passes, selected with INGEST_DEDUP:
+- "exact" (default): SHA-256 of whitespace/case-normalized text
+- "near" (opt-in, adds to exact): MinHash signatures over word shingles,
+  bucketed with LSH banding and confirmed by estimated Jaccard similarity
+  >= DEDUP_THRESHOLD
+- "off": keep every chunk
+
+Near-duplicate collapsing is opt-in because in guidelines two long chunks that
+differ only in a dose, unit or threshold easily score above 0.9, and the
+second one's text would be dropped from the index.
+
+Key Components:
+- deduplicate_chunks: Collapse duplicate chunks of one document
+- chunk_page_numbers: Page numbers a Docling chunk was extracted from
+"""
+
+import hashlib
+import os
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEDUP_MODES = ("off", "exact", "near")
+# Earlier boolean values: "true" now means the safe exact-only pass
+_LEGACY_DEDUP_MODES = {"true": "exact", "false": "off"}
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "exact").lower()
+INGEST_DEDUP = _LEGACY_DEDUP_MODES.get(INGEST_DEDUP, INGEST_DEDUP)
+if INGEST_DEDUP not in DEDUP_MODES:
+    logger.warning(f"Unknown INGEST_DEDUP={INGEST_DEDUP!r} (expected one of {DEDUP_MODES}), using exact")
+    INGEST_DEDUP = "exact"
+# Estimated Jaccard similarity (over word shingles) above which two chunks are duplicates
+DEDUP_THRESHOLD = float(os.getenv("INGEST_DEDUP_THRESHOLD", "0.9"))
+
+# 128 permutations in 32 bands of 4 rows: pairs at Jaccard 0.9 collide in some
+# band with probability ~1.0, pairs at 0.5 still do ~87% of the time, so the
+# Jaccard check on candidates is what enforces the threshold
+NUM_PERM = 128
+NUM_BANDS = 32
+SHINGLE_WORDS = 3
+
+_MERSENNE_PRIME = np.uint64(4294967291)  # largest prime below 2**32
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, int(_MERSENNE_PRIME), size=(NUM_PERM, 1)).astype(np.uint64)
+_PERM_B = _rng.randint(0, int(_MERSENNE_PRIME), size=(NUM_PERM, 1)).astype(np.uint64)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def chunk_page_numbers(doc: Document) -> List[int]:
+    """Page numbers of the Docling items a chunk was built from."""
+    return [prov.get("page_no", 0)
+            for item in doc.metadata.get("dl_meta", {}).get("doc_items", [])
+            for prov in item.get("prov", [])]
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def _minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of a normalized text, or None if it is too short to shingle."""
+    words = text.split(" ")
+    if len(words) < SHINGLE_WORDS:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    # (a * h + b) mod p, kept below 2**64 by reducing the product first
+    return ((_PERM_A * hashes % _MERSENNE_PRIME + _PERM_B) % _MERSENNE_PRIME).min(axis=1)
+
+
+def _band_keys(signature: np.ndarray) -> List[Tuple[int, bytes]]:
+    rows = NUM_PERM // NUM_BANDS
+    return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(NUM_BANDS)]
+
+
+def deduplicate_chunks(docs: List[Document], threshold: Optional[float] = None,
+                       near: Optional[bool] = None) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Collapse exact (and optionally near-duplicate) chunks, keeping the first occurrence.
+
+    Every returned chunk gets a "provenance" metadata dict with the number of
+    duplicates folded into it and the pages of all copies, so a citation can
+    still point at every place the text appeared.
+
+    Run this per document: duplicates are only collapsed within the list passed
+    in, which keeps incremental deletes by doc_key exact.
+
+    Args:
+        docs: Chunks in document order
+        threshold: Min estimated Jaccard similarity for near-duplicates
+            (default: INGEST_DEDUP_THRESHOLD env var)
+        near: Also collapse near-duplicates (default: INGEST_DEDUP == "near")
+
+    Returns:
+        (kept chunks in original order, stats dict with exact/near duplicate counts)
+    """
+    threshold = DEDUP_THRESHOLD if threshold is None else threshold
+    near_pass = INGEST_DEDUP == "near" if near is None else near
+
+    kept: List[Document] = []
+    pages: List[List[int]] = []
+    duplicates: List[int] = []
+    signatures: List[Optional[np.ndarray]] = []
+    exact_index: Dict[str, int] = {}
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    exact = near = 0
+
+    for doc in docs:
+        normalized = _normalize(doc.page_content)
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+        match = exact_index.get(digest)
+        signature = None
+        if match is not None:
+            exact += 1
+        elif near_pass:
+            signature = _minhash(normalized)
+            if signature is not None:
+                candidates = {i for key in _band_keys(signature) for i in buckets.get(key, [])}
+                for i in sorted(candidates):
+                    if float(np.mean(signatures[i] == signature)) >= threshold:
+                        match = i
+                        near += 1
+                        break
+
+        if match is not None:
+            duplicates[match] += 1
+            pages[match].extend(chunk_page_numbers(doc))
+            continue
+
+        index = len(kept)
+        kept.append(doc)
+        pages.append(chunk_page_numbers(doc))
+        duplicates.append(0)
+        signatures.append(signature)
+        exact_index[digest] = index
+        if signature is not None:
+            for key in _band_keys(signature):
+                buckets.setdefault(key, []).append(index)
+
+    for doc, doc_pages, count in zip(kept, pages, duplicates):
+        doc.metadata["provenance"] = {"duplicates": count, "pages": sorted(set(doc_pages))}
+
+    if exact or near:
+        logger.debug(f"Collapsed {exact} exact and {near} near-duplicate chunks "
+                     f"({len(docs)} -> {len(kept)})")
+    return kept, {"exact_duplicates": exact, "near_duplicates": near}
@@ -0,0 +1,216 @@
+"""
+Persistent on-disk embedding cache.
+
+Embeddings are deterministic for a given (model, text), so re-ingesting the same
+chunks, re-running evaluation, or repeating a user query should not pay for
+another API round trip. This module stores vectors in a local SQLite database
+keyed by (model, SHA-256 of the text) and sits in front of the HTTP call in
+TrackedOpenAIEmbeddings.
+
+Key Components:
+- EmbeddingCache: SQLite-backed vector cache with LRU eviction and hit/miss counters
+- get_embedding_cache: Process-wide shared cache configured from environment
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Set EMBEDDING_CACHE_PATH to an empty string to disable the cache
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+# 4096-d float32 vectors are 16 KiB each, so 100k entries is ~1.6 GB on disk
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+# Hits only refresh last_access when it is older than this many seconds, so
+# repeated reads do not turn into SQLite write transactions
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "3600"))
+
+# SQLite caps the number of bound parameters per statement
+_SQLITE_BATCH = 500
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding cache with size-bounded LRU eviction.
+
+    Vectors are stored as packed float32 blobs. A hit refreshes the entry's
+    last-access time only when it is older than touch_interval, so LRU order is
+    coarse but most lookups stay read-only. When the cache grows past
+    max_entries the least recently used entries are evicted (down to 90% of the
+    bound, so eviction is batched). The size is counted in the database rather
+    than per process, since other processes insert into the same file.
+
+    Thread-safe: one connection guarded by a lock. WAL mode lets several
+    processes (app, evaluation, ingestion) share the same file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        touch_interval: float = EMBEDDING_CACHE_TOUCH_INTERVAL,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+
+    def _count(self) -> int:
+        """Number of rows in the shared cache file (caller holds the lock)."""
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached vectors for texts.
+
+        Args:
+            model: Embedding model id
+            texts: Texts to look up
+
+        Returns:
+            One entry per text: the cached vector, or None on a miss
+        """
+        hashes = [_text_hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        stale: List[str] = []
+        now = time.time()
+
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique), _SQLITE_BATCH):
+                batch = unique[i:i + _SQLITE_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector, last_access FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for text_hash, blob, last_access in rows:
+                    found[text_hash] = array("f", blob).tolist()
+                    if now - last_access >= self.touch_interval:
+                        stale.append(text_hash)
+
+            if stale:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in stale],
+                )
+                self._conn.commit()
+
+            results = [found.get(text_hash) for text_hash in hashes]
+            hits = sum(1 for vector in results if vector is not None)
+            self._hits += hits
+            self._misses += len(results) - hits
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store vectors for texts, evicting least recently used entries if over the bound."""
+        if not texts:
+            return
+
+        now = time.time()
+        rows = [(model, _text_hash(text), array("f", vector).tobytes(), now)
+                for text, vector in zip(texts, vectors)]
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+            if self._conn.total_changes > before:
+                # Counted inside the insert transaction, so rows added by other
+                # processes are included and the count cannot change underneath us
+                entries = self._count()
+                if entries > self.max_entries:
+                    self._evict(entries - int(self.max_entries * 0.9))
+
+            self._conn.commit()
+
+    def _evict(self, count: int) -> None:
+        """Delete the count least recently used entries (caller holds the lock)."""
+        self._conn.execute(
+            """
+            DELETE FROM embeddings WHERE rowid IN (
+                SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?
+            )
+            """,
+            (count,),
+        )
+        self._evictions += count
+        logger.debug(f"Evicted {count} least recently used embeddings from cache")
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": self._count(),
+                "evictions": self._evictions,
+            }
+
+    def clear(self) -> None:
+        """Remove every cached vector and reset counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._hits = self._misses = self._evictions = 0
+
+
+_shared_caches: Dict[str, EmbeddingCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Return the process-wide embedding cache, or None if disabled.
+
+    All TrackedOpenAIEmbeddings instances share one connection per cache file.
+    """
+    if not EMBEDDING_CACHE_PATH:
+        return None
+
+    with _shared_lock:
+        if EMBEDDING_CACHE_PATH not in _shared_caches:
+            try:
+                _shared_caches[EMBEDDING_CACHE_PATH] = EmbeddingCache(EMBEDDING_CACHE_PATH)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache disabled, could not open {EMBEDDING_CACHE_PATH}: {e}")
+                return None
+        return _shared_caches[EMBEDDING_CACHE_PATH]
@@ -5,22 +5,25 @@ Uses curated question-answer pairs with known ground truth for reliable measurem
 This approach is more reliable than synthetic evaluation (randomly generating questions
 from chunks), as it ensures questions are actually answerable and ground truth is accurate.
 """
-import os
+import argparse
+import time
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from src.logging_config import get_logger
 
 # Initialize logger early to ensure env vars are set
 logger = get_logger(__name__)
 
-from langchain_openai import ChatOpenAI
 from datasets import Dataset
 from ragas import evaluate
 from ragas.metrics import faithfulness, answer_relevancy, context_precision
 
 from src.retrieval import get_advanced_retriever, get_vectorstore
-from src.tracked_embeddings import TrackedOpenAIEmbeddings
+from src.chunk_ids import get_chunk_id
+from src.active_index import get_active_index
+from src.local_vectorstore import LocalVectorStore
+from src.clients import get_embeddings, get_llm
 from src.generation import get_rag_chain, format_docs
 from src.custom_metrics import (
     citation_accuracy,
@@ -110,6 +113,18 @@ EVAL_QUESTIONS = [
 ]
 
 
+# (prefix dimension, quantization) settings compared by evaluate_compact_index; 0 = full dimension
+COMPACT_INDEX_SETTINGS = [
+    (0, "none"),
+    (2048, "none"),
+    (1024, "none"),
+    (0, "int8"),
+    (1024, "int8"),
+    (0, "binary"),
+    (2048, "binary"),
+]
+
+
 def filter_placeholders(eval_set: List[Dict]) -> List[Dict]:
     """Remove placeholder questions from evaluation set."""
     return [q for q in eval_set if not q["question"].startswith("PLACEHOLDER")]
@@ -136,18 +151,8 @@ def run_evaluation(use_placeholders: bool = False):
     logger.info(f"Evaluating {len(eval_set)} curated questions...")
 
     # Initialize components
-    llm = ChatOpenAI(
-        model="openai/gpt-4o-mini",
-        temperature=0,
-        base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
-        api_key=os.getenv("OPENAI_API_KEY"),
-    )
-
-    embeddings = TrackedOpenAIEmbeddings(
-        model="qwen/qwen3-embedding-8b",
-        base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
-        api_key=os.getenv("OPENAI_API_KEY"),
-    )
+    llm = get_llm(temperature=0)
+    embeddings = get_embeddings()
 
     vectorstore = get_vectorstore()
 
@@ -333,10 +338,88 @@ def run_evaluation(use_placeholders: bool = False):
     return results_df
 
 
+def evaluate_compact_index(settings: Optional[List[Tuple[int, str]]] = None, k: int = 5,
+                           rescore_factor: Optional[int] = None,
+                           output_file: str = "compact_index_results.csv") -> Optional[pd.DataFrame]:
+    """
+    Compare compact first-pass settings of the local vector store on the evaluation questions.
+
+    For every (prefix dimension, quantization) setting, reports recall@k against
+    exact full-precision search, the source recall of the custom metrics,
+    mean search latency per question and the memory of the first-pass index.
+    The questions are embedded once, so only vector search is timed.
+
+    Args:
+        settings: (compact_dim, quantization) pairs (default: COMPACT_INDEX_SETTINGS)
+        k: Results per question
+        rescore_factor: Shortlist size per result (default: LOCAL_VECTOR_RESCORE_FACTOR)
+        output_file: CSV to write the comparison to
+
+    Returns:
+        One row per setting, or None if there is no local vector store
+    """
+    path = get_active_index().local_dir
+    if not LocalVectorStore.exists(path):
+        logger.error("No local vector store found. Run ingestion with VECTOR_BACKEND=local first.")
+        return None
+
+    eval_set = filter_placeholders(EVAL_QUESTIONS)
+    embeddings = get_embeddings()
+    query_vectors = embeddings.embed_documents([item["question"] for item in eval_set])
+
+    baseline = LocalVectorStore(embeddings, path=path, compact_dim=0, quantization="none")
+    exact_ids = [[get_chunk_id(doc) for doc in docs] for docs in baseline.search_batch(query_vectors, k)]
+
+    rows = []
+    for compact_dim, quantization in settings or COMPACT_INDEX_SETTINGS:
+        store = LocalVectorStore(embeddings, path=path, compact_dim=compact_dim, quantization=quantization,
+                                 rescore_factor=rescore_factor)
+        build_start = time.perf_counter()
+        store.search_batch(query_vectors[:1], k)  # builds the compact index
+        build_time = time.perf_counter() - build_start
+
+        latencies, recalls, source_recalls = [], [], []
+        for vector, expected, item in zip(query_vectors, exact_ids, eval_set):
+            start = time.perf_counter()
+            docs = store.search_batch([vector], k)[0]
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(set(expected) & {get_chunk_id(doc) for doc in docs}) / max(len(expected), 1))
+            source_recalls.append(retrieval_recall(docs, item["expected_source"]))
+
+        usage = store.memory_usage()
+        rows.append({
+            "compact_dim": compact_dim or "full",
+            "quantization": quantization,
+            "rescore_factor": store.rescore_factor,
+            f"recall_at_{k}": sum(recalls) / len(recalls),
+            "source_recall": sum(source_recalls) / len(source_recalls),
+            "mean_latency_ms": 1000 * sum(latencies) / len(latencies),
+            "first_pass_mib": (usage["compact_bytes"] or usage["full_precision_bytes"]) / 2**20,
+            "full_precision_mib": usage["full_precision_bytes"] / 2**20,
+            "build_s": build_time,
+        })
+
+    results_df = pd.DataFrame(rows)
+    results_df.to_csv(output_file, index=False)
+    logger.info(f"Compact index comparison ({len(eval_set)} questions, {usage['rows']} chunks, k={k}):")
+    logger.info(f"\n{results_df.round(3).to_string(index=False)}")
+    logger.info(f"Results saved to {output_file}")
+    return results_df
+
+
 if __name__ == "__main__":
     from src.logging_config import setup_logging
     setup_logging()
 
-    # By default, skip placeholder questions
-    # Set use_placeholders=True to include them (they will likely fail)
-    results = run_evaluation(use_placeholders=False)
+    parser = argparse.ArgumentParser(description="Evaluate the RAG system on the curated question set")
+    parser.add_argument("--compact-index", action="store_true",
+                        help="Compare compact first-pass settings of the local vector store instead")
+    parser.add_argument("--rescore-factor", type=int, default=None, help="Shortlist size per result")
+    args = parser.parse_args()
+
+    if args.compact_index:
+        evaluate_compact_index(rescore_factor=args.rescore_factor)
+    else:
+        # By default, skip placeholder questions
+        # Set use_placeholders=True to include them (they will likely fail)
+        results = run_evaluation(use_placeholders=False)
@@ -1,13 +1,42 @@
+import hashlib
 import os
-from typing import List, Dict
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.documents import Document
 from dotenv import load_dotenv
+from src.clients import get_llm
+from src.query_cache import TTLCache, normalize_query
+from src.logging_config import get_logger
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
+# Rewrite gate (local heuristic deciding whether a follow-up needs the LLM rewrite)
+REWRITE_GATE = os.getenv("REWRITE_GATE", "true").lower() == "true"
+REWRITE_MIN_STANDALONE_WORDS = int(os.getenv("REWRITE_MIN_STANDALONE_WORDS", "4"))
+# Rewrites keyed by (recent history hash, normalized question); 0 disables the cache
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "256"))
+
+_WORD = re.compile(r"\w+")
+_REFERENCE = re.compile(
+    r"\b(it|its|itself|they|them|their|theirs|this|that|these|those|he|him|his|she|her|hers|"
+    r"one|ones|former|latter|above|same|previous|previously|mentioned|earlier|aforementioned|"
+    r"such|there|then|else|other|others|another|instead)\b",
+    re.IGNORECASE,
+)
+_ELLIPTICAL_START = re.compile(r"\s*(and|but|or|also|so|what about|how about|why|why not|and what|any)\b", re.IGNORECASE)
+
+rewrite_cache = TTLCache(REWRITE_CACHE_SIZE)
+_rewrite_stats_lock = threading.Lock()
+_rewrite_counts = {"no_history": 0, "skipped": 0, "cached": 0, "llm": 0, "time_saved": 0.0}
+_llm_latency: Optional[float] = None
+
 SYSTEM_PROMPT = """You are a careful assistant for oncology clinical trial recruiting.
 
 Use ONLY the provided context to answer the question.
@@ -33,20 +62,69 @@ Follow-up Question: {question}
 
 Rewritten Standalone Question:"""
 
-def rewrite_query_with_history(question: str, chat_history: List[Dict[str, str]]) -> str:
+@dataclass
+class QueryRewrite:
+    """Outcome of rewrite_query(): the query to retrieve with and how it was obtained."""
+
+    query: str
+    source: str  # "no_history", "skipped" (gate), "cached" or "llm"
+    elapsed: float = 0.0  # Seconds spent
+    saved: float = 0.0  # Estimated seconds saved versus an LLM rewrite
+
+
+def needs_rewrite(question: str) -> bool:
     """
-    Rewrite a question to be standalone using conversation history.
+    Rewrite gate: whether a question may depend on the conversation.
+
+    Cheap local heuristic, biased towards rewriting: questions with pronouns or
+    other references back ("it", "those", "the same", "mentioned"...),
+    elliptical openings ("what about", "and ...") or very few words are
+    rewritten; anything else is treated as standalone.
+    """
+    text = question.strip()
+    return (len(_WORD.findall(text)) < REWRITE_MIN_STANDALONE_WORDS
+            or bool(_REFERENCE.search(text)) or bool(_ELLIPTICAL_START.match(text)))
+
+
+def _record_rewrite(rewrite: QueryRewrite) -> QueryRewrite:
+    global _llm_latency
+    with _rewrite_stats_lock:
+        if rewrite.source == "llm":
+            # Moving average of LLM rewrite latency, the basis of the savings estimate
+            _llm_latency = rewrite.elapsed if _llm_latency is None else 0.8 * _llm_latency + 0.2 * rewrite.elapsed
+        elif rewrite.source != "no_history":
+            rewrite.saved = max(0.0, (_llm_latency or 0.0) - rewrite.elapsed)
+        _rewrite_counts[rewrite.source] += 1
+        _rewrite_counts["time_saved"] += rewrite.saved
+    return rewrite
+
+
+def rewrite_stats() -> Dict[str, float]:
+    """Rewrites by source, rewrite cache metrics and estimated time saved by the gate and cache."""
+    with _rewrite_stats_lock:
+        return {**_rewrite_counts, "llm_latency": _llm_latency or 0.0, "cache": rewrite_cache.stats()}
+
+
+def rewrite_query(question: str, chat_history: List[Dict[str, str]]) -> QueryRewrite:
+    """
+    Rewrite a question to be standalone using conversation history, when needed.
+
+    Questions without history are returned as-is; standalone-looking questions
+    skip the LLM (see needs_rewrite; REWRITE_GATE=false disables the gate);
+    repeated (recent history, question) pairs are served from a bounded cache.
 
     Args:
         question: The current user question
         chat_history: List of previous messages [{"role": "user"/"assistant", "content": "..."}]
 
     Returns:
-        Rewritten standalone question suitable for retrieval
+        QueryRewrite with the standalone question and how it was obtained
     """
+    start = time.perf_counter()
+
     # If no history or very first question, return as-is
     if not chat_history or len(chat_history) == 0:
-        return question
+        return _record_rewrite(QueryRewrite(question, "no_history"))
 
     # Format recent history (last 3 exchanges = 6 messages max)
     recent_history = chat_history[-6:] if len(chat_history) > 6 else chat_history
@@ -57,18 +135,23 @@ def rewrite_query_with_history(question: str, chat_history: List[Dict[str, str]]
 
     # If history is empty after formatting, return original
     if not history_text.strip():
-        return question
-
-    # Create LLM for query rewriting
-    llm = ChatOpenAI(
-        model="openai/gpt-4o-mini",
-        temperature=0,
-        base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
-        api_key=os.getenv("OPENAI_API_KEY"),
-    )
+        return _record_rewrite(QueryRewrite(question, "no_history"))
+
+    if REWRITE_GATE and not needs_rewrite(question):
+        rewrite = _record_rewrite(QueryRewrite(question, "skipped", time.perf_counter() - start))
+        logger.info(f"Query rewrite skipped by gate (saved ~{rewrite.saved:.3f}s)")
+        return rewrite
+
+    history_hash = hashlib.sha256(history_text.encode("utf-8")).hexdigest()
+    cache_key = (history_hash, normalize_query(question))
+    cached = rewrite_cache.get(cache_key)
+    if cached is not None:
+        rewrite = _record_rewrite(QueryRewrite(cached, "cached", time.perf_counter() - start))
+        logger.info(f"Query rewrite served from cache (saved ~{rewrite.saved:.3f}s)")
+        return rewrite
 
     prompt = ChatPromptTemplate.from_template(QUERY_REWRITE_PROMPT)
-    chain = prompt | llm
+    chain = prompt | get_llm(temperature=0)
 
     response = chain.invoke({
         "history": history_text,
@@ -76,7 +159,24 @@ def rewrite_query_with_history(question: str, chat_history: List[Dict[str, str]]
     })
 
     rewritten = response.content.strip()
-    return rewritten
+    rewrite_cache.put(cache_key, rewritten)
+    rewrite = _record_rewrite(QueryRewrite(rewritten, "llm", time.perf_counter() - start))
+    logger.info(f"Query rewrite completed in {rewrite.elapsed:.3f}s")
+    return rewrite
+
+
+def rewrite_query_with_history(question: str, chat_history: List[Dict[str, str]]) -> str:
+    """
+    Rewrite a question to be standalone using conversation history.
+
+    Args:
+        question: The current user question
+        chat_history: List of previous messages [{"role": "user"/"assistant", "content": "..."}]
+
+    Returns:
+        Rewritten standalone question suitable for retrieval
+    """
+    return rewrite_query(question, chat_history).query
 
 
 def format_docs(docs: List[Document]) -> str:
@@ -114,12 +214,7 @@ def get_rag_chain():
     - Include conversation history for contextual responses
     - Handle follow-up questions that reference previous exchanges
     """
-    llm = ChatOpenAI(
-        model="openai/gpt-4o-mini",
-        temperature=0,
-        base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
-        api_key=os.getenv("OPENAI_API_KEY"),
-    )
+    llm = get_llm(temperature=0)
 
     # Create prompt template that includes conversation history
     # Note: history is optional and will be empty string if not provided
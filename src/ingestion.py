@@ -1,11 +1,34 @@
 import os
-from langchain_docling import DoclingLoader
-from langchain_docling.loader import ExportType
+import json
+import hashlib
+import time
+import multiprocessing
+import queue
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import pymupdf
 from docling.chunking import HybridChunker
+from docling.datamodel.accelerator_options import AcceleratorOptions
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.pipeline_options import PdfPipelineOptions
+from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling_core.transforms.chunker.tokenizer.huggingface import HuggingFaceTokenizer
+from langchain_core.documents import Document
 from langchain_milvus import Milvus
+from pymilvus import MilvusClient
 from dotenv import load_dotenv
-from src.tracked_embeddings import TrackedOpenAIEmbeddings
+from src.clients import EMBEDDING_MODEL, get_embeddings
+from src.active_index import IndexLocation, activate_index, get_active_index, next_index
+from src.bm25_index import BM25Index
+from src.chunk_ids import CHUNK_ID_VERSION, assign_chunk_ids
+from src.local_vectorstore import VECTOR_BACKEND, LocalVectorStore
+from src.dedup import DEDUP_THRESHOLD, INGEST_DEDUP, chunk_page_numbers, deduplicate_chunks
+from src.query_cache import bump_index_version
+from src.parse_cache import PARSE_CACHE_DIR, load_parsed_document, save_parsed_document
 from src.logging_config import get_logger
 
 load_dotenv()
@@ -15,98 +38,1030 @@ logger = get_logger(__name__)
 # Configuration
 EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
 DEFAULT_MAX_TOKENS = 400  # Increased from 200 to reduce boundary-splitting issues
+MERGE_PEERS = True
 MILVUS_URI = "./milvus_vectorstore.db"
+MANIFEST_PATH = "./ingest_manifest.json"
+# Number of processes used to parse PDFs (1 = parse in-process, one file at a time)
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", "1"))
+# PDFs with at least this many pages are split into page-range shards parsed concurrently
+SHARD_MIN_PAGES = int(os.getenv("INGEST_SHARD_MIN_PAGES", "100"))
+SHARD_PAGES = int(os.getenv("INGEST_SHARD_PAGES", "50"))
+# Streaming pipeline (parse → embed → insert overlap with bounded queues)
+INGEST_STREAMING = os.getenv("INGEST_STREAMING", "false").lower() == "true"
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "2"))
 
+# What the vector store helpers return, depending on VECTOR_BACKEND
+VectorStoreBackend = Union[Milvus, LocalVectorStore]
 
-def load_pdfs(data_dir: str = "./data"):
+# Per-process Docling state, built once per worker by _init_parse_worker()
+_worker_converter = None
+_worker_chunker = None
+
+
+def list_pdf_files(data_dir: str = "./data") -> List[str]:
+    """Return sorted paths of all PDF files in data_dir (empty if it does not exist)."""
+    if not os.path.exists(data_dir):
+        logger.error(f"Data directory does not exist: {data_dir}")
+        return []
+
+    return sorted(os.path.join(data_dir, f) for f in os.listdir(data_dir)
+                  if f.lower().endswith(".pdf"))
+
+
+def get_doc_key(file_path: str) -> str:
     """
-    Load and chunk PDFs using DoclingLoader with HybridChunker.
+    Stable document key for a source file.
+
+    The key is the file's basename, which is what the app shows and filters on.
+    Every chunk carries it in metadata so a file's chunks can be deleted together.
+    """
+    return os.path.basename(file_path)
+
+
+def compute_file_hash(file_path: str) -> str:
+    """Compute the SHA-256 content hash of a file, streaming it in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    Uses tokenization-aware chunking that respects document structure,
-    token limits, and semantic boundaries for optimal retrieval performance.
+
+def get_chunking_config() -> Dict[str, Any]:
+    """
+    Settings that determine chunk boundaries and vectors.
+
+    Any change here invalidates every previously ingested chunk, so incremental
+    ingestion falls back to a full rebuild when the stored config differs.
+    """
+    return {
+        "tokenizer_model": EMBED_MODEL_ID,
+        "max_tokens": DEFAULT_MAX_TOKENS,
+        "merge_peers": MERGE_PEERS,
+        "embedding_model": EMBEDDING_MODEL,
+        # Chunk metadata schema (chunk_id); older collections lack the field
+        "chunk_id_version": CHUNK_ID_VERSION,
+        # Dedup decides which chunks are stored and adds the provenance field
+        "dedup": INGEST_DEDUP,
+        "dedup_threshold": DEDUP_THRESHOLD if INGEST_DEDUP == "near" else None,
+    }
+
+
+def load_manifest() -> Optional[Dict[str, Any]]:
+    """Load the ingestion manifest, or None if it is missing or unreadable."""
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable ingestion manifest {MANIFEST_PATH}: {e}")
+        return None
+
+
+def save_manifest(manifest: Dict[str, Any]) -> None:
+    """Atomically write the ingestion manifest (write to temp file, then rename)."""
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def plan_incremental_ingest(
+    pdf_files: List[str], manifest: Dict[str, Any], file_hashes: Dict[str, str]
+) -> Tuple[List[str], List[str]]:
+    """
+    Diff the files on disk against the manifest.
 
     Args:
-        data_dir: Directory containing PDF files
+        pdf_files: PDF paths currently in the data directory
+        manifest: Previously saved manifest
+        file_hashes: Content hash per doc key for the files on disk
 
     Returns:
-        List of pre-chunked Document objects with dl_meta
+        (files to parse and insert, doc keys whose chunks must be deleted).
+        Changed files appear in both lists: old chunks out, new chunks in.
     """
-    # Find all PDFs in the data directory
-    if not os.path.exists(data_dir):
-        logger.error(f"Data directory does not exist: {data_dir}")
-        return []
+    indexed = manifest.get("files", {})
 
-    pdf_files = [os.path.join(data_dir, f) for f in os.listdir(data_dir)
-                 if f.lower().endswith(".pdf")]
+    to_ingest = [path for path in pdf_files
+                 if indexed.get(get_doc_key(path), {}).get("sha256") != file_hashes[get_doc_key(path)]]
 
-    if not pdf_files:
-        logger.warning("No PDF files found in data directory")
-        return []
+    changed_keys = {get_doc_key(path) for path in to_ingest}
+    to_remove = sorted(key for key in indexed
+                       if key not in file_hashes or key in changed_keys)
 
-    logger.info(f"Processing {len(pdf_files)} PDF files with Docling")
+    return to_ingest, to_remove
 
-    # Configure HybridChunker with tokenizer
+
+def _build_chunker() -> HybridChunker:
+    """Configure HybridChunker with the tokenizer matching our chunk budget."""
     tokenizer = HuggingFaceTokenizer.from_pretrained(
         model_name=EMBED_MODEL_ID,
         max_tokens=DEFAULT_MAX_TOKENS
     )
+    return HybridChunker(
+        tokenizer=tokenizer,
+        merge_peers=MERGE_PEERS  # Merge undersized chunks with same metadata
+    )
 
-    # Load with DoclingLoader - handles both parsing AND chunking
-    loader = DoclingLoader(
-        file_path=pdf_files,
-        export_type=ExportType.DOC_CHUNKS,  # Returns pre-chunked documents
-        chunker=HybridChunker(
-            tokenizer=tokenizer,
-            merge_peers=True  # Merge undersized chunks with same metadata
-        )
+
+def _init_parse_worker(num_threads: int = 4) -> None:
+    """
+    Build the Docling converter and chunker once for this process.
+
+    Runs as the ProcessPoolExecutor initializer so every worker loads the layout
+    models and tokenizer a single time instead of once per file.
+
+    Args:
+        num_threads: Torch/OpenMP threads per worker (avoid oversubscribing cores)
+    """
+    global _worker_converter, _worker_chunker
+    pipeline_options = PdfPipelineOptions(
+        accelerator_options=AcceleratorOptions(num_threads=num_threads)
+    )
+    _worker_converter = DocumentConverter(
+        format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
     )
+    _worker_chunker = _build_chunker()
+
+
+def _parse_pdf(file_path: str, page_range: Optional[Tuple[int, int]] = None,
+               file_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Parse and chunk a single PDF (or a page-range shard of it) with the
+    process-local converter and chunker.
+
+    If the Docling parse cache holds this file (by content hash), the cached
+    DoclingDocument is loaded and only the chunker runs.
+
+    Never raises: a failure is returned in the "error" field so one corrupt PDF
+    does not kill the whole batch.
+
+    Args:
+        file_path: PDF to parse
+        page_range: 1-based inclusive (first, last) pages to parse, None for all
+        file_hash: Content hash of the PDF, used as the parse cache key
+
+    Returns:
+        Dict with file_path, page_range, docs, num_pages, parse_time, chunk_time,
+        cached and error
+    """
+    if _worker_converter is None:
+        _init_parse_worker()
+
+    result = {"file_path": file_path, "page_range": page_range, "docs": [], "num_pages": 0,
+              "parse_time": 0.0, "chunk_time": 0.0, "cached": False, "error": None}
+    try:
+        parse_start = time.perf_counter()
+        dl_doc = load_parsed_document(file_hash, page_range)
+        if dl_doc is not None:
+            result["cached"] = True
+        else:
+            convert_kwargs = {"page_range": page_range} if page_range else {}
+            dl_doc = _worker_converter.convert(source=file_path, **convert_kwargs).document
+            save_parsed_document(dl_doc, file_hash, page_range)
+        result["parse_time"] = time.perf_counter() - parse_start
+        result["num_pages"] = dl_doc.num_pages()
+
+        # Same page_content/metadata layout as DoclingLoader(export_type=DOC_CHUNKS)
+        chunk_start = time.perf_counter()
+        result["docs"] = [
+            Document(
+                page_content=_worker_chunker.contextualize(chunk=chunk),
+                metadata={"source": file_path, "dl_meta": chunk.meta.export_json_dict()},
+            )
+            for chunk in _worker_chunker.chunk(dl_doc)
+        ]
+        result["chunk_time"] = time.perf_counter() - chunk_start
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _count_pages(file_path: str) -> int:
+    """Cheap page count without layout analysis (0 if the file cannot be opened)."""
+    try:
+        with pymupdf.open(file_path) as pdf:
+            return pdf.page_count
+    except Exception:
+        # Let the Docling worker report the real parse error
+        return 0
+
+
+def _plan_parse_tasks(pdf_files: List[str], shard: bool) -> List[Tuple[str, Optional[Tuple[int, int]]]]:
+    """
+    Turn files into parse tasks, splitting large PDFs into page-range shards.
+
+    Shards of a file are emitted consecutively and in page order, which
+    _merge_shard_results relies on.
+    """
+    tasks = []
+    for path in pdf_files:
+        num_pages = _count_pages(path) if shard else 0
+        if num_pages < max(SHARD_MIN_PAGES, 1) or num_pages <= SHARD_PAGES:
+            tasks.append((path, None))
+            continue
+        for first in range(1, num_pages + 1, SHARD_PAGES):
+            tasks.append((path, (first, min(first + SHARD_PAGES - 1, num_pages))))
+        logger.debug(f"Sharding {path} ({num_pages} pages) into {-(-num_pages // SHARD_PAGES)} page ranges")
+    return tasks
+
+
+def _stitch_shard(docs: List[Document], first_page: int, carried_headings: List[str]) -> List[str]:
+    """
+    Restore document-level context on the chunks of one shard (mutates docs).
+
+    - Page provenance: if the shard was numbered from page 1, shift it so
+      dl_meta page numbers refer to the page in the full PDF.
+    - Heading context: chunks at the top of a shard that precede its first
+      heading belong to the last section of the previous shard, so they inherit
+      those headings (in dl_meta and in the contextualized page_content).
+
+    Returns:
+        Headings to carry into the next shard
+    """
+    page_numbers = [page for doc in docs for page in chunk_page_numbers(doc)]
+    if first_page > 1 and page_numbers and max(page_numbers) < first_page:
+        offset = first_page - 1
+        for doc in docs:
+            for item in doc.metadata.get("dl_meta", {}).get("doc_items", []):
+                for prov in item.get("prov", []):
+                    prov["page_no"] = prov.get("page_no", 0) + offset
+
+    for doc in docs:
+        dl_meta = doc.metadata.setdefault("dl_meta", {})
+        if dl_meta.get("headings"):
+            break
+        if carried_headings:
+            dl_meta["headings"] = list(carried_headings)
+            # Mirror HybridChunker.contextualize(): headings, then the chunk text
+            doc.page_content = "\n".join(carried_headings + [doc.page_content])
+
+    for doc in reversed(docs):
+        headings = doc.metadata.get("dl_meta", {}).get("headings")
+        if headings:
+            return headings
+    return carried_headings
+
+
+def _iter_merged_results(results: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Stitch consecutive shard results of the same file into one per-file result.
+
+    Consumes results lazily and yields each file as soon as its last shard has
+    arrived. A file with any failed shard is reported as failed as a whole, so
+    it is never half-indexed.
+    """
+    current = None
+    headings: List[str] = []
+    for result in results:
+        if current is not None and current["file_path"] == result["file_path"] and result["page_range"] is not None:
+            current["shards"] += 1
+            current["cached"] = current.get("cached", False) and result.get("cached", False)
+            current["num_pages"] += result["num_pages"]
+            current["parse_time"] += result["parse_time"]
+            current["chunk_time"] += result["chunk_time"]
+            if result["error"] or current["error"]:
+                current["error"] = current["error"] or f"pages {result['page_range']}: {result['error']}"
+                current["docs"] = []
+                continue
+            headings = _stitch_shard(result["docs"], result["page_range"][0], headings)
+            current["docs"].extend(result["docs"])
+            continue
+
+        if current is not None:
+            yield current
+        current = {**result, "docs": list(result["docs"]), "shards": 1}
+        headings = _stitch_shard(current["docs"], 1, [])
+
+    if current is not None:
+        yield current
+
+
+def _merge_shard_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """List form of _iter_merged_results()."""
+    return list(_iter_merged_results(results))
+
+
+def _iter_task_results(tasks: List[Tuple[str, Optional[Tuple[int, int]]]], workers: int,
+                       file_hashes: Optional[Dict[str, str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Run parse tasks and yield their results in task order.
+
+    With a pool, at most 2 * workers tasks are in flight, so finished results
+    never pile up in memory faster than the consumer takes them.
+    """
+    file_hashes = file_hashes or {}
+    if workers == 1:
+        for path, page_range in tasks:
+            yield _parse_pdf(path, page_range, file_hashes.get(path))
+        return
+
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    # spawn: forking a process that may already hold torch/OpenMP threads can deadlock
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_parse_worker,
+        initargs=(threads_per_worker,),
+    ) as executor:
+        pending = deque()
+        remaining = iter(tasks)
+        for path, page_range in islice(remaining, 2 * workers):
+            pending.append(executor.submit(_parse_pdf, path, page_range, file_hashes.get(path)))
+        while pending:
+            result = pending.popleft().result()
+            for path, page_range in islice(remaining, 1):
+                pending.append(executor.submit(_parse_pdf, path, page_range, file_hashes.get(path)))
+            yield result
+
+
+def iter_parsed_pdfs(pdf_files: List[str], max_workers: Optional[int] = None,
+                     stats: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Parse and chunk PDFs lazily, yielding one result per file in input order.
+
+    With more than one worker, files are fanned out to a process pool, and PDFs
+    of at least INGEST_SHARD_MIN_PAGES pages are split into INGEST_SHARD_PAGES-page
+    shards so a single huge guideline is parsed by several workers at once;
+    shards are stitched back together with correct page provenance and heading
+    context. Failures are logged and yielded with an "error" and no docs, so
+    one corrupt PDF does not stop the batch. Files already in the Docling parse
+    cache (same content hash and Docling version) skip layout analysis.
+
+    Unless INGEST_DEDUP is off, repeated boilerplate (footers, disclaimers,
+    table headers) is collapsed per file before the chunks reach embedding:
+    exact copies by default, near-duplicates too with INGEST_DEDUP=near.
+
+    Args:
+        pdf_files: PDF paths to parse
+        max_workers: Worker processes (default: INGEST_PARSE_WORKERS, 1 = in-process)
+        stats: Optional dict filled with pages/s, failures etc. once the iterator is exhausted
+
+    Yields:
+        Per-file dicts with file_path, docs (tagged with doc_key), num_pages and error
+    """
+    workers = max(1, max_workers or PARSE_WORKERS)
+    tasks = _plan_parse_tasks(pdf_files, shard=workers > 1)
+    workers = max(1, min(workers, len(tasks)))
+    start = time.perf_counter()
+    file_hashes = ({path: compute_file_hash(path) for path in pdf_files if os.path.exists(path)}
+                   if PARSE_CACHE_DIR else {})
+
+    failed = []
+    pages = chunks = cache_hits = duplicates = 0
+    parse_time = chunk_time = 0.0
+    for result in _iter_merged_results(_iter_task_results(tasks, workers, file_hashes)):
+        parse_time += result["parse_time"]
+        chunk_time += result["chunk_time"]
+        cache_hits += bool(result.get("cached"))
+        if result["error"]:
+            logger.error(f"Failed to parse {result['file_path']}: {result['error']}")
+            failed.append({"file_path": result["file_path"], "error": result["error"]})
+        else:
+            pages += result["num_pages"]
+            if INGEST_DEDUP != "off":
+                before = len(result["docs"])
+                result["docs"], _ = deduplicate_chunks(result["docs"])
+                duplicates += before - len(result["docs"])
+            chunks += len(result["docs"])
+            # Tag every chunk with its file's stable key (used for incremental deletes)
+            # and its content-derived chunk_id (used to deduplicate at retrieval)
+            for doc in result["docs"]:
+                doc.metadata["doc_key"] = get_doc_key(doc.metadata.get("source", ""))
+            assign_chunk_ids(result["docs"])
+        yield result
+
+    elapsed = time.perf_counter() - start
+    pages_per_second = pages / elapsed if elapsed > 0 else 0.0
+    logger.info(f"Parsed {len(pdf_files) - len(failed)}/{len(pdf_files)} PDFs ({pages} pages, {len(tasks)} tasks, "
+                f"{cache_hits} from parse cache) in {elapsed:.3f}s with {workers} workers: {pages_per_second:.2f} pages/s")
+    if duplicates:
+        logger.info(f"Dropped {duplicates} duplicate chunks ({chunks} unique chunks kept)")
+
+    if stats is not None:
+        stats.update({
+            "files": len(pdf_files),
+            "tasks": len(tasks),
+            "failed": failed,
+            "pages": pages,
+            "chunks": chunks,
+            "cache_hits": cache_hits,
+            "duplicates_removed": duplicates,
+            "workers": workers,
+            "wall_time": elapsed,
+            "parse_time": parse_time,
+            "chunk_time": chunk_time,
+            "pages_per_second": pages_per_second,
+        })
+
+
+def parse_pdfs(pdf_files: List[str], max_workers: Optional[int] = None) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Parse and chunk PDFs into one list (see iter_parsed_pdfs for the details).
+
+    Args:
+        pdf_files: PDF paths to parse
+        max_workers: Worker processes (default: INGEST_PARSE_WORKERS, 1 = in-process)
+
+    Returns:
+        (chunks with doc_key metadata, stats dict with pages/s and failures)
+    """
+    stats: Dict[str, Any] = {}
+    docs = [doc for result in iter_parsed_pdfs(pdf_files, max_workers, stats) for doc in result["docs"]]
+    return docs, stats
+
+
+def load_pdfs(data_dir: str = "./data", file_paths: Optional[List[str]] = None,
+              max_workers: Optional[int] = None):
+    """
+    Load and chunk PDFs using Docling's DocumentConverter with HybridChunker.
+
+    Uses tokenization-aware chunking that respects document structure,
+    token limits, and semantic boundaries for optimal retrieval performance.
+
+    Args:
+        data_dir: Directory containing PDF files
+        file_paths: Explicit subset of PDFs to load (default: every PDF in data_dir)
+        max_workers: Parse worker processes (default: INGEST_PARSE_WORKERS env var)
+
+    Returns:
+        List of pre-chunked Document objects with dl_meta and doc_key
+    """
+    pdf_files = file_paths if file_paths is not None else list_pdf_files(data_dir)
+
+    if not pdf_files:
+        logger.warning("No PDF files found in data directory")
+        return []
+
+    logger.info(f"Processing {len(pdf_files)} PDF files with Docling")
+
+    docs, _ = parse_pdfs(pdf_files, max_workers=max_workers)
 
-    docs = loader.load()
     logger.info(f"Successfully loaded {len(docs)} chunks from {len(pdf_files)} PDF files")
     return docs
 
 
+def build_vectorstore(splits, location: Optional[IndexLocation] = None) -> VectorStoreBackend:
+    """
+    Build the vectorstore (Milvus, or the local backend when VECTOR_BACKEND=local) from document splits.
 
+    Args:
+        splits: Chunks to embed and insert
+        location: Index generation to (re)create; pass a staging location
+            (next_index()), never the one queries are served from
+            (default: the active generation)
+    """
+    location = location or get_active_index()
+    embeddings = get_embeddings(EMBEDDING_MODEL)
 
-def build_vectorstore(splits):
-    """Build Milvus vectorstore from document splits."""
-    embeddings = TrackedOpenAIEmbeddings(
-        model="qwen/qwen3-embedding-8b",
-        base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
-        api_key=os.getenv("OPENAI_API_KEY"),
-    )
+    if VECTOR_BACKEND == "local":
+        return LocalVectorStore.from_documents(documents=splits, embedding=embeddings,
+                                               path=location.local_dir, drop_old=True)
 
     vectorstore = Milvus.from_documents(
         documents=splits,
         embedding=embeddings,
         connection_args={"uri": MILVUS_URI},
+        collection_name=location.collection,
         drop_old=True,  # Drop old collection if exists
         auto_id=True
     )
     return vectorstore
 
 
-def ingest_docs():
+def _open_vectorstore(drop_old: bool = False, location: Optional[IndexLocation] = None) -> VectorStoreBackend:
+    """Connect to the Milvus collection, or open the local store (both created lazily on first insert)."""
+    location = location or get_active_index()
+    if VECTOR_BACKEND == "local":
+        return LocalVectorStore(embedding_function=get_embeddings(EMBEDDING_MODEL), path=location.local_dir,
+                                drop_old=drop_old)
+    return Milvus(
+        embedding_function=get_embeddings(EMBEDDING_MODEL),
+        connection_args={"uri": MILVUS_URI},
+        collection_name=location.collection,
+        drop_old=drop_old,
+        auto_id=True,
+    )
+
+
+def _vectorstore_exists() -> bool:
+    """Whether the configured vector backend has been written."""
+    if VECTOR_BACKEND == "local":
+        return LocalVectorStore.exists(get_active_index().local_dir)
+    return os.path.exists(MILVUS_URI)
+
+
+def _drop_index(location: IndexLocation) -> None:
+    """Delete a generation's vectors and BM25 index (a staging leftover or a retired generation)."""
+    dropped = False
+    try:
+        if VECTOR_BACKEND == "local":
+            if os.path.exists(location.local_dir):
+                shutil.rmtree(location.local_dir)
+                dropped = True
+        elif os.path.exists(MILVUS_URI):
+            client = MilvusClient(uri=MILVUS_URI)
+            if client.has_collection(location.collection):
+                client.drop_collection(location.collection)
+                dropped = True
+        if os.path.isdir(location.bm25_path):
+            shutil.rmtree(location.bm25_path)
+            dropped = True
+        elif os.path.exists(location.bm25_path):
+            os.remove(location.bm25_path)
+            dropped = True
+    except Exception as e:
+        logger.warning(f"Could not drop index generation {location.generation}: {e}")
+    if dropped:
+        logger.info(f"Dropped index generation {location.generation}")
+
+
+def _activate(location: IndexLocation, manifest: Dict[str, Any]) -> None:
+    """Switch queries to a fully built generation, then record what it contains."""
+    retired = activate_index(location)
+    # Pointer first: a crash in between leaves a stale manifest, which only re-ingests some files
+    save_manifest(manifest)
+    bump_index_version()
+    if retired is not None:
+        _drop_index(retired)
+
+
+def _copy_vectors(source: IndexLocation, target: IndexLocation) -> None:
+    """Copy a generation's vectors to another location (no embedding calls: stored vectors are reused)."""
+    if VECTOR_BACKEND == "local":
+        LocalVectorStore(embedding_function=get_embeddings(EMBEDDING_MODEL), path=source.local_dir).copy_to(
+            target.local_dir)
+        return
+
+    vectorstore = _open_vectorstore(drop_old=True, location=target)
+    client = MilvusClient(uri=MILVUS_URI)
+    iterator = client.query_iterator(source.collection, batch_size=INGEST_BATCH_SIZE, filter="",
+                                     output_fields=["*"])
+    rows = 0
+    try:
+        while True:
+            batch = iterator.next()
+            if not batch:
+                break
+            texts = [row.pop(vectorstore._text_field) for row in batch]
+            vectors = [row.pop(vectorstore._vector_field) for row in batch]
+            for row in batch:
+                row.pop(vectorstore._primary_field, None)  # auto_id assigns new ones
+            vectorstore.add_embeddings(texts=texts, embeddings=vectors, metadatas=batch)
+            rows += len(batch)
+    finally:
+        iterator.close()
+    logger.info(f"Copied {rows} rows from collection {source.collection} to {target.collection}")
+
+
+def _copy_index(source: IndexLocation, target: IndexLocation, bm25_index: BM25Index) -> None:
+    """Copy a generation (vectors and its loaded BM25 index) into a staging location."""
+    start = time.perf_counter()
+    _copy_vectors(source, target)
+    bm25_index.save(target.bm25_path)
+    logger.info(f"Copied index generation {source.generation} to {target.generation} "
+                f"in {time.perf_counter() - start:.3f}s")
+
+
+def _delete_doc_keys(vectorstore: VectorStoreBackend, doc_keys: List[str]) -> None:
+    """Delete every chunk belonging to the given doc keys."""
+    if not doc_keys:
+        return
+    expr = f"doc_key in {json.dumps(doc_keys)}"
+    if not vectorstore.delete(expr=expr):
+        raise RuntimeError(f"Failed to delete chunks for {doc_keys} from the vectorstore")
+    logger.info(f"Deleted chunks for {len(doc_keys)} documents: {doc_keys}")
+
+
+def update_vectorstore(splits, removed_doc_keys: List[str],
+                       location: Optional[IndexLocation] = None) -> VectorStoreBackend:
     """
-    Main ingestion pipeline using DoclingLoader + HybridChunker.
+    Apply an incremental change set to the existing Milvus collection.
 
-    Flow: PDFs → DoclingLoader (parse + chunk) → Milvus
+    Deletes all chunks of removed/changed files by doc_key, then embeds and
+    inserts only the new chunks.
+
+    Args:
+        splits: New chunks to insert (may be empty)
+        removed_doc_keys: Doc keys whose chunks should be deleted
+        location: Index generation to update (default: the active generation)
 
     Returns:
-        Milvus vectorstore
+        The updated vector store (Milvus, or LocalVectorStore with VECTOR_BACKEND=local)
     """
-    # Load and chunk PDFs with DoclingLoader (already includes rich metadata in dl_meta)
-    docs = load_pdfs("./data")
+    vectorstore = _open_vectorstore(location=location)
+    _delete_doc_keys(vectorstore, removed_doc_keys)
+
+    if splits:
+        vectorstore.add_documents(splits)
+        logger.info(f"Inserted {len(splits)} new chunks")
+
+    return vectorstore
+
+
+# Queue markers for the streaming pipeline
+_STAGE_DONE = object()
+
+
+class _StageFailure:
+    """Carries an exception from a pipeline stage to the consumer thread."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _ReplaceDocKey:
+    """Tells the insert stage to delete a doc_key's old chunks before its new ones arrive."""
+
+    def __init__(self, doc_key: str):
+        self.doc_key = doc_key
+
+
+def stream_ingest(pdf_files: List[str], vectorstore: VectorStoreBackend, batch_size: Optional[int] = None,
+                  queue_depth: Optional[int] = None, max_workers: Optional[int] = None,
+                  bm25_index: Optional[BM25Index] = None,
+                  replace_doc_keys: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Streaming parse → embed → insert pipeline with bounded memory.
+
+    Three stages run concurrently and are connected by bounded queues:
+    a parse thread turns files into chunk batches (using the parse process pool),
+    an embed thread embeds each batch, and the calling thread inserts embedded
+    batches into Milvus. A full queue blocks its producer (back-pressure), so at
+    most queue_depth batches wait between stages and peak memory depends on the
+    batch size and the largest single PDF, not on the corpus size.
+
+    Old chunks of replace_doc_keys are deleted (from Milvus and the BM25 index)
+    only once the file's new version has parsed into chunks, right before they
+    are inserted; a file that fails to parse keeps its indexed version.
+
+    Args:
+        pdf_files: PDF paths to ingest
+        vectorstore: Target store, Milvus or LocalVectorStore (its embedding function is used)
+        batch_size: Chunks per embed/insert batch (default: INGEST_BATCH_SIZE)
+        queue_depth: Max batches buffered between stages (default: INGEST_QUEUE_DEPTH)
+        max_workers: Parse worker processes (default: INGEST_PARSE_WORKERS)
+        bm25_index: BM25 index to add each inserted batch to
+        replace_doc_keys: Doc keys already indexed whose chunks the new ones replace
+
+    Returns:
+        Stats dict: chunks inserted, ingested doc_keys, per-stage busy time,
+        wall time, and the parse stats (pages/s, failures)
+    """
+    batch_size = max(1, batch_size or INGEST_BATCH_SIZE)
+    queue_depth = max(1, queue_depth or INGEST_QUEUE_DEPTH)
+    embeddings = vectorstore.embeddings
+    replace_doc_keys = set(replace_doc_keys)
+
+    chunk_queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+    vector_queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    parse_stats: Dict[str, Any] = {}
+    timings = {"embed": 0.0, "insert": 0.0}
+
+    def put(q: queue.Queue, item: Any) -> bool:
+        # Blocking put that gives up once the pipeline is shutting down
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue) -> Any:
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STAGE_DONE
+
+    def parse_stage() -> None:
+        results = iter_parsed_pdfs(pdf_files, max_workers, parse_stats)
+        try:
+            batch: List[Document] = []
+            for result in results:
+                doc_key = get_doc_key(result["file_path"])
+                if result["docs"] and doc_key in replace_doc_keys:
+                    # Ahead of every batch holding the new chunks
+                    if not put(chunk_queue, _ReplaceDocKey(doc_key)):
+                        return
+                for doc in result["docs"]:
+                    batch.append(doc)
+                    if len(batch) >= batch_size:
+                        if not put(chunk_queue, batch):
+                            return
+                        batch = []
+            if batch and not put(chunk_queue, batch):
+                return
+            put(chunk_queue, _STAGE_DONE)
+        except BaseException as e:
+            put(chunk_queue, _StageFailure(e))
+        finally:
+            results.close()  # shuts the parse pool down if we stopped early
+
+    def embed_stage() -> None:
+        try:
+            while True:
+                item = get(chunk_queue)
+                if item is _STAGE_DONE or isinstance(item, _StageFailure):
+                    put(vector_queue, item)
+                    return
+                if isinstance(item, _ReplaceDocKey):
+                    if not put(vector_queue, item):
+                        return
+                    continue
+                start = time.perf_counter()
+                vectors = embeddings.embed_documents([doc.page_content for doc in item])
+                timings["embed"] += time.perf_counter() - start
+                if not put(vector_queue, (item, vectors)):
+                    return
+        except BaseException as e:
+            put(vector_queue, _StageFailure(e))
+
+    threads = [
+        threading.Thread(target=parse_stage, name="ingest-parse", daemon=True),
+        threading.Thread(target=embed_stage, name="ingest-embed", daemon=True),
+    ]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    rows = 0
+    doc_keys = set()
+    try:
+        while True:
+            item = vector_queue.get()
+            if item is _STAGE_DONE:
+                break
+            if isinstance(item, _StageFailure):
+                raise item.error
+            if isinstance(item, _ReplaceDocKey):
+                _delete_doc_keys(vectorstore, [item.doc_key])
+                if bm25_index is not None:
+                    bm25_index.remove_doc_keys([item.doc_key])
+                continue
+            docs, vectors = item
+            start = time.perf_counter()
+            vectorstore.add_embeddings(
+                texts=[doc.page_content for doc in docs],
+                embeddings=vectors,
+                metadatas=[doc.metadata for doc in docs],
+            )
+            if bm25_index is not None:
+                bm25_index.add_documents(docs)
+            timings["insert"] += time.perf_counter() - start
+            rows += len(docs)
+            doc_keys.update(doc.metadata["doc_key"] for doc in docs)
+            logger.debug(f"Inserted batch of {len(docs)} chunks ({rows} total)")
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    wall = time.perf_counter() - wall_start
+    logger.info(f"Streaming ingestion completed in {wall:.3f}s: {rows} chunks "
+                f"(parse: {parse_stats.get('wall_time', 0.0):.3f}s, embed: {timings['embed']:.3f}s, "
+                f"insert: {timings['insert']:.3f}s)")
+
+    return {
+        "chunks": rows,
+        "doc_keys": doc_keys,
+        "wall_time": wall,
+        "embed_time": timings["embed"],
+        "insert_time": timings["insert"],
+        "parse": parse_stats,
+    }
+
+
+def _build_manifest(file_hashes: Dict[str, str], ingested_keys: set,
+                    previous: Optional[Dict[str, Any]] = None, retained_keys: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Build the manifest after an ingestion run.
+
+    Files ingested in this run get a fresh entry, untouched files keep their
+    previous entry, and files that were attempted but produced no chunks (parse
+    failures) are left out so the next incremental run retries them. Changed
+    files in retained_keys failed to parse but still have their previous
+    version indexed: they keep the previous entry (and are retried too, since
+    its hash no longer matches).
+    """
+    previous_files = (previous or {}).get("files", {})
+    retained_keys = set(retained_keys)
+    now = time.time()
+    files = {}
+    for doc_key, sha256 in file_hashes.items():
+        if doc_key in ingested_keys:
+            files[doc_key] = {"sha256": sha256, "ingested_at": now}
+        elif doc_key in previous_files and (previous_files[doc_key].get("sha256") == sha256
+                                            or doc_key in retained_keys):
+            files[doc_key] = previous_files[doc_key]
+    return {"config": get_chunking_config(), "files": files}
+
+
+def _report_progress(progress_callback: Optional[Callable[[str, float], None]],
+                     stage: str, fraction: float) -> None:
+    if progress_callback is not None:
+        progress_callback(stage, fraction)
+
+
+def ingest_docs(data_dir: str = "./data", incremental: bool = False,
+                streaming: Optional[bool] = None, staged: bool = False,
+                progress_callback: Optional[Callable[[str, float], None]] = None) -> Optional[VectorStoreBackend]:
+    """
+    Main ingestion pipeline using Docling + HybridChunker.
+
+    Flow: PDFs → Docling (parse + chunk) → embeddings → Milvus
+
+    In incremental mode only new or changed files (by content hash) are parsed
+    and embedded, and chunks of changed or deleted files are removed by doc_key.
+    A full rebuild happens instead when there is no manifest, no Milvus database,
+    or the chunking config changed since the last run.
+
+    A full rebuild never touches the index queries are served from: it fills
+    the next index generation (src.active_index) and switches to it only once
+    it is complete. Staged mode (used while the app is serving queries) applies
+    an incremental change set the same way: the active generation's vectors
+    and BM25 index are copied into the next generation (stored vectors, no
+    embedding calls), only the new or changed files are parsed and applied to
+    the copy, and the copy is then switched in.
+
+    In streaming mode chunks flow through stream_ingest() in batches instead of
+    being materialised in one list first.
+
+    Either way the persistent BM25 index (src.bm25_index) is updated alongside
+    Milvus, so the hybrid retriever never has to rebuild it from the collection,
+    and the index version is bumped so cached retrieval results (src.query_cache)
+    are invalidated.
+
+    Args:
+        data_dir: Directory containing PDF files
+        incremental: Only process the difference against the ingestion manifest
+        streaming: Use the bounded-memory streaming pipeline (default: INGEST_STREAMING)
+        staged: Never modify the active index in place, even for incremental changes
+        progress_callback: Called with (stage, fraction complete) as the run advances
+
+    Returns:
+        The vector store of the active generation (Milvus, or LocalVectorStore
+        with VECTOR_BACKEND=local), or None if no documents were ingested
+    """
+    streaming = INGEST_STREAMING if streaming is None else streaming
+    _report_progress(progress_callback, "Hashing files", 0.0)
+    pdf_files = list_pdf_files(data_dir)
+    file_hashes = {get_doc_key(path): compute_file_hash(path) for path in pdf_files}
+
+    manifest = load_manifest() if incremental else None
+    if incremental:
+        if manifest is None or not _vectorstore_exists():
+            logger.info("No existing index found, running full ingestion")
+        elif manifest.get("config") != get_chunking_config():
+            logger.info("Chunking config changed since last ingestion, running full rebuild")
+        else:
+            bm25_index = BM25Index.load(get_active_index().bm25_path)
+            if bm25_index is None:
+                logger.info("No BM25 index found, running full ingestion")
+            elif not staged:
+                return _ingest_incremental(pdf_files, manifest, file_hashes, bm25_index,
+                                           streaming, progress_callback)
+            else:
+                to_ingest, to_remove = plan_incremental_ingest(pdf_files, manifest, file_hashes)
+                if not to_ingest and not to_remove:
+                    logger.info("Index is up to date, nothing to ingest")
+                    _report_progress(progress_callback, "Done", 1.0)
+                    return _open_vectorstore()
+                staging = next_index()
+                # Leftovers of an aborted run; nothing is served from the staging generation
+                _drop_index(staging)
+                _report_progress(progress_callback, "Copying the current index", 0.05)
+                try:
+                    _copy_index(get_active_index(), staging, bm25_index)
+                except Exception as e:
+                    logger.warning(f"Could not copy the active index, rebuilding it instead: {e}")
+                    _drop_index(staging)
+                else:
+                    try:
+                        return _ingest_incremental(pdf_files, manifest, file_hashes, bm25_index,
+                                                   streaming, progress_callback, location=staging)
+                    except Exception:
+                        _drop_index(staging)
+                        raise
+
+    staging = next_index()
+    # Leftovers of an aborted rebuild; nothing is served from the staging generation
+    _drop_index(staging)
+
+    if streaming:
+        _report_progress(progress_callback, "Parsing, embedding and indexing", 0.1)
+        vectorstore = _open_vectorstore(drop_old=True, location=staging)
+        bm25_index = BM25Index()
+        stats = stream_ingest(pdf_files, vectorstore, bm25_index=bm25_index)
+        if not stats["chunks"]:
+            logger.warning("No valid documents found for ingestion, keeping the current index")
+            _drop_index(staging)
+            return None
+        bm25_index.save(staging.bm25_path)
+        _activate(staging, _build_manifest(file_hashes, stats["doc_keys"]))
+        _report_progress(progress_callback, "Done", 1.0)
+        return vectorstore
+
+    # Load and chunk PDFs with Docling (chunks carry rich metadata in dl_meta)
+    _report_progress(progress_callback, "Parsing PDFs", 0.1)
+    docs = load_pdfs(data_dir)
 
     if not docs:
-        logger.warning("No valid documents found for ingestion")
+        logger.warning("No valid documents found for ingestion, keeping the current index")
+        _drop_index(staging)
         return None
 
-    return build_vectorstore(docs)
+    _report_progress(progress_callback, "Embedding and indexing", 0.6)
+    vectorstore = build_vectorstore(docs, location=staging)
+    BM25Index(docs).save(staging.bm25_path)
+    _activate(staging, _build_manifest(file_hashes, {doc.metadata["doc_key"] for doc in docs}))
+    _report_progress(progress_callback, "Done", 1.0)
+    return vectorstore
+
+
+def _ingest_incremental(pdf_files: List[str], manifest: Dict[str, Any],
+                        file_hashes: Dict[str, str], bm25_index: BM25Index, streaming: bool = False,
+                        progress_callback: Optional[Callable[[str, float], None]] = None,
+                        location: Optional[IndexLocation] = None) -> VectorStoreBackend:
+    """
+    Ingest only the files whose content hash differs from the manifest (Milvus and BM25 alike).
+
+    Without a location, changes are applied to the active index in place, so
+    use staged ingestion (ingest_docs(staged=True)) while queries are being
+    served from it. Staged ingestion passes a staging location holding a copy
+    of the active generation (bm25_index is that copy's index); it is
+    activated once the changes are applied.
+
+    Chunks of deleted files are removed up front, but a changed file's old
+    chunks are only replaced once its new version has parsed: if parsing fails,
+    the old version stays indexed and keeps its manifest entry.
+    """
+    to_ingest, to_remove = plan_incremental_ingest(pdf_files, manifest, file_hashes)
+    changed_keys = {get_doc_key(path) for path in to_ingest}
+    deleted_keys = [key for key in to_remove if key not in changed_keys]
+
+    if not to_ingest and not to_remove:
+        logger.info("Index is up to date, nothing to ingest")
+        _report_progress(progress_callback, "Done", 1.0)
+        return update_vectorstore([], [])
+
+    logger.info(f"Incremental ingestion: {len(to_ingest)} new/changed files, "
+                f"{len(to_remove)} documents to remove")
+
+    if streaming:
+        _report_progress(progress_callback, "Parsing, embedding and indexing", 0.1)
+        vectorstore = _open_vectorstore(location=location)
+        _delete_doc_keys(vectorstore, deleted_keys)
+        bm25_index.remove_doc_keys(deleted_keys)
+        replaced_keys = [key for key in to_remove if key in changed_keys]
+        ingested_keys = (stream_ingest(to_ingest, vectorstore, bm25_index=bm25_index,
+                                       replace_doc_keys=replaced_keys)["doc_keys"]
+                         if to_ingest else set())
+    else:
+        _report_progress(progress_callback, "Parsing PDFs", 0.1)
+        docs = load_pdfs(file_paths=to_ingest) if to_ingest else []
+        ingested_keys = {doc.metadata["doc_key"] for doc in docs}
+        # Parsed first: only files whose new version produced chunks lose their old ones
+        removed_keys = [key for key in to_remove if key not in changed_keys or key in ingested_keys]
+        _report_progress(progress_callback, "Embedding and indexing", 0.6)
+        vectorstore = update_vectorstore(docs, removed_keys, location=location)
+        bm25_index.remove_doc_keys(removed_keys)
+        bm25_index.add_documents(docs)
+
+    failed_keys = sorted(changed_keys - ingested_keys)
+    if failed_keys:
+        logger.warning(f"Keeping the indexed version of {len(failed_keys)} changed files that failed to parse: "
+                       f"{failed_keys}")
+
+    new_manifest = _build_manifest(file_hashes, ingested_keys, manifest, retained_keys=failed_keys)
+    if location is not None:
+        bm25_index.save(location.bm25_path)
+        _activate(location, new_manifest)
+    else:
+        bm25_index.save(get_active_index().bm25_path)
+        save_manifest(new_manifest)
+        bump_index_version()
+    _report_progress(progress_callback, "Done", 1.0)
+    return vectorstore
 
 
 if __name__ == "__main__":
+    import argparse
     from src.logging_config import setup_logging
+
+    parser = argparse.ArgumentParser(description="Ingest PDFs from ./data into Milvus")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only parse and embed new or changed files")
+    parser.add_argument("--streaming", action="store_true", default=None,
+                        help="Overlap parsing, embedding and insertion with bounded memory")
+    args = parser.parse_args()
+
     setup_logging()
     logger.info("Starting document ingestion pipeline with Docling")
-    ingest_docs()
+    ingest_docs(incremental=args.incremental, streaming=args.streaming)
@@ -0,0 +1,274 @@
+"""
+Ingestion benchmark harness.
+
+Runs the ingestion stages over a corpus and reports where the time goes:
+wall time and throughput per stage (pages/s parsed, chunks/s chunked,
+tokens/s embedded, rows/s inserted) plus peak memory. Results are written as
+JSON so runs can be diffed across commits.
+
+With --stub-embeddings a local OpenAI-compatible /embeddings endpoint returns
+deterministic vectors, and rows go to a throwaway Milvus Lite file, so the
+benchmark runs offline (e.g. on a CI box) without touching the real index or
+spending API tokens.
+
+Usage:
+    python -m src.ingestion_benchmark --data-dir ./data --stub-embeddings --output bench.json
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_milvus import Milvus
+
+import src.ingestion as ingestion
+import src.parse_cache as parse_cache
+from src.tracked_embeddings import TrackedOpenAIEmbeddings, _estimate_tokens
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+STUB_EMBEDDING_DIM = 256
+
+
+class _StubEmbeddingHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible POST /embeddings returning deterministic unit vectors."""
+
+    dim = STUB_EMBEDDING_DIM
+    latency = 0.0
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+
+        data = []
+        tokens = 0
+        for i, item in enumerate(inputs):
+            # Input is either a string or a list of token ids (when LangChain pre-tokenizes)
+            key = item if isinstance(item, str) else json.dumps(item)
+            tokens += _estimate_tokens([item]) if isinstance(item, str) else len(item)
+            seed = int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+            if request.get("encoding_format") == "base64":
+                embedding: Any = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps({
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "stub"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_embedding_server(dim: int = STUB_EMBEDDING_DIM,
+                                latency: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start a local OpenAI-compatible embeddings endpoint on a free port.
+
+    Args:
+        dim: Embedding dimension
+        latency: Seconds to sleep per request (simulates network/model time)
+
+    Returns:
+        (server, base_url); call server.shutdown() when done
+    """
+    handler = type("StubEmbeddingHandler", (_StubEmbeddingHandler,), {"dim": dim, "latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-embeddings", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def _peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak resident set size so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _rate(count: float, seconds: float) -> float:
+    return count / seconds if seconds > 0 else 0.0
+
+
+def run_benchmark(pdf_files: List[str], embeddings: TrackedOpenAIEmbeddings, milvus_uri: str,
+                  max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Parse, embed and insert pdf_files, timing each stage separately.
+
+    Stages run one after another (not overlapped as in stream_ingest) so each
+    throughput number is attributable to one stage. Parse and chunk rates come
+    from the per-file times summed over worker processes; pages_per_second is
+    the wall-clock rate.
+
+    Args:
+        pdf_files: Corpus to ingest
+        embeddings: Embedding client (pass use_cache=False to measure the endpoint)
+        milvus_uri: Milvus Lite file to insert into (dropped and recreated)
+        max_workers: Parse worker processes (default: INGEST_PARSE_WORKERS)
+
+    Returns:
+        JSON-serialisable results with corpus, per-stage and memory sections
+    """
+    start = time.perf_counter()
+
+    parse_stats: Dict[str, Any] = {}
+    docs = [doc for result in ingestion.iter_parsed_pdfs(pdf_files, max_workers, parse_stats)
+            for doc in result["docs"]]
+    parse_rss = _peak_rss_mb()
+
+    texts = [doc.page_content for doc in docs]
+    embeddings._usage_client.get_and_reset_usage()
+    embed_start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts) if texts else []
+    embed_time = time.perf_counter() - embed_start
+    tokens = embeddings._usage_client.get_and_reset_usage()["prompt_tokens"]
+    embed_rss = _peak_rss_mb()
+
+    insert_time = 0.0
+    if docs:
+        vectorstore = Milvus(embedding_function=embeddings, connection_args={"uri": milvus_uri},
+                             drop_old=True, auto_id=True)
+        insert_start = time.perf_counter()
+        vectorstore.add_embeddings(texts=texts, embeddings=vectors,
+                                   metadatas=[doc.metadata for doc in docs])
+        insert_time = time.perf_counter() - insert_start
+    insert_rss = _peak_rss_mb()
+
+    chunks = len(docs)
+    return {
+        "corpus": {
+            "files": parse_stats.get("files", len(pdf_files)),
+            "failed": len(parse_stats.get("failed", [])),
+            "pages": parse_stats.get("pages", 0),
+            "chunks": chunks,
+            "duplicates_removed": parse_stats.get("duplicates_removed", 0),
+        },
+        "stages": {
+            "parse": {
+                "wall_time": parse_stats.get("wall_time", 0.0),
+                "parse_time": parse_stats.get("parse_time", 0.0),
+                "pages_per_second": parse_stats.get("pages_per_second", 0.0),
+                "workers": parse_stats.get("workers", 0),
+                "peak_rss_mb": parse_rss,
+            },
+            "chunk": {
+                "chunk_time": parse_stats.get("chunk_time", 0.0),
+                "chunks_per_second": _rate(chunks, parse_stats.get("chunk_time", 0.0)),
+            },
+            "embed": {
+                "wall_time": embed_time,
+                "tokens": tokens,
+                "tokens_per_second": _rate(tokens, embed_time),
+                "chunks_per_second": _rate(chunks, embed_time),
+                "peak_rss_mb": embed_rss,
+            },
+            "insert": {
+                "wall_time": insert_time,
+                "rows": chunks,
+                "rows_per_second": _rate(chunks, insert_time),
+                "peak_rss_mb": insert_rss,
+            },
+        },
+        "total_wall_time": time.perf_counter() - start,
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_rss_children_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def _disable_parse_cache() -> None:
+    """Force real parsing, in this process and in spawned parse workers."""
+    os.environ["DOCLING_CACHE_DIR"] = ""
+    parse_cache.PARSE_CACHE_DIR = ""
+    ingestion.PARSE_CACHE_DIR = ""
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmark ingestion stages and write JSON results")
+    parser.add_argument("--data-dir", default="./data", help="Directory of PDFs to ingest")
+    parser.add_argument("--output", default="ingestion_benchmark.json", help="Where to write results")
+    parser.add_argument("--workers", type=int, default=None, help="Parse worker processes")
+    parser.add_argument("--stub-embeddings", action="store_true",
+                        help="Embed against a local deterministic endpoint (offline)")
+    parser.add_argument("--stub-dim", type=int, default=STUB_EMBEDDING_DIM, help="Stub embedding dimension")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Stub latency per request")
+    parser.add_argument("--use-parse-cache", action="store_true",
+                        help="Allow Docling parse cache hits (measures re-chunking only)")
+    args = parser.parse_args(argv)
+
+    if not args.use_parse_cache:
+        _disable_parse_cache()
+
+    pdf_files = ingestion.list_pdf_files(args.data_dir)
+    server = None
+    if args.stub_embeddings:
+        server, base_url = start_stub_embedding_server(args.stub_dim, args.stub_latency_ms / 1000)
+        api_key = "stub"
+    else:
+        base_url = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
+        api_key = os.getenv("OPENAI_API_KEY")
+    # Raw strings, not tiktoken ids: works offline and matches what the stub hashes
+    embeddings = TrackedOpenAIEmbeddings(model=ingestion.EMBEDDING_MODEL, base_url=base_url, api_key=api_key,
+                                         use_cache=False, check_embedding_ctx_length=False)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            results = run_benchmark(pdf_files, embeddings, os.path.join(tmp_dir, "benchmark.db"), args.workers)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    results["config"] = {
+        "data_dir": args.data_dir,
+        "embedding_endpoint": "stub" if args.stub_embeddings else base_url,
+        "embedding_model": ingestion.EMBEDDING_MODEL,
+        "chunking": ingestion.get_chunking_config(),
+        "docling_version": parse_cache.docling_version(),
+        "parse_cache": args.use_parse_cache,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    stages = results["stages"]
+    logger.info(f"Ingestion benchmark: {results['corpus']['pages']} pages, {results['corpus']['chunks']} chunks "
+                f"in {results['total_wall_time']:.3f}s")
+    logger.info(f"  parse:  {stages['parse']['pages_per_second']:.2f} pages/s")
+    logger.info(f"  chunk:  {stages['chunk']['chunks_per_second']:.2f} chunks/s")
+    logger.info(f"  embed:  {stages['embed']['tokens_per_second']:.0f} tokens/s")
+    logger.info(f"  insert: {stages['insert']['rows_per_second']:.0f} rows/s")
+    logger.info(f"  peak RSS: {results['peak_rss_mb']:.0f} MB (parse workers {results['peak_rss_children_mb']:.0f} MB)")
+    logger.info(f"Results written to {args.output}")
+    return results
+
+
+if __name__ == "__main__":
+    from src.logging_config import setup_logging
+
+    setup_logging()
+    main()
@@ -0,0 +1,179 @@
+"""
+Background ingestion jobs for the Streamlit app.
+
+Uploading a PDF used to run ingest_docs() inside a spinner and then clear
+st.cache_resource, which blocked the UI and threw away every session's
+retriever. IngestionJobRunner instead queues upload jobs for a single
+background worker thread and serves queries from the current retriever until
+the new index is ready, at which point the retriever is swapped atomically.
+Jobs ingest in staged mode: the new index is built as a separate generation
+(src.active_index), so the index the current retriever reads is never
+modified or dropped underneath it.
+
+Key Components:
+- IngestionJob: Status and progress of one queued upload
+- IngestionJobRunner: Job queue, background worker and current-retriever holder
+"""
+
+import itertools
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from src.logging_config import get_logger
+from src.query_cache import bump_index_version
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class IngestionJob:
+    """Status of one ingestion job (read by the UI, written by the worker thread)."""
+
+    job_id: int
+    file_name: str
+    status: str = QUEUED
+    stage: str = "Waiting in queue"
+    progress: float = 0.0
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+
+def _default_ingest(progress_callback: Callable[[str, float], None]) -> Any:
+    from src.ingestion import ingest_docs
+    return ingest_docs(incremental=True, staged=True, progress_callback=progress_callback)
+
+
+class IngestionJobRunner:
+    """
+    Runs ingestion jobs one at a time on a background thread.
+
+    Jobs are serialized because they all write the same index generations and
+    manifest. Each job runs a staged incremental ingest into the next index
+    generation (a copy of the active one with only the new or changed files
+    parsed, embedded and applied), then builds a fresh retriever over it with
+    retriever_factory and swaps it in under a lock. Queries keep using the
+    previous retriever, and its untouched generation, until the swap; a failed
+    job leaves both in place.
+
+    Args:
+        retriever_factory: Builds a retriever over the current index
+        ingest_fn: Runs one ingestion, called with a (stage, fraction) progress
+            callback (default: staged incremental ingest_docs)
+    """
+
+    def __init__(self, retriever_factory: Callable[[], Any],
+                 ingest_fn: Callable[[Callable[[str, float], None]], Any] = _default_ingest):
+        self._retriever_factory = retriever_factory
+        self._ingest_fn = ingest_fn
+        self._lock = threading.Lock()
+        self._retriever = None
+        self._index_version = 0
+        self._jobs: Dict[int, IngestionJob] = {}
+        self._job_ids = itertools.count(1)
+        self._queue: "queue.Queue[IngestionJob]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="ingestion-worker", daemon=True)
+        self._worker.start()
+
+    def get_retriever(self) -> Any:
+        """Return the current retriever, building it on first use."""
+        with self._lock:
+            if self._retriever is None:
+                self._retriever = self._retriever_factory()
+            return self._retriever
+
+    @property
+    def index_version(self) -> int:
+        """Incremented every time a finished job swaps in a new retriever."""
+        return self._index_version
+
+    def submit(self, file_name: str) -> IngestionJob:
+        """
+        Queue ingestion of a file that has already been saved to the data directory.
+
+        Args:
+            file_name: Name of the uploaded file (for display)
+
+        Returns:
+            The queued job; poll get_job()/list_jobs() for progress
+        """
+        with self._lock:
+            job = IngestionJob(job_id=next(self._job_ids), file_name=file_name)
+            self._jobs[job.job_id] = job
+        self._queue.put(job)
+        logger.info(f"Queued ingestion job {job.job_id} for {file_name}")
+        return job
+
+    def get_job(self, job_id: int) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[IngestionJob]:
+        """All jobs, most recent first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.job_id, reverse=True)
+
+    def has_pending_jobs(self) -> bool:
+        with self._lock:
+            return any(not job.done for job in self._jobs.values())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued job has finished (True) or the timeout expires (False)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.has_pending_jobs():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._run_job(job)
+            finally:
+                self._queue.task_done()
+
+    def _run_job(self, job: IngestionJob) -> None:
+        def report(stage: str, fraction: float) -> None:
+            job.stage = stage
+            # Leave the last 10% for rebuilding the retriever
+            job.progress = min(fraction, 1.0) * 0.9
+
+        start = time.perf_counter()
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            self._ingest_fn(report)
+            job.stage = "Refreshing retriever"
+            retriever = self._retriever_factory()
+            with self._lock:
+                self._retriever = retriever
+                self._index_version += 1
+            # Queries answered by the old retriever during the swap may have been
+            # cached under the version ingestion set; start a fresh one
+            bump_index_version()
+            job.stage = "Done"
+            job.progress = 1.0
+            job.status = SUCCEEDED
+            logger.info(f"Ingestion job {job.job_id} ({job.file_name}) completed in "
+                        f"{time.perf_counter() - start:.3f}s, index version {self._index_version}")
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+            logger.error(f"Ingestion job {job.job_id} ({job.file_name}) failed: {job.error}", exc_info=True)
+        finally:
+            job.finished_at = time.time()
@@ -0,0 +1,534 @@
+"""
+Local memory-mapped vector store, selectable instead of Milvus Lite.
+
+Milvus Lite allows one connection per database file, so a process can only
+hold a single retriever over it and other processes cannot read it at all.
+For a corpus of tens of thousands of chunks an exact scan is fast enough, so
+this backend keeps the vectors as a raw row-major float16/float32 matrix that
+readers map with np.memmap: the OS page cache holds one copy shared by every
+process (zero-copy), and opening the store only reads a small metadata file.
+
+Layout of LOCAL_VECTOR_DIR:
+- meta.json: dimension, dtype, row count, doc_key table and current generation
+  (replaced atomically, always written last)
+- gen-NNNNNN/vectors.bin: L2-normalized vectors, one row per chunk
+- gen-NNNNNN/rows.bin: per-row byte offset/length into docs.jsonl and doc_key code
+- gen-NNNNNN/docs.jsonl: one {"text", "metadata"} JSON object per row
+
+Writers append rows to the current generation and then replace meta.json, so
+readers see either the old or the new row count, never a partial row. Deletes
+compact the kept rows into a new generation directory; readers that opened the
+previous one keep using it until they reopen. One writer at a time is
+supported, which ingestion already guarantees.
+
+Search is exact cosine similarity (blockwise matrix product plus
+argpartition). Filters support the subset of Milvus expressions the app uses:
+`doc_key in [...]` and `doc_key == "..."` clauses joined by `and`.
+
+Optionally (LOCAL_VECTOR_COMPACT_DIM / LOCAL_VECTOR_QUANTIZATION) the first
+pass runs over a compact copy of the vectors instead: truncated to a prefix
+dimension (Matryoshka embeddings such as qwen3-embedding keep most of their
+quality in the leading dimensions) and/or quantized to int8 or sign bits. Only
+the shortlist of LOCAL_VECTOR_RESCORE_FACTOR * k candidates is then rescored
+with the full-precision rows, so the full matrix is mostly left on disk.
+
+Key Components:
+- LocalVectorStore: LangChain VectorStore over the memory-mapped matrix
+- VECTOR_BACKEND: "milvus" (default) or "local"
+- CompactIndex: Truncated/quantized first-pass copy of the vectors
+- parse_doc_key_filter: Doc keys selected by a supported filter expression
+"""
+
+import asyncio
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "milvus").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "./local_vectorstore")
+# float16 halves memory and disk (4096-d: 8 KiB per chunk); scores are computed in float32
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float16")
+# Compact first pass: prefix dimension (0 = full) and "none", "int8" or "binary"
+LOCAL_VECTOR_COMPACT_DIM = int(os.getenv("LOCAL_VECTOR_COMPACT_DIM", "0"))
+LOCAL_VECTOR_QUANTIZATION = os.getenv("LOCAL_VECTOR_QUANTIZATION", "none").lower()
+# Candidates per requested result that are rescored with full-precision vectors
+LOCAL_VECTOR_RESCORE_FACTOR = int(os.getenv("LOCAL_VECTOR_RESCORE_FACTOR", "4"))
+FORMAT_VERSION = 1
+QUANTIZATIONS = ("none", "int8", "binary")
+
+ROW_DTYPE = np.dtype([("offset", "<i8"), ("length", "<i4"), ("key", "<i4")])
+# Rows converted to float32 per matrix product (bounds the temporary copy for float16)
+SEARCH_BLOCK_ROWS = 8192
+
+_FILTER_CLAUSE = re.compile(r'doc_key\s+in\s+(\[[^\]]*\])|doc_key\s*==\s*("(?:[^"\\]|\\.)*")')
+_FILTER_GLUE = re.compile(r"[()\s]|\band\b")
+
+
+def parse_doc_key_filter(expr: str) -> Set[str]:
+    """
+    Doc keys selected by a Milvus-style filter expression.
+
+    Supports `doc_key in ["a.pdf", ...]` and `doc_key == "a.pdf"` clauses,
+    optionally parenthesized and joined by `and` (their intersection).
+
+    Raises:
+        ValueError: If the expression uses anything else
+    """
+    selected: Optional[Set[str]] = None
+
+    def take(match: "re.Match") -> str:
+        nonlocal selected
+        keys = set(json.loads(match.group(1))) if match.group(1) else {json.loads(match.group(2))}
+        selected = keys if selected is None else selected & keys
+        return " "
+
+    rest = _FILTER_CLAUSE.sub(take, expr)
+    if selected is None or _FILTER_GLUE.sub("", rest):
+        raise ValueError(f"Unsupported filter expression for the local vector store: {expr!r}")
+    return selected
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best finite scores, best first (ties by index)."""
+    top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+    top = top[np.isfinite(scores[top])]
+    return top[np.lexsort((top, -scores[top]))]
+
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:  # numpy < 2.0
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(bits: np.ndarray) -> np.ndarray:
+        return _POPCOUNT_TABLE[bits]
+
+
+class CompactIndex:
+    """
+    Truncated and/or quantized copy of the vectors for a cheap first pass.
+
+    Built in memory with one sequential pass over the full-precision matrix.
+    Its scores only rank candidates; LocalVectorStore rescores the shortlist
+    with the full-precision vectors.
+
+    Args:
+        vectors: L2-normalized full-precision vectors (n, dim)
+        dim: Prefix dimension to keep, renormalized (0 = all dimensions)
+        quantization: "none", "int8" (per-row scale) or "binary" (sign bits, Hamming distance)
+    """
+
+    def __init__(self, vectors: np.ndarray, dim: int = 0, quantization: str = "none"):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        self.dim = min(dim, vectors.shape[1]) if dim else vectors.shape[1]
+        self.quantization = quantization
+        self.scales: Optional[np.ndarray] = None
+
+        codes, scales = [], []
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = _normalize_rows(np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS, :self.dim], dtype=np.float32))
+            if quantization == "int8":
+                scale = np.abs(block).max(axis=1) / 127.0
+                scale[scale == 0] = 1.0
+                codes.append(np.round(block / scale[:, None]).astype(np.int8))
+                scales.append(scale.astype(np.float32))
+            elif quantization == "binary":
+                codes.append(np.packbits(block > 0, axis=1))
+            else:
+                codes.append(block.astype(vectors.dtype))
+        self.codes = np.concatenate(codes)
+        if scales:
+            self.scales = np.concatenate(scales)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate similarity of each query (full-dimension, float32) to every row: (nq, n)."""
+        queries = _normalize_rows(queries[:, :self.dim])
+        query_bits = np.packbits(queries > 0, axis=1) if self.quantization == "binary" else None
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), SEARCH_BLOCK_ROWS):
+            block = self.codes[start:start + SEARCH_BLOCK_ROWS]
+            window = slice(start, start + len(block))
+            if query_bits is not None:
+                distance = _popcount(query_bits[:, None, :] ^ block[None, :, :]).sum(axis=2, dtype=np.int32)
+                scores[:, window] = 1.0 - 2.0 * distance / self.dim
+            else:
+                scores[:, window] = queries @ block.astype(np.float32).T
+                if self.scales is not None:
+                    scores[:, window] *= self.scales[window]
+        return scores
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Exact-search vector store over a memory-mapped matrix (see module docstring).
+
+    Args:
+        embedding_function: Embeddings used for queries and add_texts()
+        path: Store directory (default: LOCAL_VECTOR_DIR)
+        dtype: Storage dtype for a new store, "float16" or "float32"
+            (default: LOCAL_VECTOR_DTYPE; an existing store keeps its own)
+        drop_old: Delete any existing store at path first
+        compact_dim: First-pass prefix dimension (default: LOCAL_VECTOR_COMPACT_DIM, 0 = full)
+        quantization: First-pass quantization (default: LOCAL_VECTOR_QUANTIZATION)
+        rescore_factor: Shortlist size per result for rescoring (default: LOCAL_VECTOR_RESCORE_FACTOR)
+    """
+
+    def __init__(self, embedding_function: Embeddings, path: Optional[str] = None,
+                 dtype: Optional[str] = None, drop_old: bool = False, compact_dim: Optional[int] = None,
+                 quantization: Optional[str] = None, rescore_factor: Optional[int] = None):
+        self.embedding_function = embedding_function
+        self.path = path or LOCAL_VECTOR_DIR
+        self.compact_dim = LOCAL_VECTOR_COMPACT_DIM if compact_dim is None else compact_dim
+        self.quantization = (quantization or LOCAL_VECTOR_QUANTIZATION).lower()
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {self.quantization!r}, expected one of {QUANTIZATIONS}")
+        self.rescore_factor = max(1, LOCAL_VECTOR_RESCORE_FACTOR if rescore_factor is None else rescore_factor)
+        self._default_dtype = dtype or LOCAL_VECTOR_DTYPE
+        self._lock = threading.Lock()
+        self._docs_fd: Optional[int] = None
+        self._compact_index: Optional[Tuple[np.ndarray, CompactIndex]] = None
+        if drop_old and os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        self._open()
+
+    @staticmethod
+    def exists(path: Optional[str] = None) -> bool:
+        """Whether a store has been written at path."""
+        return os.path.exists(os.path.join(path or LOCAL_VECTOR_DIR, "meta.json"))
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def __len__(self) -> int:
+        return self._meta["count"]
+
+    # Reading
+
+    def _generation_dir(self, meta: Dict[str, Any]) -> str:
+        return os.path.join(self.path, f"gen-{meta['generation']:06d}")
+
+    def _open(self) -> None:
+        """(Re)map the current generation as described by meta.json."""
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported local vector store format {meta.get('format')} at {self.path}")
+        else:
+            meta = {"format": FORMAT_VERSION, "generation": 0, "dim": None, "dtype": self._default_dtype,
+                    "count": 0, "docs_bytes": 0, "doc_keys": []}
+
+        count, dim = meta["count"], meta["dim"]
+        gen_dir = self._generation_dir(meta)
+        if count:
+            vectors = np.memmap(os.path.join(gen_dir, "vectors.bin"), dtype=meta["dtype"], mode="r",
+                                shape=(count, dim))
+            rows = np.memmap(os.path.join(gen_dir, "rows.bin"), dtype=ROW_DTYPE, mode="r", shape=(count,))
+            # Keep a handle, not a path: a compaction may replace the generation meanwhile
+            docs_fd = os.open(os.path.join(gen_dir, "docs.jsonl"), os.O_RDONLY)
+        else:
+            vectors = np.empty((0, dim or 0), dtype=meta["dtype"])
+            rows = np.empty(0, dtype=ROW_DTYPE)
+            docs_fd = None
+
+        old_fd = self._docs_fd
+        self._meta = meta
+        self._key_ids = {key: i for i, key in enumerate(meta["doc_keys"])}
+        self._vectors, self._rows, self._docs_fd = vectors, rows, docs_fd
+        if old_fd is not None:
+            os.close(old_fd)
+
+    def _read_documents(self, rows: np.ndarray, docs_fd: int) -> List[Document]:
+        docs = []
+        for offset, length, _ in rows:
+            record = json.loads(os.pread(docs_fd, int(length), int(offset)))
+            docs.append(Document(page_content=record["text"], metadata=record["metadata"]))
+        return docs
+
+    def _get_compact_index(self, vectors: np.ndarray) -> Optional[CompactIndex]:
+        """First-pass index for this snapshot of the vectors (built on first use), or None if disabled."""
+        if self.quantization == "none" and not 0 < self.compact_dim < vectors.shape[1]:
+            return None
+        cached = self._compact_index
+        if cached is not None and cached[0] is vectors:
+            return cached[1]
+        start = time.perf_counter()
+        index = CompactIndex(vectors, self.compact_dim, self.quantization)
+        self._compact_index = (vectors, index)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Compact index ({index.dim}-d, {index.quantization}) built in {elapsed:.3f}s: "
+                    f"{index.nbytes / 2**20:.1f} MiB vs {vectors.nbytes / 2**20:.1f} MiB full precision")
+        return index
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Rows and bytes of the full-precision matrix and of the compact index (0 if disabled or not built yet)."""
+        cached = self._compact_index
+        compact_bytes = cached[1].nbytes if cached is not None and cached[0] is self._vectors else 0
+        return {"rows": len(self._rows), "full_precision_bytes": self._vectors.nbytes, "compact_bytes": compact_bytes}
+
+    def _filter_mask(self, expr: Optional[str], rows: np.ndarray) -> Optional[np.ndarray]:
+        if not expr:
+            return None
+        codes = [self._key_ids[key] for key in parse_doc_key_filter(expr) if key in self._key_ids]
+        return np.isin(rows["key"], np.asarray(codes, dtype=np.int32))
+
+    def search_batch_with_score(self, embeddings: List[List[float]], k: int = 4,
+                                expr: Optional[str] = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Top-k by cosine similarity for several query vectors at once.
+
+        Exact unless a compact first pass is configured; then the best
+        rescore_factor * k candidates of the first pass are rescored with the
+        full-precision vectors (returned scores are always exact).
+
+        Args:
+            embeddings: Query vectors
+            k: Results per query
+            expr: Optional doc_key filter (see parse_doc_key_filter), applied before top-k
+
+        Returns:
+            One [(document, cosine similarity)] list per query, best first
+        """
+        # One consistent snapshot even if a writer reopens the store meanwhile
+        with self._lock:
+            vectors, rows, docs_fd = self._vectors, self._rows, self._docs_fd
+        if not len(rows) or not embeddings:
+            return [[] for _ in embeddings]
+
+        queries = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+        compact = self._get_compact_index(vectors)
+        if compact is not None:
+            scores = compact.scores(queries)
+        else:
+            scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+            for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                scores[:, start:start + len(block)] = queries @ block.T
+
+        mask = self._filter_mask(expr, rows)
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+
+        results = []
+        for query, row_scores in zip(queries, scores):
+            if compact is None:
+                top = _top_k(row_scores, k)
+                top_scores = row_scores[top]
+            else:
+                # Sorted so the full-precision rows are read from the memmap in file order
+                shortlist = np.sort(_top_k(row_scores, k * self.rescore_factor))
+                exact = np.asarray(vectors[shortlist], dtype=np.float32) @ query
+                best = _top_k(exact, k)
+                top, top_scores = shortlist[best], exact[best]
+            docs = self._read_documents(rows[top], docs_fd)
+            results.append(list(zip(docs, top_scores.tolist())))
+        return results
+
+    def search_batch(self, embeddings: List[List[float]], k: int = 4,
+                     expr: Optional[str] = None) -> List[List[Document]]:
+        """search_batch_with_score() without the scores."""
+        return [[doc for doc, _ in hits] for hits in self.search_batch_with_score(embeddings, k, expr)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, expr: Optional[str] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.search_batch_with_score([self.embedding_function.embed_query(query)], k, expr)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, expr: Optional[str] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return self.search_batch([embedding], k, expr)[0]
+
+    def similarity_search(self, query: str, k: int = 4, expr: Optional[str] = None,
+                          **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, expr)
+
+    async def asimilarity_search(self, query: str, k: int = 4, expr: Optional[str] = None,
+                                 **kwargs: Any) -> List[Document]:
+        embedding = await self.embedding_function.aembed_query(query)
+        return await asyncio.to_thread(self.similarity_search_by_vector, embedding, k, expr)
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] -> relevance in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    # Writing
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas)
+
+    def add_embeddings(self, texts: Iterable[str], embeddings: List[List[float]],
+                       metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        """
+        Append precomputed vectors (same signature as Milvus.add_embeddings).
+
+        Returns:
+            Row ids of the new chunks (positions: a later delete renumbers them)
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock:
+            meta = dict(self._meta)
+            if meta["dim"] is None:
+                meta["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != meta["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({meta['dim']})")
+
+            doc_keys = list(meta["doc_keys"])
+            key_ids = dict(self._key_ids)
+            rows = np.zeros(len(texts), dtype=ROW_DTYPE)
+            lines = []
+            offset = meta["docs_bytes"]
+            for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+                line = (json.dumps({"text": text, "metadata": metadata}) + "\n").encode("utf-8")
+                # Same key as src.chunk_ids.chunk_doc_key
+                key = metadata.get("doc_key") or os.path.basename(metadata.get("source", ""))
+                if key not in key_ids:
+                    key_ids[key] = len(doc_keys)
+                    doc_keys.append(key)
+                rows[i] = (offset, len(line), key_ids[key])
+                offset += len(line)
+                lines.append(line)
+
+            gen_dir = self._generation_dir(meta)
+            os.makedirs(gen_dir, exist_ok=True)
+            count = meta["count"]
+            itemsize = np.dtype(meta["dtype"]).itemsize
+            _append(os.path.join(gen_dir, "vectors.bin"), count * meta["dim"] * itemsize,
+                    vectors.astype(meta["dtype"]).tobytes())
+            _append(os.path.join(gen_dir, "rows.bin"), count * ROW_DTYPE.itemsize, rows.tobytes())
+            _append(os.path.join(gen_dir, "docs.jsonl"), meta["docs_bytes"], b"".join(lines))
+
+            meta.update(count=count + len(texts), docs_bytes=offset, doc_keys=doc_keys)
+            self._write_meta(meta)
+            self._open()
+        return [str(i) for i in range(count, count + len(texts))]
+
+    def delete(self, ids: Optional[List[str]] = None, expr: Optional[str] = None, **kwargs: Any) -> bool:
+        """
+        Delete rows by id and/or doc_key filter, compacting into a new generation.
+
+        Returns:
+            True (also when nothing matched)
+        """
+        with self._lock:
+            rows = self._rows
+            if not len(rows) or (ids is None and not expr):
+                return True
+            keep = np.ones(len(rows), dtype=bool)
+            mask = self._filter_mask(expr, rows)
+            if mask is not None:
+                keep &= ~mask
+            if ids:
+                keep[np.asarray([int(i) for i in ids], dtype=np.int64)] = False
+            if not keep.all():
+                self._rewrite(np.flatnonzero(keep))
+        return True
+
+    def _rewrite(self, kept: np.ndarray) -> None:
+        """Write the kept rows into the next generation and switch to it (lock held)."""
+        meta = dict(self._meta)
+        old_dir = self._generation_dir(meta)
+        meta["generation"] += 1
+        new_dir = self._generation_dir(meta)
+        if os.path.exists(new_dir):
+            shutil.rmtree(new_dir)
+        os.makedirs(new_dir)
+
+        rows = np.zeros(len(kept), dtype=ROW_DTYPE)
+        offset = 0
+        with open(os.path.join(new_dir, "vectors.bin"), "wb") as vectors_file, \
+                open(os.path.join(new_dir, "docs.jsonl"), "wb") as docs_file:
+            for start in range(0, len(kept), SEARCH_BLOCK_ROWS):
+                block = kept[start:start + SEARCH_BLOCK_ROWS]
+                vectors_file.write(np.ascontiguousarray(self._vectors[block]).tobytes())
+                for i, row in zip(range(start, start + len(block)), self._rows[block]):
+                    line = os.pread(self._docs_fd, int(row["length"]), int(row["offset"]))
+                    docs_file.write(line)
+                    rows[i] = (offset, len(line), row["key"])
+                    offset += len(line)
+        with open(os.path.join(new_dir, "rows.bin"), "wb") as f:
+            f.write(rows.tobytes())
+
+        meta.update(count=len(kept), docs_bytes=offset)
+        self._write_meta(meta)
+        self._open()
+        logger.info(f"Compacted local vector store to {len(kept)} rows (generation {meta['generation']})")
+
+        # Keep the previous generation for readers that are still opening it
+        for name in os.listdir(self.path):
+            if name.startswith("gen-") and os.path.join(self.path, name) not in (old_dir, new_dir):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def copy_to(self, path: str) -> None:
+        """
+        Copy the current generation into a new store directory (replacing anything there).
+
+        Used to stage changes on a copy instead of the store queries are served from.
+        """
+        with self._lock:
+            meta = dict(self._meta)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+            gen_dir = self._generation_dir(meta)
+            if os.path.exists(gen_dir):
+                shutil.copytree(gen_dir, os.path.join(path, os.path.basename(gen_dir)))
+            with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        logger.info(f"Copied local vector store ({meta['count']} rows) to {path}")
+
+    def _write_meta(self, meta: Dict[str, Any]) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, "meta.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   path: Optional[str] = None, drop_old: bool = True, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding_function=embedding, path=path, drop_old=drop_old)
+        store.add_texts(texts, metadatas)
+        return store
+
+
+def _append(path: str, committed_size: int, data: bytes) -> None:
+    """Append data after the committed prefix of a file (dropping bytes left by an interrupted write)."""
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.truncate(committed_size)
+        f.seek(committed_size)
+        f.write(data)
@@ -0,0 +1,89 @@
+"""
+On-disk cache of Docling parse results.
+
+Layout analysis is by far the most expensive ingestion step, but its output
+only depends on the PDF bytes and the Docling version. Caching the parsed
+DoclingDocument lets chunking experiments (DEFAULT_MAX_TOKENS, merge_peers, ...)
+re-run only the HybridChunker.
+
+Entries are keyed by (file SHA-256, Docling version, page range) and stored as
+JSON via DoclingDocument.export_to_dict(). Set DOCLING_CACHE_DIR to an empty
+string to disable the cache.
+"""
+
+import json
+import os
+from importlib import metadata
+from typing import Optional, Tuple
+
+from docling_core.types.doc import DoclingDocument
+
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+PARSE_CACHE_DIR = os.getenv("DOCLING_CACHE_DIR", "./.docling_cache")
+
+
+def _package_version(*names: str) -> str:
+    for name in names:
+        try:
+            return metadata.version(name)
+        except metadata.PackageNotFoundError:
+            continue
+    return "unknown"
+
+
+def docling_version() -> str:
+    """Version tag for cache keys: Docling (parser) plus docling-core (serialization format)."""
+    return f"docling-{_package_version('docling', 'docling-slim')}_core-{_package_version('docling-core')}"
+
+
+def get_cache_path(file_hash: str, page_range: Optional[Tuple[int, int]] = None) -> str:
+    """Cache file path for a PDF (or a page-range shard of it)."""
+    range_tag = f"p{page_range[0]}-{page_range[1]}" if page_range else "all"
+    return os.path.join(PARSE_CACHE_DIR, file_hash[:2], f"{file_hash}_{docling_version()}_{range_tag}.json")
+
+
+def load_parsed_document(file_hash: Optional[str],
+                         page_range: Optional[Tuple[int, int]] = None) -> Optional[DoclingDocument]:
+    """
+    Return the cached DoclingDocument, or None on a miss (or if caching is disabled).
+
+    A corrupt entry is treated as a miss and re-parsed.
+    """
+    if not PARSE_CACHE_DIR or not file_hash:
+        return None
+
+    path = get_cache_path(file_hash, page_range)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return DoclingDocument.model_validate(json.load(f))
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable Docling cache entry {path}: {e}")
+        return None
+
+
+def save_parsed_document(dl_doc: DoclingDocument, file_hash: Optional[str],
+                         page_range: Optional[Tuple[int, int]] = None) -> None:
+    """
+    Store a parsed DoclingDocument (atomic write; safe with concurrent parse workers).
+
+    Failures are logged and ignored: the cache must never break ingestion.
+    """
+    if not PARSE_CACHE_DIR or not file_hash:
+        return
+
+    path = get_cache_path(file_hash, page_range)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dl_doc.export_to_dict(), f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Failed to write Docling cache entry {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,179 @@
+"""
+In-process LRU/TTL caches for repeated questions.
+
+Users re-ask the example questions and close paraphrases all the time. The
+persistent embedding cache (src.embedding_cache) already saves the API call
+for exact repeats, but every repeat still went through a SQLite lookup and the
+whole hybrid retrieval. Two small in-memory caches sit in front of that:
+
+- query_embedding_cache: query vectors keyed by (model, normalized text)
+- retrieval_cache: retrieval results keyed by (normalized query, k, source
+  filter, index version)
+
+Both are bounded (LRU) and entries expire after a TTL. Ingestion bumps the
+index version (bump_index_version), which makes every cached retrieval result
+unreachable, so nothing stale is served after the index changes. The version
+lives in a small file (INDEX_VERSION_PATH) rather than in process memory, so
+ingestion run from the CLI, an evaluation or another worker also invalidates
+the cache of a running app; reading it costs one stat() per lookup.
+
+Key Components:
+- TTLCache: Thread-safe LRU cache with per-entry expiry and hit/miss counters
+- normalize_query: Case/whitespace/punctuation-insensitive cache key for a query
+- get_index_version / bump_index_version: Persisted index version used in retrieval keys
+- cache_stats: Hit-rate metrics of both caches (for sizing them)
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))  # 0 disables the retrieval cache
+INDEX_VERSION_PATH = os.getenv("INDEX_VERSION_PATH", "./index_version")
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing ?/!/. so trivial variants share a key."""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", text).strip().lower())
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire ttl seconds after insertion.
+
+    Args:
+        max_entries: Capacity; the least recently used entry is evicted beyond it
+            (0 disables the cache: get() always misses, put() is a no-op)
+        ttl: Entry lifetime in seconds (0 = no expiry)
+    """
+
+    def __init__(self, max_entries: int, ttl: float = QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value, or None on a miss (absent or expired)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE)
+retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE)
+
+_index_version_lock = threading.Lock()
+# (file signature, version) of the last read, so unchanged files are not re-read
+_index_version_cache: Optional[Tuple[Tuple[int, int, int], int]] = None
+
+
+def get_index_version() -> int:
+    """
+    Version of the search index on disk (part of every retrieval cache key).
+
+    Bumped by whichever process last ingested, so a running app notices index
+    changes made elsewhere. 0 if no ingestion has recorded a version yet.
+    """
+    global _index_version_cache
+    try:
+        st = os.stat(INDEX_VERSION_PATH)
+    except FileNotFoundError:
+        return 0
+    signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _index_version_cache
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    try:
+        with open(INDEX_VERSION_PATH, "r", encoding="utf-8") as f:
+            version = int(f.read().strip())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable index version file {INDEX_VERSION_PATH}, using version 0: {e}")
+        return 0
+    _index_version_cache = (signature, version)
+    return version
+
+
+def bump_index_version() -> int:
+    """
+    Mark the index as changed: cached retrieval results of earlier versions are never served again.
+
+    Called by ingestion after it modifies Milvus and the BM25 index, and by the
+    ingestion job runner once it has swapped in the rebuilt retriever. The new
+    version is written atomically to INDEX_VERSION_PATH, where every process
+    serving queries picks it up on its next lookup.
+
+    Returns:
+        The new index version
+    """
+    with _index_version_lock:
+        version = get_index_version() + 1
+        tmp_path = f"{INDEX_VERSION_PATH}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(version))
+            os.replace(tmp_path, INDEX_VERSION_PATH)
+        except OSError as e:
+            logger.warning(f"Could not write index version file {INDEX_VERSION_PATH}: {e}")
+    retrieval_cache.clear()
+    logger.debug(f"Index version bumped to {version}, retrieval cache cleared")
+    return version
+
+
+def cache_stats() -> Dict[str, Dict[str, float]]:
+    """Hit-rate metrics of the query embedding and retrieval caches."""
+    return {"query_embeddings": query_embedding_cache.stats(), "retrieval": retrieval_cache.stats()}
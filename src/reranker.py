@@ -0,0 +1,205 @@
+"""
+Local cross-encoder reranking (FlashRank, ONNX on CPU).
+
+Without a reranker the app compensates for imprecise fusion by sending more
+chunks to the LLM. With RERANK_ENABLED the advanced retriever instead fetches
+RERANK_CANDIDATES fused chunks and a small cross-encoder keeps the best k.
+All candidates are scored in one batch on a dedicated worker thread.
+
+The rerank step must never make a question slower than RERANK_TIMEOUT_MS,
+counted from the moment the request arrives: past that budget (or if flashrank
+/ the model is unavailable) the fusion order is used instead. The model is
+loaded in the background when the retriever is built (warm_ranker), and
+requests arriving before it is ready keep the fusion order rather than wait
+for the load. Inference cannot be interrupted, so a timed-out batch finishes
+in the background and its result is discarded; while it is still running,
+new requests skip reranking instead of queueing behind it on the single
+rerank thread.
+
+Key Components:
+- get_ranker / warm_ranker: Process-wide FlashRank model (None if unavailable), loaded in the background
+- rerank_documents / arerank_documents: Rerank with a time budget, falling back to fusion order
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "ms-marco-TinyBERT-L-2-v2")
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))  # query + chunk tokens (chunks are <= 400)
+RERANK_CACHE_DIR = os.getenv("RERANK_CACHE_DIR", "./.flashrank_cache")
+# Fused chunks handed to the reranker (it keeps the best k of them)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TIMEOUT_MS = float(os.getenv("RERANK_TIMEOUT_MS", "500"))
+
+# One inference at a time: ONNX Runtime already uses all cores for a batch
+_rerank_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+_ranker = None
+_ranker_failed = False
+_ranker_lock = threading.Lock()
+_warmup_thread: Optional[threading.Thread] = None
+_warmup_lock = threading.Lock()
+# Held from submission until a batch finishes, including timed-out batches still running
+_rerank_slot = threading.Lock()
+
+
+def get_ranker(block: bool = True):
+    """
+    Process-wide FlashRank Ranker.
+
+    Args:
+        block: Load the model now if it is not loaded yet. With block=False a
+            missing model is only loaded in the background (warm_ranker) and
+            None is returned, so the request path never waits for the load.
+
+    Returns:
+        The ranker, or None if it is still loading, flashrank is not installed
+        or the model cannot be loaded (logged once; callers then keep the
+        fusion order)
+    """
+    global _ranker, _ranker_failed
+    if _ranker is not None or _ranker_failed:
+        return _ranker
+    if not block:
+        warm_ranker()
+        return None
+    with _ranker_lock:
+        if _ranker is None and not _ranker_failed:
+            start = time.perf_counter()
+            try:
+                from flashrank import Ranker
+
+                _ranker = Ranker(model_name=RERANK_MODEL, cache_dir=RERANK_CACHE_DIR, max_length=RERANK_MAX_LENGTH)
+                elapsed = time.perf_counter() - start
+                logger.info(f"Reranker {RERANK_MODEL} loaded in {elapsed:.3f}s")
+            except Exception as e:
+                _ranker_failed = True
+                logger.warning(f"Reranker unavailable, keeping fusion order: {e}")
+    return _ranker
+
+
+def warm_ranker() -> None:
+    """Start loading the ranker on a background thread (once), e.g. when a reranking retriever is built."""
+    global _warmup_thread
+    if _ranker is not None or _ranker_failed:
+        return
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=get_ranker, name="rerank-warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def _score(ranker, query: str, docs: List[Document]) -> List[Document]:
+    """Score all candidates in one batch and return them best first (with metadata["rerank_score"])."""
+    from flashrank import RerankRequest
+
+    passages = [{"id": i, "text": doc.page_content} for i, doc in enumerate(docs)]
+    ranked = ranker.rerank(RerankRequest(query=query, passages=passages))
+    return [
+        Document(page_content=docs[item["id"]].page_content,
+                 metadata={**docs[item["id"]].metadata, "rerank_score": float(item["score"])})
+        for item in ranked
+    ]
+
+
+def _budget_seconds(timeout_ms: Optional[float], start: float) -> Optional[float]:
+    """Remaining budget of a request that arrived at start (perf_counter)."""
+    timeout_ms = RERANK_TIMEOUT_MS if timeout_ms is None else timeout_ms
+    if timeout_ms <= 0:
+        return None
+    return max(0.0, timeout_ms / 1000 - (time.perf_counter() - start))
+
+
+def _acquire_slot() -> bool:
+    """Reserve the rerank thread; False while a previous (possibly timed-out) batch is still running."""
+    if _rerank_slot.acquire(blocking=False):
+        return True
+    logger.warning("Reranker busy with a previous batch, keeping fusion order")
+    return False
+
+
+def _score_batch(ranker, query: str, docs: List[Document]) -> List[Document]:
+    """_score() on the rerank thread, releasing the slot taken by the submitting request."""
+    try:
+        return _score(ranker, query, docs)
+    finally:
+        _rerank_slot.release()
+
+
+def rerank_documents(query: str, docs: List[Document], top_n: int,
+                     timeout_ms: Optional[float] = None) -> Tuple[List[Document], bool]:
+    """
+    Rerank docs for query with a cross-encoder and keep the top_n.
+
+    Args:
+        query: User question
+        docs: Candidates in fusion order
+        top_n: Documents to return
+        timeout_ms: Time budget (default: RERANK_TIMEOUT_MS; 0 = no limit)
+
+    Returns:
+        (documents, reranked); reranked is False when the fusion order was kept
+        (budget exceeded, reranker unavailable or failed)
+    """
+    start = time.perf_counter()
+    ranker = get_ranker(block=False) if len(docs) > 1 else None
+    if ranker is None or not _acquire_slot():
+        return docs[:top_n], False
+
+    try:
+        future = _rerank_executor.submit(_score_batch, ranker, query, docs)
+    except Exception:
+        _rerank_slot.release()
+        raise
+    try:
+        ranked = future.result(timeout=_budget_seconds(timeout_ms, start))
+    except FutureTimeoutError:
+        elapsed = time.perf_counter() - start
+        logger.warning(f"Reranking exceeded its budget after {elapsed:.3f}s, keeping fusion order")
+        return docs[:top_n], False
+    except Exception as e:
+        logger.warning(f"Reranking failed, keeping fusion order: {e}")
+        return docs[:top_n], False
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Reranking completed in {elapsed:.3f}s, scored {len(docs)} candidates, returning {min(top_n, len(ranked))} documents")
+    return ranked[:top_n], True
+
+
+async def arerank_documents(query: str, docs: List[Document], top_n: int,
+                            timeout_ms: Optional[float] = None) -> Tuple[List[Document], bool]:
+    """Async rerank_documents(): inference runs on the rerank thread while the event loop waits."""
+    start = time.perf_counter()
+    ranker = get_ranker(block=False) if len(docs) > 1 else None
+    if ranker is None or not _acquire_slot():
+        return docs[:top_n], False
+
+    try:
+        future = asyncio.get_running_loop().run_in_executor(_rerank_executor, _score_batch, ranker, query, docs)
+    except Exception:
+        _rerank_slot.release()
+        raise
+    try:
+        ranked = await asyncio.wait_for(asyncio.shield(future), timeout=_budget_seconds(timeout_ms, start))
+    except asyncio.TimeoutError:
+        elapsed = time.perf_counter() - start
+        logger.warning(f"Async reranking exceeded its budget after {elapsed:.3f}s, keeping fusion order")
+        return docs[:top_n], False
+    except Exception as e:
+        logger.warning(f"Async reranking failed, keeping fusion order: {e}")
+        return docs[:top_n], False
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Async reranking completed in {elapsed:.3f}s, scored {len(docs)} candidates, returning {min(top_n, len(ranked))} documents")
+    return ranked[:top_n], True
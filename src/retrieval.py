@@ -1,14 +1,23 @@
+import asyncio
+import contextvars
+import json
 import os
 import time
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from langchain_milvus import Milvus
-from langchain_community.retrievers import BM25Retriever
 from langchain_classic.retrievers.ensemble import EnsembleRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
 from dotenv import load_dotenv
-from src.tracked_embeddings import TrackedOpenAIEmbeddings
+from src.clients import get_embeddings, get_llm
+from src.active_index import get_active_index
+from src.bm25_index import MIN_CHUNK_CHARS, BM25Index
+from src.chunk_ids import get_chunk_id
+from src.local_vectorstore import VECTOR_BACKEND, LocalVectorStore
+from src.reranker import RERANK_CANDIDATES, RERANK_ENABLED, RERANK_TIMEOUT_MS, arerank_documents, rerank_documents, warm_ranker
+from src.query_cache import RETRIEVAL_CACHE_SIZE, get_index_version, normalize_query, retrieval_cache
 from src.logging_config import get_logger
 
 load_dotenv()
@@ -17,17 +26,40 @@ logger = get_logger(__name__)
 
 MILVUS_URI = "./milvus_vectorstore.db"
 
+# Reciprocal-rank fusion constant (the usual 60 from Cormack et al.): larger
+# values flatten the advantage of top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Adaptive multi-query expansion: the original query is retrieved first and
+# query variations are only generated when its hybrid results look weak
+MULTI_QUERY_ADAPTIVE = os.getenv("MULTI_QUERY_ADAPTIVE", "false").lower() == "true"
+MULTI_QUERY_VARIATIONS = int(os.getenv("MULTI_QUERY_VARIATIONS", "3"))
+# Fused score of the top hit relative to the best possible (1.0 = rank 1 in both legs)
+ADAPTIVE_MIN_TOP_SCORE = float(os.getenv("ADAPTIVE_MIN_TOP_SCORE", "0.9"))
+# Share of the top ADAPTIVE_AGREEMENT_DEPTH chunks that BM25 and vector search both returned
+ADAPTIVE_MIN_AGREEMENT = float(os.getenv("ADAPTIVE_MIN_AGREEMENT", "0.4"))
+ADAPTIVE_AGREEMENT_DEPTH = int(os.getenv("ADAPTIVE_AGREEMENT_DEPTH", "5"))
+# Gap between the first and second fused score, relative to the best possible (0 = not checked)
+ADAPTIVE_MIN_MARGIN = float(os.getenv("ADAPTIVE_MIN_MARGIN", "0.0"))
+
+# Runs the vector leg of hybrid retrieval next to the BM25 leg. Shared across
+# queries so no thread is spawned per retrieval; multi-query expansion issues
+# several retrievals per question, hence a few workers.
+_retrieval_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+
 
 def get_vectorstore():
-    embeddings = TrackedOpenAIEmbeddings(
-        model="qwen/qwen3-embedding-8b",
-        base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
-        api_key=os.getenv("OPENAI_API_KEY"),
-    )
-    vectorstore = Milvus(
-        embedding_function=embeddings,
-        connection_args={"uri": MILVUS_URI},
-    )
+    embeddings = get_embeddings()
+    # Served generation; ingestion builds new ones next to it and switches atomically
+    location = get_active_index()
+    if VECTOR_BACKEND == "local":
+        vectorstore = LocalVectorStore(embedding_function=embeddings, path=location.local_dir)
+    else:
+        vectorstore = Milvus(
+            embedding_function=embeddings,
+            connection_args={"uri": MILVUS_URI},
+            collection_name=location.collection,
+        )
 
     # Monkey-patch similarity_search to add timing instrumentation
     original_search = vectorstore.similarity_search
@@ -36,11 +68,23 @@ def get_vectorstore():
         start = time.perf_counter()
         result = original_search(*args, **kwargs)
         elapsed = time.perf_counter() - start
-        logger.info(f"Milvus query completed in {elapsed:.3f}s, retrieved {len(result)} documents")
+        logger.info(f"Vector store ({VECTOR_BACKEND}) query completed in {elapsed:.3f}s, retrieved {len(result)} documents")
         return result
 
     vectorstore.similarity_search = timed_search
 
+    # Same for the native async path (used by ainvoke)
+    original_asearch = vectorstore.asimilarity_search
+
+    async def timed_asearch(*args, **kwargs):
+        start = time.perf_counter()
+        result = await original_asearch(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Vector store ({VECTOR_BACKEND}) async query completed in {elapsed:.3f}s, retrieved {len(result)} documents")
+        return result
+
+    vectorstore.asimilarity_search = timed_asearch
+
     return vectorstore
 
 def get_retriever(k: int = 3, filter: dict = None):
@@ -51,106 +95,492 @@ def get_retriever(k: int = 3, filter: dict = None):
     return vectorstore.as_retriever(search_type="similarity", search_kwargs=search_kwargs)
 
 def get_bm25_retriever(docs, k: int = 3):
-    return BM25Retriever.from_documents(docs, k=k)
+    """BM25 retriever over docs, scored by the vectorized postings engine (see src.bm25_index)."""
+    return BM25Index(docs).as_retriever(k=k)
+
+
+def source_filter_expr(sources: Optional[List[str]], base_expr: Optional[str] = None) -> Optional[str]:
+    """
+    Milvus boolean expression restricting a search to the given documents.
+
+    Args:
+        sources: Doc keys (file basenames) to search, None for no restriction
+        base_expr: Expression already configured on the retriever, ANDed in
+
+    Returns:
+        Combined expression, or base_expr when sources is None
+    """
+    if sources is None:
+        return base_expr
+    expr = f"doc_key in {json.dumps(list(sources))}"
+    return f"({base_expr}) and ({expr})" if base_expr else expr
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], weights: Optional[List[float]] = None,
+                           limit: Optional[int] = None, rrf_k: int = RRF_K) -> List[Document]:
+    """
+    Fuse ranked lists with (weighted) reciprocal-rank fusion over chunk IDs.
+
+    A chunk scores sum(weight / (rrf_k + rank)) over the lists it appears in
+    (rank starting at 1), so the same chunk returned by several retrievers or
+    query variations appears once and ranks higher. Ties keep first-seen order.
+
+    Args:
+        result_lists: Ranked document lists
+        weights: Per-list weights (default: 1.0 each)
+        limit: Truncate the fused list to this many chunks (None = keep all)
+        rrf_k: RRF rank constant
+
+    Returns:
+        Deduplicated documents by descending fused score
+    """
+    return [doc for doc, _ in _rrf_scores(result_lists, weights, rrf_k)[:limit]]
+
+
+def _rrf_scores(result_lists: List[List[Document]], weights: Optional[List[float]] = None,
+                rrf_k: int = RRF_K) -> List[Tuple[Document, float]]:
+    """(document, fused score) pairs of reciprocal_rank_fusion(), best first."""
+    weights = weights or [1.0] * len(result_lists)
+    fused = {}
+    for docs, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(docs, start=1):
+            chunk_id = get_chunk_id(doc)
+            if chunk_id in fused:
+                fused[chunk_id][1] += weight / (rrf_k + rank)
+            else:
+                fused[chunk_id] = [doc, weight / (rrf_k + rank)]
+
+    # sorted() is stable, so equal scores stay in first-seen order
+    return [(doc, score) for doc, score in sorted(fused.values(), key=lambda item: item[1], reverse=True)]
+
+
+def retrieval_confidence(bm25_docs: List[Document], vector_docs: List[Document],
+                         weights: Optional[List[float]] = None, depth: int = ADAPTIVE_AGREEMENT_DEPTH,
+                         rrf_k: int = RRF_K) -> dict:
+    """
+    Confidence signals of a hybrid result, from the ranks of its two legs.
+
+    Ranks rather than raw scores, so the signals mean the same for BM25,
+    Milvus and the local vector store:
+    - top_score: fused score of the top hit / best possible (1.0 = rank 1 in both legs)
+    - margin: (first - second fused score) / best possible
+    - agreement: share of the top `depth` chunks of each leg that both legs returned
+
+    Returns:
+        {"top_score", "margin", "agreement"}, all in [0, 1] (0 for empty results)
+    """
+    weights = weights or [1.0, 1.0]
+    best = sum(weights) / (rrf_k + 1)
+    scores = [score for _, score in _rrf_scores([bm25_docs, vector_docs], weights, rrf_k)]
+    top_score = scores[0] / best if scores else 0.0
+    margin = (scores[0] - scores[1]) / best if len(scores) > 1 else top_score
+
+    bm25_ids = {get_chunk_id(doc) for doc in bm25_docs[:depth]}
+    vector_ids = {get_chunk_id(doc) for doc in vector_docs[:depth]}
+    agreement = len(bm25_ids & vector_ids) / max(min(len(bm25_ids), len(vector_ids)), 1)
+    return {"top_score": top_score, "margin": margin, "agreement": agreement}
 
 
 class TimedEnsembleRetriever(BaseRetriever):
-    """Wrapper around EnsembleRetriever that times BM25 vs Vector retrieval separately."""
+    """
+    Wrapper around EnsembleRetriever that times BM25 vs Vector retrieval separately.
+
+    Pass sources=[doc_key, ...] to invoke()/ainvoke() to search only those
+    documents: it becomes a Milvus filter expression for the vector leg and a
+    pre-top-k mask for BM25, so the cached retriever serves any selection.
+
+    The two legs are fused with reciprocal-rank fusion over chunk IDs and the
+    fused list is truncated to k (if set).
+    """
 
     bm25_retriever: BaseRetriever
     vector_retriever: BaseRetriever
     weights: List[float]
+    k: Optional[int] = None
 
     class Config:
         arbitrary_types_allowed = True
 
     def _get_relevant_documents(
-        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
     ) -> List[Document]:
-        """Time each retriever separately and merge results."""
-        logger.debug("Starting ensemble retrieval")
+        """Run BM25 and vector retrieval concurrently, time each leg and merge results."""
+        return self._retrieve(query, sources, self.k)[0]
 
-        # Time BM25 retrieval
-        logger.debug("BM25 retrieval starting")
-        bm25_start = time.perf_counter()
-        bm25_docs = self.bm25_retriever.invoke(query)
-        bm25_elapsed = time.perf_counter() - bm25_start
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        """Async variant: both legs are awaited together, then timed and merged as above."""
+        return (await self._aretrieve(query, sources, self.k))[0]
+
+    def retrieve_with_confidence(self, query: str,
+                                 sources: Optional[List[str]] = None) -> Tuple[List[Document], dict]:
+        """
+        Hybrid retrieval for one query plus its confidence signals (see retrieval_confidence).
+
+        Returns:
+            (fused documents, not truncated to k; signals)
+        """
+        docs, legs = self._retrieve(query, sources)
+        return docs, retrieval_confidence(*legs, weights=self.weights)
+
+    async def aretrieve_with_confidence(self, query: str,
+                                        sources: Optional[List[str]] = None) -> Tuple[List[Document], dict]:
+        """Async retrieve_with_confidence()."""
+        docs, legs = await self._aretrieve(query, sources)
+        return docs, retrieval_confidence(*legs, weights=self.weights)
+
+    def _retrieve(self, query: str, sources: Optional[List[str]], limit: Optional[int] = None
+                  ) -> Tuple[List[Document], Tuple[List[Document], List[Document]]]:
+        """Fused results truncated to limit, and the (BM25, vector) results they were fused from."""
+        logger.debug("Starting ensemble retrieval")
+        wall_start = time.perf_counter()
+        bm25_kwargs, vector_kwargs = self._filter_kwargs(sources)
+
+        def timed_invoke(retriever: BaseRetriever, **kwargs) -> Tuple[List[Document], float]:
+            start = time.perf_counter()
+            docs = retriever.invoke(query, **kwargs)
+            return docs, time.perf_counter() - start
+
+        # Vector leg (embedding round trip + Milvus) in the background,
+        # BM25 (local, CPU-only) on this thread meanwhile. The worker runs in a
+        # copy of this context so tracing and usage scopes still apply.
+        logger.debug("Vector and BM25 retrieval starting")
+        vector_future = _retrieval_executor.submit(
+            contextvars.copy_context().run, timed_invoke, self.vector_retriever, **vector_kwargs
+        )
+        bm25_docs, bm25_elapsed = timed_invoke(self.bm25_retriever, **bm25_kwargs)
         logger.info(f"BM25 retrieval completed in {bm25_elapsed:.3f}s, retrieved {len(bm25_docs)} documents")
 
-        # Time vector retrieval (includes embedding + Milvus)
-        logger.debug("Vector retrieval starting")
-        vector_start = time.perf_counter()
-        vector_docs = self.vector_retriever.invoke(query)
-        vector_elapsed = time.perf_counter() - vector_start
+        vector_docs, vector_elapsed = vector_future.result()
         logger.info(f"Vector retrieval completed in {vector_elapsed:.3f}s, retrieved {len(vector_docs)} documents")
 
         # Merge results (simplified - just combine and deduplicate)
         logger.debug("Merging ensemble results")
         merge_start = time.perf_counter()
+        result = self._merge(bm25_docs, vector_docs, limit)
+        merge_elapsed = time.perf_counter() - merge_start
+        logger.debug(f"Ensemble merging completed in {merge_elapsed:.3f}s")
+
+        wall_elapsed = time.perf_counter() - wall_start
+        sum_elapsed = bm25_elapsed + vector_elapsed + merge_elapsed
+        logger.info(f"Ensemble retrieval completed in {wall_elapsed:.3f}s (BM25: {bm25_elapsed:.3f}s, Vector: {vector_elapsed:.3f}s, Merge: {merge_elapsed:.3f}s; "
+                    f"wall {wall_elapsed:.3f}s vs sum {sum_elapsed:.3f}s, {max(sum_elapsed - wall_elapsed, 0.0):.3f}s overlapped)")
+
+        return result, (bm25_docs, vector_docs)
+
+    async def _aretrieve(self, query: str, sources: Optional[List[str]], limit: Optional[int] = None
+                         ) -> Tuple[List[Document], Tuple[List[Document], List[Document]]]:
+        """Async _retrieve()."""
+        logger.debug("Starting async ensemble retrieval")
+        wall_start = time.perf_counter()
+        bm25_kwargs, vector_kwargs = self._filter_kwargs(sources)
+
+        async def timed_ainvoke(retriever: BaseRetriever, **kwargs) -> Tuple[List[Document], float]:
+            start = time.perf_counter()
+            docs = await retriever.ainvoke(query, **kwargs)
+            return docs, time.perf_counter() - start
+
+        # The vector leg awaits the embedding API and Milvus natively; BM25 has
+        # no async implementation, so its ainvoke runs it in an executor thread
+        (bm25_docs, bm25_elapsed), (vector_docs, vector_elapsed) = await asyncio.gather(
+            timed_ainvoke(self.bm25_retriever, **bm25_kwargs), timed_ainvoke(self.vector_retriever, **vector_kwargs)
+        )
+        logger.info(f"BM25 retrieval completed in {bm25_elapsed:.3f}s, retrieved {len(bm25_docs)} documents")
+        logger.info(f"Vector retrieval completed in {vector_elapsed:.3f}s, retrieved {len(vector_docs)} documents")
+
+        merge_start = time.perf_counter()
+        result = self._merge(bm25_docs, vector_docs, limit)
+        merge_elapsed = time.perf_counter() - merge_start
+
+        wall_elapsed = time.perf_counter() - wall_start
+        sum_elapsed = bm25_elapsed + vector_elapsed + merge_elapsed
+        logger.info(f"Async ensemble retrieval completed in {wall_elapsed:.3f}s (BM25: {bm25_elapsed:.3f}s, Vector: {vector_elapsed:.3f}s, Merge: {merge_elapsed:.3f}s; "
+                    f"wall {wall_elapsed:.3f}s vs sum {sum_elapsed:.3f}s, {max(sum_elapsed - wall_elapsed, 0.0):.3f}s overlapped)")
+
+        return result, (bm25_docs, vector_docs)
+
+    def _filter_kwargs(self, sources: Optional[List[str]]) -> Tuple[dict, dict]:
+        """Per-leg invoke() kwargs for a source filter: (BM25, vector)."""
+        if sources is None:
+            return {}, {}
+        return {"sources": sources}, _vector_filter_kwargs(self.vector_retriever, sources)
+
+    def _merge(self, bm25_docs: List[Document], vector_docs: List[Document],
+               limit: Optional[int] = None) -> List[Document]:
+        """Weighted reciprocal-rank fusion of the two legs."""
+        return reciprocal_rank_fusion([bm25_docs, vector_docs], self.weights, limit=limit)
+
+    def retrieve_batch(self, queries: List[str], sources: Optional[List[str]] = None) -> List[List[Document]]:
+        """
+        Hybrid retrieval for several queries with one embedding request and one Milvus search.
+
+        All queries are embedded in a single embed_documents() call and searched
+        together as a Milvus multi-vector search (in the background), while BM25
+        scores them all in one pass on this thread. Falls back to concurrent
+        per-query vector retrieval when the vector retriever does not support
+        batching.
+
+        Args:
+            queries: Query strings (e.g. multi-query variations)
+            sources: Doc keys to restrict the search to (None = all documents)
+
+        Returns:
+            Fused results, one list per query in input order. They are not
+            truncated to k: callers fusing several queries truncate once, at the end.
+        """
+        wall_start = time.perf_counter()
+        vector_future = _retrieval_executor.submit(
+            contextvars.copy_context().run, _vector_search_batch, self.vector_retriever, queries, sources
+        )
 
-        # Weight and merge documents
-        doc_dict = {}
-
-        # Add BM25 docs with weight
-        for i, doc in enumerate(bm25_docs):
-            doc_id = id(doc)
-            doc_dict[doc_id] = (doc, self.weights[0] * (1 / (i + 1)))
-
-        # Add vector docs with weight
-        for i, doc in enumerate(vector_docs):
-            doc_id = id(doc)
-            if doc_id in doc_dict:
-                # Already exists, add weight
-                existing_doc, existing_score = doc_dict[doc_id]
-                doc_dict[doc_id] = (existing_doc, existing_score + self.weights[1] * (1 / (i + 1)))
+        bm25_start = time.perf_counter()
+        bm25_kwargs, _ = self._filter_kwargs(sources)
+        if hasattr(self.bm25_retriever, "search_batch"):
+            bm25_results = self.bm25_retriever.search_batch(queries, **bm25_kwargs)
+        else:
+            bm25_results = [self.bm25_retriever.invoke(query, **bm25_kwargs) for query in queries]
+        bm25_elapsed = time.perf_counter() - bm25_start
+        logger.info(f"BM25 retrieval for {len(queries)} queries completed in {bm25_elapsed:.3f}s, "
+                    f"retrieved {[len(docs) for docs in bm25_results]} documents")
+
+        vector_results, vector_elapsed = vector_future.result()
+        results = [self._merge(bm25_docs, vector_docs)
+                   for bm25_docs, vector_docs in zip(bm25_results, vector_results)]
+
+        wall_elapsed = time.perf_counter() - wall_start
+        logger.info(f"Batched ensemble retrieval for {len(queries)} queries completed in {wall_elapsed:.3f}s "
+                    f"(BM25: {bm25_elapsed:.3f}s, Vector: {vector_elapsed:.3f}s)")
+        return results
+
+    async def aretrieve_batch(self, queries: List[str],
+                              sources: Optional[List[str]] = None) -> List[List[Document]]:
+        """Async retrieve_batch(): one aembed_documents call and one async Milvus search."""
+        wall_start = time.perf_counter()
+        bm25_kwargs, _ = self._filter_kwargs(sources)
+
+        async def bm25_leg() -> Tuple[List[List[Document]], float]:
+            start = time.perf_counter()
+            if hasattr(self.bm25_retriever, "search_batch"):
+                docs = await asyncio.to_thread(self.bm25_retriever.search_batch, queries, **bm25_kwargs)
             else:
-                doc_dict[doc_id] = (doc, self.weights[1] * (1 / (i + 1)))
+                docs = await self.bm25_retriever.abatch(queries, **bm25_kwargs)
+            return docs, time.perf_counter() - start
+
+        (bm25_results, bm25_elapsed), (vector_results, vector_elapsed) = await asyncio.gather(
+            bm25_leg(), _avector_search_batch(self.vector_retriever, queries, sources)
+        )
+        logger.info(f"BM25 retrieval for {len(queries)} queries completed in {bm25_elapsed:.3f}s, "
+                    f"retrieved {[len(docs) for docs in bm25_results]} documents")
+        results = [self._merge(bm25_docs, vector_docs)
+                   for bm25_docs, vector_docs in zip(bm25_results, vector_results)]
+
+        wall_elapsed = time.perf_counter() - wall_start
+        logger.info(f"Async batched ensemble retrieval for {len(queries)} queries completed in {wall_elapsed:.3f}s "
+                    f"(BM25: {bm25_elapsed:.3f}s, Vector: {vector_elapsed:.3f}s)")
+        return results
+
+
+def _milvus_search_batch(vectorstore: Milvus, vectors: List[List[float]], k: int,
+                         expr: Optional[str] = None) -> List[List[Document]]:
+    """One Milvus search request for several query vectors (nq > 1)."""
+    if vectorstore.col is None:
+        return [[] for _ in vectors]
+    results = vectorstore.client.search(
+        vectorstore.collection_name, data=vectors, **_milvus_search_kwargs(vectorstore, k, expr)
+    )
+    return [[vectorstore._parse_document(hit["entity"]) for hit in hits] for hits in results]
+
+
+def _milvus_search_kwargs(vectorstore: Milvus, k: int, expr: Optional[str]) -> dict:
+    return {
+        "anns_field": vectorstore._vector_field,
+        "search_params": vectorstore._as_list(vectorstore.search_params)[0],
+        "limit": k,
+        "filter": expr,
+        "output_fields": vectorstore._get_output_fields(),
+        "timeout": vectorstore.timeout,
+    }
+
+
+async def _amilvus_search_batch(vectorstore: Milvus, vectors: List[List[float]], k: int,
+                                expr: Optional[str] = None) -> List[List[Document]]:
+    """Async _milvus_search_batch() on the vectorstore's AsyncMilvusClient."""
+    if vectorstore.col is None:
+        return [[] for _ in vectors]
+    results = await vectorstore.aclient.search(
+        vectorstore.collection_name, data=vectors, **_milvus_search_kwargs(vectorstore, k, expr)
+    )
+    return [[vectorstore._parse_document(hit["entity"]) for hit in hits] for hits in results]
 
-        # Sort by score and return
-        sorted_docs = sorted(doc_dict.values(), key=lambda x: x[1], reverse=True)
-        result = [doc for doc, score in sorted_docs]
 
-        merge_elapsed = time.perf_counter() - merge_start
-        logger.debug(f"Ensemble merging completed in {merge_elapsed:.3f}s")
+def _vector_filter_kwargs(vector_retriever: BaseRetriever, sources: Optional[List[str]]) -> dict:
+    """Vector retriever invoke() kwargs for a source filter: a Milvus expr ANDed with the configured one."""
+    if sources is None:
+        return {}
+    base_expr = getattr(vector_retriever, "search_kwargs", {}).get("expr")
+    return {"expr": source_filter_expr(sources, base_expr)}
 
-        total_elapsed = bm25_elapsed + vector_elapsed + merge_elapsed
-        logger.info(f"Ensemble retrieval completed in {total_elapsed:.3f}s (BM25: {bm25_elapsed:.3f}s, Vector: {vector_elapsed:.3f}s, Merge: {merge_elapsed:.3f}s)")
 
-        return result
+def _vector_search_batch(vector_retriever: BaseRetriever, queries: List[str],
+                         sources: Optional[List[str]] = None) -> Tuple[List[List[Document]], float]:
+    """
+    Vector leg of batched hybrid retrieval.
 
+    Args:
+        vector_retriever: Retriever of the vector leg
+        queries: Query strings
+        sources: Doc keys to restrict the search to (None = all documents)
 
-def get_ensemble_retriever(k: int = 3, filter: dict = None):
-    # Fetch all documents from Milvus for BM25 (avoids re-processing PDFs)
-    vectorstore = get_vectorstore()
+    Returns:
+        (documents per query, elapsed seconds)
+    """
+    start = time.perf_counter()
+    vectorstore = getattr(vector_retriever, "vectorstore", None)
+    search_kwargs = dict(getattr(vector_retriever, "search_kwargs", {}))
+    k = search_kwargs.pop("k", 4)
+    expr = source_filter_expr(sources, search_kwargs.pop("expr", None))
+
+    if isinstance(vectorstore, (Milvus, LocalVectorStore)) and not search_kwargs:
+        try:
+            embed_start = time.perf_counter()
+            vectors = vectorstore.embeddings.embed_documents(queries)
+            embed_elapsed = time.perf_counter() - embed_start
+            if isinstance(vectorstore, LocalVectorStore):
+                results = vectorstore.search_batch(vectors, k, expr)
+            else:
+                results = _milvus_search_batch(vectorstore, vectors, k, expr)
+            elapsed = time.perf_counter() - start
+            logger.info(f"Vector retrieval for {len(queries)} queries completed in {elapsed:.3f}s "
+                        f"(embed: {embed_elapsed:.3f}s, search: {elapsed - embed_elapsed:.3f}s), "
+                        f"retrieved {[len(docs) for docs in results]} documents")
+            return results, elapsed
+        except Exception as e:
+            logger.warning(f"Batched vector search failed, retrieving per query instead: {e}")
+
+    # Runnable.batch runs the queries concurrently on a thread pool
+    results = vector_retriever.batch(queries, **({} if sources is None else {"expr": expr}))
+    return results, time.perf_counter() - start
+
+
+async def _avector_search_batch(vector_retriever: BaseRetriever, queries: List[str],
+                                sources: Optional[List[str]] = None) -> Tuple[List[List[Document]], float]:
+    """Async _vector_search_batch()."""
+    start = time.perf_counter()
+    vectorstore = getattr(vector_retriever, "vectorstore", None)
+    search_kwargs = dict(getattr(vector_retriever, "search_kwargs", {}))
+    k = search_kwargs.pop("k", 4)
+    expr = source_filter_expr(sources, search_kwargs.pop("expr", None))
+
+    if isinstance(vectorstore, (Milvus, LocalVectorStore)) and not search_kwargs:
+        try:
+            embed_start = time.perf_counter()
+            vectors = await vectorstore.embeddings.aembed_documents(queries)
+            embed_elapsed = time.perf_counter() - embed_start
+            if isinstance(vectorstore, LocalVectorStore):
+                results = await asyncio.to_thread(vectorstore.search_batch, vectors, k, expr)
+            else:
+                results = await _amilvus_search_batch(vectorstore, vectors, k, expr)
+            elapsed = time.perf_counter() - start
+            logger.info(f"Async vector retrieval for {len(queries)} queries completed in {elapsed:.3f}s "
+                        f"(embed: {embed_elapsed:.3f}s, search: {elapsed - embed_elapsed:.3f}s), "
+                        f"retrieved {[len(docs) for docs in results]} documents")
+            return results, elapsed
+        except Exception as e:
+            logger.warning(f"Async batched vector search failed, retrieving per query instead: {e}")
+
+    results = await vector_retriever.abatch(queries, **({} if sources is None else {"expr": expr}))
+    return results, time.perf_counter() - start
+
+
+def _load_bm25_docs_from_milvus(vectorstore) -> List[Document]:
+    """
+    Legacy BM25 corpus source for collections ingested before the BM25 index existed.
+
+    Costs an embedding call plus a collection scan, and is capped at 10k chunks.
+    """
+    # Retrieve all documents from Milvus by querying with a dummy query and large k
+    # Note: This is a workaround since Milvus doesn't have a native "get all docs" method
+    # Future: Upgrade to Milvus Standalone (Docker) for native sparse vector (BM25) support.
+    # Milvus Lite does NOT support native BM25 yet.
+    docs = vectorstore.similarity_search("", k=10000)  # Fetch up to 10k chunks
 
-    try:
-        # Retrieve all documents from Milvus by querying with a dummy query and large k
-        # Note: This is a workaround since Milvus doesn't have a native "get all docs" method
-        # For large collections, consider implementing pagination or a document cache
-        # Future: Upgrade to Milvus Standalone (Docker) for native sparse vector (BM25) support.
-        # Milvus Lite does NOT support native BM25 yet.
-        docs = vectorstore.similarity_search("", k=10000)  # Fetch up to 10k chunks
+    # Filter empty chunks
+    return [d for d in docs if d.page_content and len(d.page_content.strip()) > MIN_CHUNK_CHARS]
 
-        # Filter empty chunks
-        docs = [d for d in docs if d.page_content and len(d.page_content.strip()) > 10]
 
-        if not docs:
-            logger.warning("No documents found in Milvus for BM25, falling back to vector retriever only")
-            return get_retriever(k=k, filter=filter)
+class SourceFilteredRetriever(BaseRetriever):
+    """
+    Vector-only retriever accepting the same sources=[doc_key, ...] kwarg as TimedEnsembleRetriever.
+
+    Used when hybrid retrieval is unavailable (no BM25 corpus): a plain
+    VectorStoreRetriever would not turn sources into a Milvus filter
+    expression, so deselected documents would be searched too.
+    """
+
+    vector_retriever: BaseRetriever
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        return self.vector_retriever.invoke(query, **_vector_filter_kwargs(self.vector_retriever, sources))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        return await self.vector_retriever.ainvoke(query, **_vector_filter_kwargs(self.vector_retriever, sources))
+
+    def retrieve_batch(self, queries: List[str], sources: Optional[List[str]] = None) -> List[List[Document]]:
+        """Vector search for several queries with one embedding request (see _vector_search_batch)."""
+        return _vector_search_batch(self.vector_retriever, queries, sources)[0]
 
-        logger.info(f"Loaded {len(docs)} chunks from Milvus for BM25 retriever")
+    async def aretrieve_batch(self, queries: List[str],
+                              sources: Optional[List[str]] = None) -> List[List[Document]]:
+        """Async retrieve_batch()."""
+        return (await _avector_search_batch(self.vector_retriever, queries, sources))[0]
 
-    except Exception as e:
-        logger.error(f"Failed to fetch documents from Milvus for BM25: {e}", exc_info=True)
-        logger.warning("Falling back to vector retriever only")
-        return get_retriever(k=k, filter=filter)
 
-    try:
-        bm25_retriever = get_bm25_retriever(docs, k=k)
-    except Exception as e:
-        logger.error(f"Failed to initialize BM25Retriever: {e}", exc_info=True)
-        logger.warning("Falling back to vector retriever only")
-        return get_retriever(k=k, filter=filter)
+def _vector_only_retriever(k: int, filter: Optional[dict]) -> SourceFilteredRetriever:
+    return SourceFilteredRetriever.construct(vector_retriever=get_retriever(k=k, filter=filter))
+
+
+def get_ensemble_retriever(k: int = 3, filter: dict = None):
+    # Prefer the BM25 index persisted by ingestion; loading it needs no API call
+    bm25_index = BM25Index.load(get_active_index().bm25_path)
+    if bm25_index is not None and len(bm25_index) > 0:
+        bm25_retriever = bm25_index.as_retriever(k=k)
+    else:
+        logger.warning("No prebuilt BM25 index found (re-run ingestion to build it), "
+                       "loading BM25 corpus from Milvus instead")
+        vectorstore = get_vectorstore()
+
+        try:
+            docs = _load_bm25_docs_from_milvus(vectorstore)
+
+            if not docs:
+                logger.warning("No documents found in Milvus for BM25, falling back to vector retriever only")
+                return _vector_only_retriever(k, filter)
+
+            logger.info(f"Loaded {len(docs)} chunks from Milvus for BM25 retriever")
+
+        except Exception as e:
+            logger.error(f"Failed to fetch documents from Milvus for BM25: {e}", exc_info=True)
+            logger.warning("Falling back to vector retriever only")
+            return _vector_only_retriever(k, filter)
+
+        try:
+            bm25_retriever = get_bm25_retriever(docs, k=k)
+        except Exception as e:
+            logger.error(f"Failed to initialize BM25Retriever: {e}", exc_info=True)
+            logger.warning("Falling back to vector retriever only")
+            return _vector_only_retriever(k, filter)
 
     vector_retriever = get_retriever(k=k, filter=filter)
 
@@ -159,36 +589,135 @@ def get_ensemble_retriever(k: int = 3, filter: dict = None):
     ensemble_retriever = TimedEnsembleRetriever.construct(
         bm25_retriever=bm25_retriever,
         vector_retriever=vector_retriever,
-        weights=[0.5, 0.5]
+        weights=[0.5, 0.5],
+        k=k,
     )
     return ensemble_retriever
 
 from langchain_classic.retrievers.multi_query import MultiQueryRetriever
-from langchain_openai import ChatOpenAI
 
 
 class TimedMultiQueryRetriever(BaseRetriever):
-    """Wrapper around MultiQueryRetriever that times query generation and per-variation retrieval."""
+    """
+    Wrapper around MultiQueryRetriever that times query generation and per-variation retrieval.
+
+    A sources=[doc_key, ...] kwarg to invoke()/ainvoke() is passed down to the
+    base retriever for every variation.
+
+    Variation results are fused with reciprocal-rank fusion over chunk IDs, so a
+    chunk found by several variations appears once, and then truncated to k (if set).
+
+    In adaptive mode the original query is retrieved first (hybrid base
+    retriever only). If its confidence signals (see retrieval_confidence) all
+    clear their thresholds, its results are returned without generating
+    variations (fast path); otherwise num_variations variations are generated,
+    retrieved and fused together with the original results (expanded path).
+    """
 
     base_retriever: BaseRetriever
     llm: object  # ChatOpenAI instance
+    k: Optional[int] = None
+    num_variations: int = MULTI_QUERY_VARIATIONS
+    adaptive: bool = MULTI_QUERY_ADAPTIVE
+    min_top_score: float = ADAPTIVE_MIN_TOP_SCORE
+    min_agreement: float = ADAPTIVE_MIN_AGREEMENT
+    min_margin: float = ADAPTIVE_MIN_MARGIN
 
     class Config:
         arbitrary_types_allowed = True
 
     def _get_relevant_documents(
-        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
     ) -> List[Document]:
         """Time query generation and each variation's retrieval."""
+        filter_kwargs = {} if sources is None else {"sources": sources}
+
+        original = None
+        if self.adaptive and hasattr(self.base_retriever, "retrieve_with_confidence"):
+            original_start = time.perf_counter()
+            docs, confidence = self.base_retriever.retrieve_with_confidence(query, **filter_kwargs)
+            original = (query, docs, confidence, time.perf_counter() - original_start)
+            if self._is_confident(confidence):
+                return self._fast_path(*original)
+
         logger.debug("Generating query variations for multi-query retrieval")
 
+        # Time query generation
+        gen_start = time.perf_counter()
+        response = self.llm.invoke(self._format_prompt(query, self.num_variations))
+        gen_elapsed = time.perf_counter() - gen_start
+        queries = self._parse_queries(response, gen_elapsed, self.num_variations)
+
+        # Retrieve all variations together: one embedding request and one
+        # Milvus multi-vector search for the hybrid retriever, otherwise
+        # concurrent per-variation retrieval
+        retrieval_start = time.perf_counter()
+        if hasattr(self.base_retriever, "retrieve_batch"):
+            results = self.base_retriever.retrieve_batch(queries, **filter_kwargs)
+        else:
+            results = self.base_retriever.batch(queries, **filter_kwargs)
+        total_retrieval_time = time.perf_counter() - retrieval_start
+
+        return self._collect(queries, results, gen_elapsed, total_retrieval_time, original)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        """Async variant: awaits the LLM for query generation and the batched retrieval."""
+        filter_kwargs = {} if sources is None else {"sources": sources}
+
+        original = None
+        if self.adaptive and hasattr(self.base_retriever, "aretrieve_with_confidence"):
+            original_start = time.perf_counter()
+            docs, confidence = await self.base_retriever.aretrieve_with_confidence(query, **filter_kwargs)
+            original = (query, docs, confidence, time.perf_counter() - original_start)
+            if self._is_confident(confidence):
+                return self._fast_path(*original)
+
+        logger.debug("Generating query variations for async multi-query retrieval")
+
+        gen_start = time.perf_counter()
+        response = await self.llm.ainvoke(self._format_prompt(query, self.num_variations))
+        gen_elapsed = time.perf_counter() - gen_start
+        queries = self._parse_queries(response, gen_elapsed, self.num_variations)
+
+        retrieval_start = time.perf_counter()
+        if hasattr(self.base_retriever, "aretrieve_batch"):
+            results = await self.base_retriever.aretrieve_batch(queries, **filter_kwargs)
+        else:
+            results = await self.base_retriever.abatch(queries, **filter_kwargs)
+        total_retrieval_time = time.perf_counter() - retrieval_start
+
+        return self._collect(queries, results, gen_elapsed, total_retrieval_time, original)
+
+    def _is_confident(self, confidence: dict) -> bool:
+        return (confidence["top_score"] >= self.min_top_score
+                and confidence["agreement"] >= self.min_agreement
+                and confidence["margin"] >= self.min_margin)
+
+    @staticmethod
+    def _format_confidence(confidence: dict) -> str:
+        return (f"top score {confidence['top_score']:.2f}, agreement {confidence['agreement']:.2f}, "
+                f"margin {confidence['margin']:.3f}")
+
+    def _fast_path(self, query: str, docs: List[Document], confidence: dict, elapsed: float) -> List[Document]:
+        """Original query results are decisive: skip query generation."""
+        docs = docs[:self.k]
+        logger.info(f"Multi-query retrieval completed in {elapsed:.3f}s (path: fast, original query only; "
+                    f"{self._format_confidence(confidence)}), returning {len(docs)} unique documents")
+        return docs
+
+    @staticmethod
+    def _format_prompt(query: str, num_variations: int = MULTI_QUERY_VARIATIONS) -> str:
         # We need to manually generate queries to time them separately
         # The MultiQueryRetriever uses a prompt to generate variations
         from langchain_core.prompts import PromptTemplate
 
-        # This is the default prompt used by MultiQueryRetriever (generates 3 variations)
+        # This is the default prompt used by MultiQueryRetriever (3 variations by default)
         prompt_str = """You are an AI language model assistant. Your task is
-    to generate 3 different versions of the given user
+    to generate {num_variations} different versions of the given user
     question to retrieve relevant documents from a vector  database.
     By generating multiple perspectives on the user question,
     your goal is to help the user overcome some of the limitations
@@ -196,72 +725,151 @@ class TimedMultiQueryRetriever(BaseRetriever):
     questions separated by newlines. Original question: {question}"""
 
         prompt = PromptTemplate.from_template(prompt_str)
+        return prompt.format(question=query, num_variations=num_variations)
 
-        # Time query generation
-        gen_start = time.perf_counter()
-        prompt_value = prompt.format(question=query)
-        response = self.llm.invoke(prompt_value)
-        gen_elapsed = time.perf_counter() - gen_start
-
+    @staticmethod
+    def _parse_queries(response, gen_elapsed: float, num_variations: Optional[int] = None) -> List[str]:
         # Parse query variations from response (default: don't include original)
-        queries = [q.strip() for q in response.content.split('\n') if q.strip()]
-
+        queries = [q.strip() for q in response.content.split('\n') if q.strip()][:num_variations]
         logger.info(f"Generated {len(queries)} query variations in {gen_elapsed:.3f}s")
+        return queries
 
-        # Time each variation's retrieval
-        all_docs = []
-        total_retrieval_time = 0
+    def _collect(self, queries: List[str], results: List[List[Document]], gen_elapsed: float,
+                 total_retrieval_time: float, original: Optional[tuple] = None) -> List[Document]:
+        """Log per-variation results, fuse them (with the original query's, if retrieved) and truncate to k."""
+        for i, (var_query, docs) in enumerate(zip(queries, results)):
+            logger.debug(f"Query variation {i+1}/{len(queries)} \"{var_query[:50]}...\" retrieved {len(docs)} documents")
 
-        for i, var_query in enumerate(queries):
-            logger.debug(f"Processing query variation {i+1}/{len(queries)}: \"{var_query[:50]}...\"")
+        if original is None:
+            path = "full"
+            original_elapsed = 0.0
+        else:
+            _, original_docs, confidence, original_elapsed = original
+            results = [original_docs] + list(results)
+            path = f"expanded, original: {original_elapsed:.3f}s; {self._format_confidence(confidence)}"
 
-            var_start = time.perf_counter()
-            docs = self.base_retriever.invoke(var_query)
-            var_elapsed = time.perf_counter() - var_start
-            total_retrieval_time += var_elapsed
+        unique_docs = reciprocal_rank_fusion(results, limit=self.k)
 
-            logger.debug(f"Query variation {i+1}/{len(queries)} completed in {var_elapsed:.3f}s, retrieved {len(docs)} documents")
+        total_time = original_elapsed + gen_elapsed + total_retrieval_time
+        logger.info(f"Multi-query retrieval completed in {total_time:.3f}s (path: {path}; generation: {gen_elapsed:.3f}s, retrieval: {total_retrieval_time:.3f}s), returning {len(unique_docs)} unique documents")
 
-            all_docs.extend(docs)
+        return unique_docs
 
-        # Deduplicate documents
-        unique_docs = []
-        seen_ids = set()
-        for doc in all_docs:
-            doc_id = id(doc)
-            if doc_id not in seen_ids:
-                seen_ids.add(doc_id)
-                unique_docs.append(doc)
 
-        total_time = gen_elapsed + total_retrieval_time
-        logger.info(f"Multi-query retrieval completed in {total_time:.3f}s (generation: {gen_elapsed:.3f}s, retrieval: {total_retrieval_time:.3f}s), returning {len(unique_docs)} unique documents")
+class RerankingRetriever(BaseRetriever):
+    """
+    Reranks the fused candidates of the wrapped retriever with a local cross-encoder (src.reranker).
 
-        return unique_docs
+    The wrapped retriever should return wide (RERANK_CANDIDATES); the best
+    top_n are kept. Past the time budget the fusion order is kept instead.
+    """
+
+    retriever: BaseRetriever
+    top_n: int = 3
+    timeout_ms: float = RERANK_TIMEOUT_MS
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        candidates = self.retriever.invoke(query, **({} if sources is None else {"sources": sources}))
+        docs, _ = rerank_documents(query, candidates, self.top_n, self.timeout_ms)
+        return docs
 
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        candidates = await self.retriever.ainvoke(query, **({} if sources is None else {"sources": sources}))
+        docs, _ = await arerank_documents(query, candidates, self.top_n, self.timeout_ms)
+        return docs
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Serves repeated queries from the process-wide retrieval cache (src.query_cache).
 
-def get_advanced_retriever(k: int = 3, filter: dict = None):
+    Results are keyed by (normalized query, k, filter, source selection, index
+    version), so a re-asked question skips query generation, embedding and both
+    searches, and nothing cached before an ingestion is served after it.
+    """
+
+    retriever: BaseRetriever
+    k: Optional[int] = None
+    filter_key: Optional[str] = None  # Static filter the wrapped retriever was built with
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _cache_key(self, query: str, sources: Optional[List[str]]) -> tuple:
+        sources_key = None if sources is None else tuple(sorted(sources))
+        return (normalize_query(query), self.k, self.filter_key, sources_key, get_index_version())
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        key = self._cache_key(query, sources)
+        cached = retrieval_cache.get(key)
+        if cached is not None:
+            logger.info(f"Retrieval served from cache, returning {len(cached)} documents")
+            return list(cached)
+
+        docs = self.retriever.invoke(query, **({} if sources is None else {"sources": sources}))
+        retrieval_cache.put(key, list(docs))
+        return docs
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Document]:
+        key = self._cache_key(query, sources)
+        cached = retrieval_cache.get(key)
+        if cached is not None:
+            logger.info(f"Retrieval served from cache, returning {len(cached)} documents")
+            return list(cached)
+
+        docs = await self.retriever.ainvoke(query, **({} if sources is None else {"sources": sources}))
+        retrieval_cache.put(key, list(docs))
+        return docs
+
+
+def get_advanced_retriever(k: int = 3, filter: dict = None, rerank: Optional[bool] = None):
     """
     Advanced retriever using hybrid search (BM25 + Vector) with multi-query expansion.
 
-    Note: Previously included reranking, but removed due to local model constraints.
-    Future improvements: Add RRF fusion, contextual retrieval, self-RAG filtering.
+    With reranking (default: RERANK_ENABLED), retrieval and fusion run with
+    RERANK_CANDIDATES per query and a local cross-encoder keeps the best k.
+    Future improvements: contextual retrieval, self-RAG filtering.
     """
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    candidate_k = max(k, RERANK_CANDIDATES) if rerank else k
+
     # 1. Base Retriever (Ensemble)
-    base_retriever = get_ensemble_retriever(k=k, filter=filter)
+    base_retriever = get_ensemble_retriever(k=candidate_k, filter=filter)
 
     # 2. Multi-Query Expansion
     # Use the LLM to generate variations of the query
-    llm = ChatOpenAI(
-        model="openai/gpt-4o-mini",
-        temperature=0.5,  # Increased to 0.5 to encourage diverse query variations
-        base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
-        api_key=os.getenv("OPENAI_API_KEY"),
-    )
+    llm = get_llm(temperature=0.5)  # Increased to 0.5 to encourage diverse query variations
 
     # Use timed wrapper to instrument query generation and retrieval performance
     # Note: Using construct() to bypass Pydantic validation for custom retriever types
-    mq_retriever = TimedMultiQueryRetriever.construct(
-        base_retriever=base_retriever, llm=llm
+    retriever = TimedMultiQueryRetriever.construct(
+        base_retriever=base_retriever, llm=llm, k=candidate_k
     )
 
-    return mq_retriever
+    # 3. Rerank the fused candidates down to k
+    if rerank:
+        # Load the model now, in the background, instead of on the first question
+        warm_ranker()
+        retriever = RerankingRetriever.construct(retriever=retriever, top_n=k, timeout_ms=RERANK_TIMEOUT_MS)
+
+    # 4. Cache results of repeated questions (until the next ingestion)
+    if RETRIEVAL_CACHE_SIZE > 0:
+        return CachedRetriever.construct(retriever=retriever, k=k,
+                                         filter_key=json.dumps(filter, sort_keys=True) if filter else None)
+
+    return retriever
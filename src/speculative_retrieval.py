@@ -0,0 +1,182 @@
+"""
+Speculative retrieval while a follow-up question is being rewritten.
+
+A follow-up question is rewritten into a standalone query by an LLM
+(rewrite_query_with_history) before retrieval, so every follow-up paid a full
+LLM round trip before retrieval even started. SpeculativeRetrieval starts
+retrieving for the raw question right away, in the background. Once the
+rewrite is known:
+
+- identical (after query normalization): the speculative results are used
+- close in embedding space (cosine >= SPECULATIVE_REUSE_THRESHOLD): reused too
+- otherwise: a second retrieval runs for the rewritten query
+
+The raw question is embedded in the background while the rewrite runs, so the
+comparison only embeds the rewritten query. Both go through embed_query, i.e.
+the query embedding cache: the raw question's vector is shared with the
+speculative retrieval, and a second retrieval finds the rewrite's vector cached.
+
+Outcomes are counted process-wide (speculation_stats) so the hit rate shows
+whether the speculation pays off.
+
+Key Components:
+- SpeculativeRetrieval: start() on the raw question, resolve() with the rewrite
+- speculation_stats: Outcome counters and time saved
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from src.query_cache import normalize_query
+from src.clients import get_embeddings
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+# Cosine similarity between raw and rewritten question above which the speculative results are kept
+SPECULATIVE_REUSE_THRESHOLD = float(os.getenv("SPECULATIVE_REUSE_THRESHOLD", "0.92"))
+
+IDENTICAL = "identical"
+SIMILAR = "similar"
+RERETRIEVED = "re-retrieved"
+OUTCOMES = (IDENTICAL, SIMILAR, RERETRIEVED)
+
+_speculation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative")
+
+_stats_lock = threading.Lock()
+_outcome_counts = {outcome: 0 for outcome in OUTCOMES}
+_time_saved = 0.0
+
+def speculation_stats() -> Dict[str, float]:
+    """Counts per outcome, the reuse rate and the retrieval time hidden behind rewrites."""
+    with _stats_lock:
+        total = sum(_outcome_counts.values())
+        reused = _outcome_counts[IDENTICAL] + _outcome_counts[SIMILAR]
+        return {**_outcome_counts, "total": total, "reuse_rate": reused / total if total else 0.0,
+                "time_saved": _time_saved}
+
+
+def _record(outcome: str, saved: float = 0.0) -> None:
+    global _time_saved
+    with _stats_lock:
+        _outcome_counts[outcome] += 1
+        _time_saved += saved
+
+
+class SpeculativeRetrieval:
+    """
+    Retrieval for a raw follow-up question, started before its rewrite is known.
+
+    Args:
+        retriever: Retriever to invoke (e.g. the advanced retriever)
+        question: Raw user question
+        sources: Doc keys to restrict retrieval to (None = all documents)
+        embeddings: Embeddings for comparing raw and rewritten question
+            (default: the app's embedding model; query vectors are cached)
+        threshold: Reuse threshold (default: SPECULATIVE_REUSE_THRESHOLD)
+
+    After resolve(), outcome is one of OUTCOMES and timings holds the
+    per-stage times in seconds.
+    """
+
+    def __init__(self, retriever: BaseRetriever, question: str, sources: Optional[List[str]] = None,
+                 embeddings: Optional[Embeddings] = None, threshold: Optional[float] = None):
+        self.retriever = retriever
+        self.question = question
+        self.sources = sources
+        self.embeddings = embeddings
+        self.threshold = SPECULATIVE_REUSE_THRESHOLD if threshold is None else threshold
+        self.outcome: Optional[str] = None
+        self.similarity: Optional[float] = None
+        self.timings: Dict[str, float] = {}
+        self._future: Optional[Future] = None
+        self._question_vector: Optional[Future] = None
+        self._started = 0.0
+
+    def start(self) -> "SpeculativeRetrieval":
+        """Start retrieving for the raw question in the background (call before rewriting)."""
+        self._started = time.perf_counter()
+        # Copied context: callbacks/tracing of the caller apply to the background retrieval
+        self._future = _speculation_executor.submit(contextvars.copy_context().run, self._retrieve, self.question)
+        # Embedded now so that resolve() only has to embed the rewrite
+        self._question_vector = _speculation_executor.submit(self._embed, self.question)
+        return self
+
+    def _embed(self, text: str) -> List[float]:
+        return (self.embeddings or get_embeddings()).embed_query(text)
+
+    def _retrieve(self, query: str) -> Tuple[List[Document], float]:
+        start = time.perf_counter()
+        docs = self.retriever.invoke(query, **({} if self.sources is None else {"sources": self.sources}))
+        return docs, time.perf_counter() - start
+
+    def _compare(self, rewritten_query: str) -> str:
+        if normalize_query(rewritten_query) == normalize_query(self.question):
+            self.similarity = 1.0
+            return IDENTICAL
+        start = time.perf_counter()
+        try:
+            raw = np.asarray(self._question_vector.result(), dtype=np.float32)
+            # embed_query caches the vector, so a second retrieval for the rewrite doesn't embed it again
+            rewritten = np.asarray(self._embed(rewritten_query), dtype=np.float32)
+            denominator = float(np.linalg.norm(raw) * np.linalg.norm(rewritten)) or 1.0
+            self.similarity = float(raw @ rewritten) / denominator
+        except Exception as e:
+            logger.warning(f"Could not compare rewritten query with the speculative one: {e}")
+            return RERETRIEVED
+        finally:
+            self.timings["similarity"] = time.perf_counter() - start
+        return SIMILAR if self.similarity >= self.threshold else RERETRIEVED
+
+    def resolve(self, rewritten_query: str) -> List[Document]:
+        """
+        Documents for the rewritten query: the speculative results if the rewrite
+        is close enough to the raw question, otherwise a second retrieval.
+
+        Args:
+            rewritten_query: Output of the query rewrite
+
+        Returns:
+            Retrieved documents
+        """
+        if self._future is None:
+            self.start()
+        resolve_start = time.perf_counter()
+        outcome = self._compare(rewritten_query)
+
+        if outcome != RERETRIEVED:
+            try:
+                docs, retrieval_time = self._future.result()
+            except Exception as e:
+                logger.warning(f"Speculative retrieval failed, retrieving for the rewritten query: {e}")
+                outcome = RERETRIEVED
+            else:
+                wait_time = time.perf_counter() - resolve_start
+                # Retrieval time that overlapped the rewrite instead of following it
+                saved = max(0.0, retrieval_time - wait_time)
+                self.outcome = outcome
+                self.timings.update(speculative_retrieval=retrieval_time, wait=wait_time)
+                _record(outcome, saved)
+                logger.info(f"Speculative retrieval reused ({outcome}, similarity {self.similarity:.3f}), "
+                            f"waited {wait_time:.3f}s after rewrite (retrieval: {retrieval_time:.3f}s, "
+                            f"saved: {saved:.3f}s), returning {len(docs)} documents")
+                return docs
+
+        docs, retrieval_time = self._retrieve(rewritten_query)
+        self.outcome = RERETRIEVED
+        self.timings.update(second_retrieval=retrieval_time, wait=time.perf_counter() - resolve_start)
+        _record(RERETRIEVED)
+        similarity = "n/a" if self.similarity is None else f"{self.similarity:.3f}"
+        logger.info(f"Speculative retrieval discarded (similarity {similarity}), second retrieval completed in "
+                    f"{retrieval_time:.3f}s, returning {len(docs)} documents")
+        return docs
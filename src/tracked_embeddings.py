@@ -7,21 +7,43 @@ actual token counts from the API instead of using estimation heuristics.
 
 Key Components:
 - UsageCapturingHTTPClient: Custom httpx.Client that extracts usage metadata
-- TrackedOpenAIEmbeddings: OpenAIEmbeddings subclass with LangSmith integration
+- UsageCapturingAsyncHTTPClient: httpx.AsyncClient feeding the same usage counters
+- TokenRateLimiter: Token bucket enforcing an embedding tokens-per-minute budget
+- TrackedOpenAIEmbeddings: OpenAIEmbeddings subclass with LangSmith integration,
+  a persistent embedding cache (see src.embedding_cache) and concurrent batching,
+  with native async (aembed_query/aembed_documents) counterparts
 """
 
+import asyncio
+import contextvars
 import threading
 import os
 import time
-from typing import Dict, List, Any, ClassVar, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Any, ClassVar, Optional
 import httpx
 from langchain_openai import OpenAIEmbeddings
 from langsmith import traceable
 from langsmith.run_helpers import get_current_run_tree
+from src.embedding_cache import get_embedding_cache
+from src.query_cache import normalize_query, query_embedding_cache
 from src.logging_config import get_logger
 
 logger = get_logger(__name__)
 
+# Concurrent embedding dispatch (see TrackedOpenAIEmbeddings._embed_concurrently)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", "0"))  # 0 = unlimited
+
+# Per-operation usage accumulator. Worker threads run in a copy of the caller's
+# context, so every batch of one embed_documents() call adds to the same dict
+# even while other calls are in flight on the shared client.
+_scoped_usage: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar(
+    "embedding_usage", default=None
+)
+
 
 class UsageCapturingHTTPClient(httpx.Client):
     """
@@ -106,9 +128,15 @@ class UsageCapturingHTTPClient(httpx.Client):
             data = json.loads(content)
 
             if "usage" in data:
+                prompt_tokens = data["usage"].get("prompt_tokens", 0)
+                total_tokens = data["usage"].get("total_tokens", 0)
+                scoped = _scoped_usage.get()
                 with self._lock:
-                    self._usage_data["prompt_tokens"] += data["usage"].get("prompt_tokens", 0)
-                    self._usage_data["total_tokens"] += data["usage"].get("total_tokens", 0)
+                    self._usage_data["prompt_tokens"] += prompt_tokens
+                    self._usage_data["total_tokens"] += total_tokens
+                    if scoped is not None:
+                        scoped["prompt_tokens"] += prompt_tokens
+                        scoped["total_tokens"] += total_tokens
         except Exception:
             # Silent fail - don't break embeddings on parsing errors
             pass
@@ -129,6 +157,126 @@ class UsageCapturingHTTPClient(httpx.Client):
             self._usage_data = {"prompt_tokens": 0, "total_tokens": 0}
             return usage
 
+    @contextmanager
+    def track_usage(self) -> Iterator[Dict[str, int]]:
+        """
+        Collect usage of only the requests made inside this block.
+
+        Unlike get_and_reset_usage(), this is exact when several embedding
+        operations share the client concurrently. Threads must run in a copy of
+        this context (contextvars.copy_context()) to be attributed.
+
+        Yields:
+            Dictionary with 'prompt_tokens' and 'total_tokens', filled as responses arrive
+        """
+        usage = {"prompt_tokens": 0, "total_tokens": 0}
+        token = _scoped_usage.set(usage)
+        try:
+            yield usage
+        finally:
+            _scoped_usage.reset(token)
+
+
+class UsageCapturingAsyncHTTPClient(httpx.AsyncClient):
+    """
+    Async HTTP client that captures OpenAI API usage metadata from responses.
+
+    Used by the OpenAI SDK for aembed_documents(). Usage is accumulated into
+    the sync UsageCapturingHTTPClient it is paired with, so get_and_reset_usage()
+    and track_usage() cover sync and async requests alike. Coroutines inherit
+    the caller's context, so scoped usage needs no extra plumbing here.
+    """
+
+    def __init__(self, usage_sink: UsageCapturingHTTPClient, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._usage_sink = usage_sink
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        """
+        Intercept send() method which is used by the OpenAI SDK.
+
+        Args:
+            request: The HTTP request to send
+            **kwargs: Additional send parameters
+
+        Returns:
+            HTTP response object
+        """
+        response = await super().send(request, **kwargs)
+
+        # Only process embeddings endpoints with successful responses
+        if "/embeddings" in str(request.url) and response.status_code == 200:
+            await response.aread()
+            self._usage_sink._extract_usage(response)
+
+        return response
+
+
+class TokenRateLimiter:
+    """
+    Token bucket limiting embedding throughput to a tokens-per-minute budget.
+
+    The bucket holds up to one minute of budget and refills continuously.
+    acquire() blocks until the requested tokens are available, so concurrent
+    batches queue up instead of tripping provider rate limits. aacquire() is
+    the non-blocking variant for coroutines.
+
+    Thread-safe.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self._available = self.capacity
+        self._rate = tokens_per_minute / 60.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Block until tokens can be spent.
+
+        Args:
+            tokens: Estimated tokens for the next request (clamped to capacity)
+
+        Returns:
+            Seconds spent waiting
+        """
+        tokens = min(float(tokens), self.capacity)
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def aacquire(self, tokens: int) -> float:
+        """Async acquire(): waits with asyncio.sleep so the event loop keeps running."""
+        tokens = min(float(tokens), self.capacity)
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def _try_acquire(self, tokens: float) -> float:
+        """Spend tokens if available (returns 0.0), otherwise return the seconds until they are."""
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self.capacity, self._available + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._available >= tokens:
+                self._available -= tokens
+                return 0.0
+            return (tokens - self._available) / self._rate
+
+
+def _estimate_tokens(texts: List[str]) -> int:
+    """Rough token estimate for rate limiting (~4 characters per token)."""
+    return sum(len(text) // 4 + 1 for text in texts)
+
 
 class TrackedOpenAIEmbeddings(OpenAIEmbeddings):
     """
@@ -144,6 +292,15 @@ class TrackedOpenAIEmbeddings(OpenAIEmbeddings):
     - Thread-safe concurrent operations
     - LangSmith integration via usage_metadata
     - Works with OpenRouter and native OpenAI API
+    - Persistent (model, text)-keyed cache: cache hits never reach the API,
+      so reported usage and cost count only real API tokens
+    - In-process LRU/TTL cache of query vectors keyed by normalized query text
+      (src.query_cache), checked by embed_query/aembed_query before anything else
+    - Concurrent batching: large embed_documents calls are split into
+      EMBEDDING_BATCH_SIZE batches sent in parallel over a pooled keep-alive
+      client, bounded by EMBEDDING_MAX_CONCURRENCY and EMBEDDING_TPM_LIMIT
+    - Native async: aembed_query/aembed_documents use a pooled httpx.AsyncClient
+      with the same cache, batching limits and usage tracking
 
     Usage:
         embeddings = TrackedOpenAIEmbeddings(
@@ -159,27 +316,57 @@ class TrackedOpenAIEmbeddings(OpenAIEmbeddings):
     # Pricing constant for qwen/qwen3-embedding-8b on OpenRouter
     COST_PER_1M_TOKENS: ClassVar[float] = 0.10  # $0.10 per 1M tokens
 
-    def __init__(self, **kwargs):
+    def __init__(self, use_cache: bool = True, max_concurrency: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None, transport: Optional[httpx.BaseTransport] = None,
+                 async_transport: Optional[httpx.AsyncBaseTransport] = None, **kwargs):
         """
         Initialize TrackedOpenAIEmbeddings with custom HTTP client.
 
         Args:
+            use_cache: Serve repeated texts from the shared on-disk embedding cache
+                (and repeated queries from the in-process query embedding cache)
+            max_concurrency: Parallel embedding requests (default: EMBEDDING_MAX_CONCURRENCY)
+            tokens_per_minute: Embedding token budget, 0 = unlimited (default: EMBEDDING_TPM_LIMIT)
+            transport: Shared connection pool for sync requests (see src.clients);
+                default: a private pool sized to max_concurrency
+            async_transport: Shared connection pool for async requests
             **kwargs: All standard OpenAIEmbeddings parameters
                      (model, base_url, api_key, etc.)
         """
-        # Create custom HTTP client for usage capture
+        max_concurrency = max(1, max_concurrency or EMBEDDING_MAX_CONCURRENCY)
+        tokens_per_minute = EMBEDDING_TPM_LIMIT if tokens_per_minute is None else tokens_per_minute
+
+        # Create custom HTTP client for usage capture, pooled so concurrent
+        # batches reuse keep-alive connections instead of reconnecting
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
         usage_client = UsageCapturingHTTPClient(
             timeout=kwargs.get("timeout", 60.0),
             headers=kwargs.get("default_headers"),
+            limits=limits,
+            transport=transport,
+        )
+
+        async_usage_client = UsageCapturingAsyncHTTPClient(
+            usage_client,
+            timeout=kwargs.get("timeout", 60.0),
+            headers=kwargs.get("default_headers"),
+            limits=limits,
+            transport=async_transport,
         )
 
-        # Inject custom client into parent class
+        # Inject custom clients into parent class
         kwargs["http_client"] = usage_client
+        kwargs["http_async_client"] = async_usage_client
         super().__init__(**kwargs)
 
         # Store reference to usage client after parent initialization
         # Use object.__setattr__ to bypass Pydantic's __setattr__
         object.__setattr__(self, '_usage_client', usage_client)
+        object.__setattr__(self, '_cache', get_embedding_cache() if use_cache else None)
+        object.__setattr__(self, '_use_query_cache', use_cache)
+        object.__setattr__(self, '_max_concurrency', max_concurrency)
+        object.__setattr__(self, '_rate_limiter',
+                           TokenRateLimiter(tokens_per_minute) if tokens_per_minute > 0 else None)
 
     @traceable(
         run_type="embedding",
@@ -199,12 +386,19 @@ class TrackedOpenAIEmbeddings(OpenAIEmbeddings):
         Returns:
             List of floats representing the embedding vector
         """
+        cache_key = (self.model, normalize_query(text))
+        cached = query_embedding_cache.get(cache_key) if self._use_query_cache else None
+        if cached is not None:
+            logger.debug("Query embedding served from in-process cache")
+            return cached
+
         # Time embedding API call for performance monitoring
         start = time.perf_counter()
 
         # Make direct API call using parent's method
         # This ensures we stay within the @traceable context
-        result = super().embed_query(text)
+        with self._usage_client.track_usage() as usage:
+            result = super().embed_query(text)
 
         # Log timing for performance monitoring
         elapsed = time.perf_counter() - start
@@ -212,8 +406,10 @@ class TrackedOpenAIEmbeddings(OpenAIEmbeddings):
 
         # Report usage while still in traced context
         # Pass the result so we can properly structure outputs
-        self._report_usage(result)
+        self._report_usage(result, usage)
 
+        if self._use_query_cache:
+            query_embedding_cache.put(cache_key, result)
         return result
 
     @traceable(
@@ -225,8 +421,10 @@ class TrackedOpenAIEmbeddings(OpenAIEmbeddings):
         """
         Embed multiple documents with usage tracking.
 
-        Makes direct API call with our custom HTTP client to capture usage,
-        then reports to LangSmith within the trace context.
+        Texts already in the embedding cache are served locally; only the
+        misses go to the API (with our custom HTTP client to capture usage),
+        then usage is reported to LangSmith within the trace context.
+        embed_query() routes through here as well.
 
         Args:
             texts: List of document texts to embed
@@ -237,36 +435,191 @@ class TrackedOpenAIEmbeddings(OpenAIEmbeddings):
         # Time embedding API batch call for performance monitoring
         start = time.perf_counter()
 
-        # Make direct API call using parent's method
-        # This ensures we stay within the @traceable context
-        result = super().embed_documents(texts)
+        result = self._cache.get_many(self.model, texts) if self._cache else [None] * len(texts)
+        missing = [i for i, vector in enumerate(result) if vector is None]
+
+        with self._usage_client.track_usage() as usage:
+            if missing:
+                # Make direct API calls using parent's method
+                # This ensures we stay within the @traceable context
+                missing_texts = [texts[i] for i in missing]
+                vectors = self._embed_concurrently(missing_texts)
+                for i, vector in zip(missing, vectors):
+                    result[i] = vector
+                if self._cache:
+                    self._cache.put_many(self.model, missing_texts, vectors)
 
         # Log timing for performance monitoring
         elapsed = time.perf_counter() - start
-        logger.info(f"Embedding API batch call completed in {elapsed:.3f}s for {len(texts)} documents")
+        logger.info(f"Embedding API batch call completed in {elapsed:.3f}s for {len(missing)} documents "
+                    f"({len(texts) - len(missing)} served from cache)")
 
         # Report usage while still in traced context
         # Pass the result so we can properly structure outputs
-        self._report_usage(result)
+        self._report_usage(result, usage)
 
         return result
 
-    def _report_usage(self, embeddings: Any) -> None:
+    def _embed_concurrently(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in EMBEDDING_BATCH_SIZE batches dispatched in parallel.
+
+        Output order matches input order. Each batch waits on the token
+        rate limiter (if configured) before it is sent. Worker threads run in a
+        copy of the caller's context so their usage lands in the caller's
+        track_usage() block.
+
+        Args:
+            texts: Texts to embed (cache misses only)
+
+        Returns:
+            List of embedding vectors (one per text)
+        """
+        batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+
+        def embed_batch(batch: List[str]) -> List[List[float]]:
+            if self._rate_limiter:
+                waited = self._rate_limiter.acquire(_estimate_tokens(batch))
+                if waited > 0:
+                    logger.debug(f"Embedding batch waited {waited:.3f}s for rate limit")
+            return OpenAIEmbeddings.embed_documents(self, batch)
+
+        workers = min(self._max_concurrency, len(batches))
+        if workers <= 1:
+            return [vector for batch in batches for vector in embed_batch(batch)]
+
+        logger.debug(f"Embedding {len(texts)} texts in {len(batches)} batches with concurrency {workers}")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as executor:
+            futures = [executor.submit(contextvars.copy_context().run, embed_batch, batch)
+                       for batch in batches]
+            return [vector for future in futures for vector in future.result()]
+
+    @traceable(
+        run_type="embedding",
+        name="Embed Query",
+        metadata={"ls_provider": "openrouter", "ls_model_name": "qwen/qwen3-embedding-8b"}
+    )
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Async embed_query(): embed a single query with usage tracking.
+
+        Args:
+            text: Query text to embed
+
+        Returns:
+            List of floats representing the embedding vector
+        """
+        cache_key = (self.model, normalize_query(text))
+        cached = query_embedding_cache.get(cache_key) if self._use_query_cache else None
+        if cached is not None:
+            logger.debug("Query embedding served from in-process cache")
+            return cached
+
+        start = time.perf_counter()
+
+        with self._usage_client.track_usage() as usage:
+            result = await super().aembed_query(text)
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"Async embedding API call completed in {elapsed:.3f}s")
+
+        self._report_usage(result, usage)
+
+        if self._use_query_cache:
+            query_embedding_cache.put(cache_key, result)
+        return result
+
+    @traceable(
+        run_type="embedding",
+        name="Embed Documents",
+        metadata={"ls_provider": "openrouter", "ls_model_name": "qwen/qwen3-embedding-8b"}
+    )
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Async embed_documents(): cache lookup, then concurrent API batches for the misses.
+
+        The SQLite cache is accessed in a worker thread so the event loop is
+        never blocked on disk. aembed_query() routes through here as well.
+
+        Args:
+            texts: List of document texts to embed
+
+        Returns:
+            List of embedding vectors (one per document)
+        """
+        start = time.perf_counter()
+
+        if self._cache:
+            result = await asyncio.to_thread(self._cache.get_many, self.model, texts)
+        else:
+            result = [None] * len(texts)
+        missing = [i for i, vector in enumerate(result) if vector is None]
+
+        with self._usage_client.track_usage() as usage:
+            if missing:
+                missing_texts = [texts[i] for i in missing]
+                vectors = await self._aembed_concurrently(missing_texts)
+                for i, vector in zip(missing, vectors):
+                    result[i] = vector
+                if self._cache:
+                    await asyncio.to_thread(self._cache.put_many, self.model, missing_texts, vectors)
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"Async embedding API batch call completed in {elapsed:.3f}s for {len(missing)} documents "
+                    f"({len(texts) - len(missing)} served from cache)")
+
+        self._report_usage(result, usage)
+
+        return result
+
+    async def _aembed_concurrently(self, texts: List[str]) -> List[List[float]]:
+        """
+        Async _embed_concurrently(): EMBEDDING_BATCH_SIZE batches, at most
+        max_concurrency in flight, each waiting on the token rate limiter.
+
+        Args:
+            texts: Texts to embed (cache misses only)
+
+        Returns:
+            List of embedding vectors (one per text)
+        """
+        batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                if self._rate_limiter:
+                    waited = await self._rate_limiter.aacquire(_estimate_tokens(batch))
+                    if waited > 0:
+                        logger.debug(f"Embedding batch waited {waited:.3f}s for rate limit")
+                return await OpenAIEmbeddings.aembed_documents(self, batch)
+
+        if len(batches) > 1:
+            logger.debug(f"Embedding {len(texts)} texts in {len(batches)} async batches "
+                         f"with concurrency {min(self._max_concurrency, len(batches))}")
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        return [vector for batch in results for vector in batch]
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Return embedding cache hit/miss counters (empty if the cache is disabled)."""
+        return self._cache.stats() if self._cache else {}
+
+    def _report_usage(self, embeddings: Any, usage: Dict[str, int]) -> None:
         """
-        Retrieve usage from HTTP client and report to LangSmith.
+        Report usage captured for this operation to LangSmith.
 
         This method:
-        1. Gets accumulated usage from the custom HTTP client
+        1. Takes the usage collected by the HTTP client's track_usage() block
         2. Calculates cost based on actual token counts
         3. Uses run.end() to properly set outputs with usage_metadata
            This ensures tokens appear in both metadata AND run overview
 
         Args:
             embeddings: The embedding result (List[float] or List[List[float]])
+            usage: Dictionary with 'prompt_tokens' and 'total_tokens' for this operation
 
         If not in a traced context (LangSmith disabled), fails silently.
         """
-        usage = self._usage_client.get_and_reset_usage()
 
         if usage["total_tokens"] > 0:
             # Calculate actual cost based on real token counts
@@ -0,0 +1,6 @@
+import pytest
+
+@pytest.fixture(autouse=True)
+def tmp_index_version(tmp_path, monkeypatch):
+    # Ingestion and cache tests bump the persisted index version; keep it out of the working tree
+    monkeypatch.setattr("src.query_cache.INDEX_VERSION_PATH", str(tmp_path / "index_version"))
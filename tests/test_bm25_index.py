@@ -0,0 +1,131 @@
+import os
+import random
+import numpy as np
+import pytest
+from langchain_community.retrievers import BM25Retriever
+from langchain_core.documents import Document
+from rank_bm25 import BM25Okapi
+from src.bm25_index import BM25Engine, BM25Index
+
+def _doc(text, doc_key):
+    return Document(page_content=text, metadata={"source": f"./data/{doc_key}", "doc_key": doc_key})
+
+DOCS = [
+    _doc("osimertinib is preferred for EGFR exon 19 deletion", "nscl.pdf"),
+    _doc("pembrolizumab for PD-L1 expression above 50 percent", "nscl.pdf"),
+    _doc("diversity action plans are required for phase 3 trials", "fda.pdf"),
+    _doc("short", "fda.pdf"),
+]
+
+def test_engine_scores_match_rank_bm25():
+    rng = random.Random(0)
+    vocab = [f"term{i}" for i in range(50)]
+    docs = [_doc(" ".join(rng.choices(vocab, k=rng.randint(5, 40))), "corpus.pdf") for _ in range(200)]
+    okapi = BM25Okapi([d.page_content.split() for d in docs])
+    engine = BM25Engine.from_index(BM25Index(docs))
+    
+    for query in [["term1"], ["term1", "term2", "term1"], ["term3", "unknown"], ["term4", "term5", "term6", "term7"]]:
+        expected = okapi.get_scores(query)
+        doc_ids, scores = engine.score(query)
+        assert np.allclose(scores, expected[doc_ids], rtol=1e-5)
+        assert np.all(expected[np.setdiff1d(np.arange(len(docs)), doc_ids)] == 0)
+
+def test_retriever_ranks_like_bm25_retriever():
+    expected = BM25Retriever.from_documents(DOCS[:3], k=3)
+    retriever = BM25Index(DOCS).as_retriever(k=3)
+    
+    for query, matches in [("EGFR osimertinib", 1), ("diversity plans for trials", 3), ("PD-L1 50 percent", 1)]:
+        results = retriever.invoke(query)
+        # Only matching chunks are returned, rank_bm25 pads with zero-score ones
+        assert len(results) == matches
+        assert results == expected.invoke(query)[:matches]
+    assert retriever.invoke("nothing matches") == []
+
+def test_top_k_uses_dense_and_sparse_paths(monkeypatch):
+    index = BM25Index([_doc(f"shared word{i} filler text", "a.pdf") for i in range(20)])
+    engine = BM25Engine.from_index(index)
+    top = engine.top_k(["shared", "word7"], 3)
+    assert [i for i, _ in top][0] == 7 and len(top) == 3
+    monkeypatch.setattr("src.bm25_index.SPARSE_QUERY_RATIO", 10.0)
+    assert engine.top_k(["shared", "word7"], 3) == top
+
+def test_top_k_batch_matches_top_k(monkeypatch):
+    rng = random.Random(1)
+    vocab = [f"term{i}" for i in range(50)]
+    docs = [_doc(" ".join(rng.choices(vocab, k=rng.randint(5, 40))), "corpus.pdf") for _ in range(200)]
+    engine = BM25Engine.from_index(BM25Index(docs))
+    queries = [["term1", "term2", "term1"], ["term3", "unknown"], ["unknown"], ["term4", "term5", "term6"]]
+    
+    for ratio in (0.1, 10.0):
+        monkeypatch.setattr("src.bm25_index.SPARSE_QUERY_RATIO", ratio)
+        batch = engine.top_k_batch(queries, 5)
+        assert len(batch) == len(queries)
+        for query, results in zip(queries, batch):
+            expected = engine.top_k(query, 5)
+            assert [i for i, _ in results] == [i for i, _ in expected]
+            assert np.allclose([s for _, s in results], [s for _, s in expected], rtol=1e-5)
+
+def test_source_filter_applies_before_top_k(monkeypatch):
+    docs = [_doc(f"egfr mutation chunk{i}", "a.pdf") for i in range(10)]
+    docs += [_doc(f"egfr chunk{i}", "b.pdf") for i in range(3)]
+    retriever = BM25Index(docs).as_retriever(k=3)
+    
+    for ratio in (0.1, 10.0):
+        monkeypatch.setattr("src.bm25_index.SPARSE_QUERY_RATIO", ratio)
+        # "a.pdf" chunks outscore "b.pdf" ones, but the mask keeps k slots for b.pdf
+        results = retriever.invoke("egfr mutation", sources=["b.pdf"])
+        assert len(results) == 3
+        assert {d.metadata["doc_key"] for d in results} == {"b.pdf"}
+        batch = retriever.search_batch(["egfr mutation", "egfr"], sources=["b.pdf"])
+        assert [[d.metadata["doc_key"] for d in docs] for docs in batch] == [["b.pdf"] * 3] * 2
+    assert retriever.invoke("egfr", sources=["missing.pdf"]) == []
+    assert len(retriever.invoke("egfr")) == 3
+
+def test_save_load_and_remove_by_doc_key(tmp_path):
+    path = str(tmp_path / "bm25")
+    index = BM25Index(DOCS)
+    assert len(index) == 3  # too-short chunk skipped
+    index.save(path)
+    
+    loaded = BM25Index.load(path)
+    assert list(loaded.docs) == list(index.docs)
+    assert loaded.doc_freqs == index.doc_freqs
+    
+    assert loaded.remove_doc_keys(["nscl.pdf"]) == 2
+    assert loaded.doc_freqs == BM25Index(DOCS[2:]).doc_freqs
+    assert [d.metadata["doc_key"] for d in loaded.as_retriever(k=5).invoke("trials")] == ["fda.pdf"]
+
+    # Appending after a load leaves the saved generation untouched until the next save
+    loaded.add_documents(DOCS[:1])
+    assert len(BM25Index.load(path)) == 3
+    loaded.save(path)
+    assert [d.page_content for d in BM25Index.load(path).docs] == [DOCS[2].page_content, DOCS[0].page_content]
+    assert len(os.listdir(path)) == 2  # meta.json and the current generation
+
+def test_loaded_index_uses_saved_postings(tmp_path, monkeypatch):
+    rng = random.Random(2)
+    vocab = [f"term{i}" for i in range(50)]
+    docs = [_doc(" ".join(rng.choices(vocab, k=rng.randint(5, 40))), f"doc{i % 4}.pdf") for i in range(200)]
+    built = BM25Index()
+    for start in range(0, len(docs), 64):  # batch by batch, as streaming ingestion does
+        built.add_documents(docs[start:start + 64])
+    built.save(str(tmp_path / "bm25"))
+    expected = built.as_retriever(k=5)
+
+    monkeypatch.setattr(BM25Engine, "from_index", lambda *args, **kwargs: pytest.fail("recompiled on load"))
+    retriever = BM25Index.load(str(tmp_path / "bm25")).as_retriever(k=5)
+    assert isinstance(retriever.engine.weights, np.memmap)
+    for query in ["term1 term2", "term3", "term4 term5 term6"]:
+        assert retriever.invoke(query) == expected.invoke(query)
+        assert retriever.invoke(query, sources=["doc1.pdf"]) == expected.invoke(query, sources=["doc1.pdf"])
+
+def test_load_missing_or_corrupt(tmp_path):
+    assert BM25Index.load(str(tmp_path / "missing")) is None
+    corrupt = tmp_path / "corrupt"
+    corrupt.mkdir()
+    (corrupt / "meta.json").write_text("{not json")
+    assert BM25Index.load(str(corrupt)) is None
+    # Indexes in the old single-file JSON format are rebuilt by the next ingestion
+    legacy = tmp_path / "bm25_index.json"
+    legacy.write_text("{}")
+    assert BM25Index.load(str(legacy)) is None
@@ -0,0 +1,13 @@
+from langchain_core.documents import Document
+from src.chunk_ids import assign_chunk_ids, compute_chunk_id, get_chunk_id
+
+def test_chunk_ids_are_stable_and_content_derived():
+    docs = [Document(page_content="EGFR exon 19", metadata={"doc_key": "a.pdf", "source": "./data/a.pdf"}),
+            Document(page_content="EGFR exon 19", metadata={"doc_key": "b.pdf", "source": "./data/b.pdf"})]
+    assign_chunk_ids(docs)
+    
+    assert docs[0].metadata["chunk_id"] == compute_chunk_id("a.pdf", "EGFR exon 19")
+    assert docs[0].metadata["chunk_id"] != docs[1].metadata["chunk_id"]
+    # Chunks ingested without an ID (and without doc_key) get the same ID on the fly
+    legacy = Document(page_content="EGFR exon 19", metadata={"source": "./data/a.pdf"})
+    assert get_chunk_id(legacy) == docs[0].metadata["chunk_id"]
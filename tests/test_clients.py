@@ -0,0 +1,71 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import pytest
+from src.clients import EMBEDDING_POOL, LLM_POOL, connection_stats, get_async_http_client, get_embeddings, get_http_client, get_llm
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+def test_pooled_clients_reuse_connections(server_url):
+    client = get_http_client("test-pool")
+    assert get_http_client("test-pool") is client
+    for _ in range(3):
+        assert client.get(server_url).status_code == 200
+
+    async def fetch_twice():
+        async_client = get_async_http_client("test-pool")
+        for _ in range(2):
+            assert (await async_client.get(server_url)).status_code == 200
+    asyncio.run(fetch_twice())
+
+    stats = connection_stats()["test-pool"]
+    # One connection for the sync client, one for the async client; the other requests reused them
+    assert (stats["requests"], stats["connections"], stats["reused"]) == (5, 2, 3)
+    assert stats["reuse_rate"] == pytest.approx(0.6)
+
+def test_llm_and_embeddings_are_shared(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    llm = get_llm(temperature=0)
+    assert get_llm(temperature=0.0) is llm
+    expansion_llm = get_llm(temperature=0.5)
+    assert expansion_llm is not llm
+    assert expansion_llm.http_client is llm.http_client is get_http_client(LLM_POOL)
+
+    with patch("src.tracked_embeddings.get_embedding_cache", return_value=None):
+        embeddings = get_embeddings("test-embedding-model")
+    assert get_embeddings("test-embedding-model") is embeddings
+    assert embeddings._usage_client._transport is get_http_client(EMBEDDING_POOL)._transport
+
+def test_async_client_works_across_event_loops(server_url):
+    async def fetch_twice():
+        async_client = get_async_http_client("test-loops")
+        for _ in range(2):
+            assert (await async_client.get(server_url)).status_code == 200
+
+    # e.g. two Streamlit reruns, each with its own asyncio.run()
+    asyncio.run(fetch_twice())
+    asyncio.run(fetch_twice())
+
+    stats = connection_stats()["test-loops"]
+    # Connections are never shared across loops: one per loop, reused within it
+    assert (stats["requests"], stats["connections"], stats["reused"]) == (4, 2, 2)
@@ -0,0 +1,59 @@
+from langchain_core.documents import Document
+from src.dedup import deduplicate_chunks
+
+def _chunk(text, page):
+    return Document(page_content=text, metadata={
+        "source": "guide.pdf",
+        "dl_meta": {"doc_items": [{"prov": [{"page_no": page}]}]},
+    })
+
+FOOTER = ("This guideline is not a substitute for clinical judgement. Consult the full prescribing "
+          "information before use. Reproduction without written permission is prohibited.")
+
+def test_deduplicate_collapses_exact_and_near_copies():
+    docs = [
+        _chunk("Stage IIIA disease is treated with concurrent chemoradiation followed by consolidation.", 1),
+        _chunk(FOOTER + " Page 1", 1),
+        _chunk(FOOTER + " Page 2", 2),
+        _chunk("  " + FOOTER.upper() + " Page 1", 3),
+        _chunk("Adjuvant osimertinib is recommended for resected EGFR-mutant disease.", 3),
+    ]
+    
+    kept, stats = deduplicate_chunks(docs, threshold=0.8, near=True)
+    
+    # First occurrence kept, in document order
+    assert [d.page_content for d in kept] == [docs[0].page_content, docs[1].page_content, docs[4].page_content]
+    assert stats == {"exact_duplicates": 1, "near_duplicates": 1}
+    assert kept[1].metadata["provenance"] == {"duplicates": 2, "pages": [1, 2, 3]}
+    assert kept[0].metadata["provenance"] == {"duplicates": 0, "pages": [1]}
+
+def test_deduplicate_keeps_distinct_chunks():
+    docs = [
+        _chunk("Pembrolizumab monotherapy for PD-L1 expression of at least 50 percent.", 4),
+        _chunk("Pembrolizumab plus chemotherapy for PD-L1 expression below 50 percent.", 5),
+        _chunk("Short", 6),
+    ]
+    
+    kept, stats = deduplicate_chunks(docs)
+    
+    assert kept == docs
+    assert stats == {"exact_duplicates": 0, "near_duplicates": 0}
+
+def test_default_keeps_chunks_differing_only_in_a_number():
+    text = ("For patients with creatinine clearance between 30 and 50 mL/min the recommended starting dose "
+            "is {} mg once daily with food, continued until disease progression or unacceptable toxicity, "
+            "with liver function tests before each cycle and dose interruption for grade 3 events. Patients "
+            "should be counselled on the risk of interstitial lung disease and instructed to report new or "
+            "worsening respiratory symptoms promptly. Treatment should be withheld while the cause is "
+            "investigated and permanently discontinued if the diagnosis is confirmed. Concomitant strong "
+            "CYP3A4 inducers should be avoided; if unavoidable, the dose should be increased as described in "
+            "the prescribing information and reduced again once the inducer has been stopped.")
+    docs = [_chunk(text.format(80), 7), _chunk(text.format(40), 8), _chunk(text.format(80), 9)]
+    
+    kept, stats = deduplicate_chunks(docs, threshold=0.9)
+    
+    # Only the identical copy is collapsed; the 40 mg chunk keeps its own text
+    assert [d.page_content for d in kept] == [docs[0].page_content, docs[1].page_content]
+    assert stats == {"exact_duplicates": 1, "near_duplicates": 0}
+    # The opt-in near pass would have merged them
+    assert len(deduplicate_chunks(docs, threshold=0.9, near=True)[0]) == 1
@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import patch
+from langchain_openai import OpenAIEmbeddings
+from src.embedding_cache import EmbeddingCache
+from src.tracked_embeddings import TrackedOpenAIEmbeddings
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10)
+
+def test_cache_roundtrip_and_counters(cache):
+    cache.put_many("model-a", ["hello", "world"], [[0.5, 1.0], [2.0, -1.0]])
+
+    assert cache.get_many("model-a", ["hello", "missing", "world"]) == [[0.5, 1.0], None, [2.0, -1.0]]
+    # Same text under another model is a different entry
+    assert cache.get_many("model-b", ["hello"]) == [None]
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["entries"] == 2
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10, touch_interval=0)
+    cache.put_many("m", [f"t{i}" for i in range(10)], [[float(i)] for i in range(10)])
+    cache.get_many("m", ["t0"])  # refresh t0 so it survives eviction
+
+    cache.put_many("m", ["t10"], [[10.0]])
+
+    stats = cache.stats()
+    assert stats["entries"] == 9
+    assert stats["evictions"] == 2
+    assert cache.get_many("m", ["t0", "t1", "t10"]) == [[0.0], None, [10.0]]
+
+def test_recent_hits_do_not_write(cache):
+    cache.put_many("m", ["x"], [[1.0]])
+    before = cache._conn.total_changes
+
+    assert cache.get_many("m", ["x", "x"]) == [[1.0], [1.0]]
+    assert cache._conn.total_changes == before
+
+def test_eviction_counts_rows_inserted_by_other_processes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = EmbeddingCache(path, max_entries=10)
+    other = EmbeddingCache(path, max_entries=1000)
+    other.put_many("m", [f"t{i}" for i in range(10)], [[float(i)] for i in range(10)])
+
+    cache.put_many("m", ["new"], [[1.0]])
+
+    assert cache.stats()["entries"] == 9
+    assert cache.stats()["evictions"] == 2
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    EmbeddingCache(path).put_many("m", ["x"], [[1.0, 2.0]])
+
+    reopened = EmbeddingCache(path)
+    assert reopened.get_many("m", ["x"]) == [[1.0, 2.0]]
+    assert reopened.stats()["entries"] == 1
+
+def test_embed_documents_only_sends_cache_misses(cache):
+    with patch("src.tracked_embeddings.get_embedding_cache", return_value=cache):
+        embeddings = TrackedOpenAIEmbeddings(model="test-model", api_key="sk-test")
+    cache.put_many("test-model", ["cached"], [[1.0]])
+
+    with patch.object(OpenAIEmbeddings, "embed_documents", autospec=True, return_value=[[2.0]]) as mock_embed:
+        result = embeddings.embed_documents(["cached", "fresh"])
+        mock_embed.assert_called_once_with(embeddings, ["fresh"])
+
+    assert result == [[1.0], [2.0]]
+
+    with patch.object(OpenAIEmbeddings, "embed_documents") as mock_embed:
+        assert embeddings.embed_documents(["fresh"]) == [[2.0]]
+        mock_embed.assert_not_called()
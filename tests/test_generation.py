@@ -0,0 +1,37 @@
+from unittest.mock import MagicMock, patch
+from langchain_core.messages import AIMessage
+from src.generation import needs_rewrite, rewrite_cache, rewrite_query, rewrite_query_with_history, rewrite_stats
+
+HISTORY = [
+    {"role": "user", "content": "What is the preferred first-line therapy for EGFR exon 19 deletion?"},
+    {"role": "assistant", "content": "Osimertinib (nscl.pdf)."},
+]
+
+def test_needs_rewrite_gate():
+    assert needs_rewrite("What about its side effects?")
+    assert needs_rewrite("And for stage IV?")
+    assert needs_rewrite("Why?")
+    assert not needs_rewrite("Which biomarkers should be tested in metastatic nonsquamous NSCLC?")
+
+@patch("src.generation.get_llm")
+def test_rewrite_skips_standalone_and_caches_follow_ups(mock_llm):
+    rewrite_cache.clear()
+    llm = MagicMock(return_value=AIMessage(content="What are the side effects of osimertinib?"))
+    mock_llm.return_value = llm
+    before = rewrite_stats()
+
+    assert rewrite_query("What about its side effects?", []).source == "no_history"
+
+    standalone = rewrite_query("Which biomarkers should be tested in metastatic NSCLC?", HISTORY)
+    assert (standalone.source, standalone.query) == ("skipped", "Which biomarkers should be tested in metastatic NSCLC?")
+
+    first = rewrite_query("What about its side effects?", HISTORY)
+    assert (first.source, first.query) == ("llm", "What are the side effects of osimertinib?")
+    assert rewrite_query_with_history("what about its side effects", HISTORY) == first.query
+    assert llm.call_count == 1
+
+    # A different conversation is a different cache key
+    assert rewrite_query("What about its side effects?", HISTORY[:1]).source == "llm"
+
+    after = rewrite_stats()
+    assert (after["skipped"] - before["skipped"], after["cached"] - before["cached"], after["llm"] - before["llm"]) == (1, 1, 2)
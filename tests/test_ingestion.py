@@ -1,11 +1,53 @@
 import pytest
 import os
+import json
 from unittest.mock import MagicMock, patch
-from src.ingestion import load_pdfs, build_vectorstore, ingest_docs
+from langchain_core.documents import Document
+from src.active_index import get_active_index
+from src.bm25_index import BM25Index
+from src.chunk_ids import compute_chunk_id
+from src.ingestion import (
+    load_pdfs,
+    build_vectorstore,
+    update_vectorstore,
+    ingest_docs,
+    parse_pdfs,
+    stream_ingest,
+    plan_incremental_ingest,
+    _plan_parse_tasks,
+    _merge_shard_results,
+    get_chunking_config,
+)
+
+@pytest.fixture(autouse=True)
+def tmp_manifest(tmp_path, monkeypatch):
+    manifest_path = tmp_path / "ingest_manifest.json"
+    monkeypatch.setattr("src.ingestion.MANIFEST_PATH", str(manifest_path))
+    return manifest_path
+
+@pytest.fixture(autouse=True)
+def tmp_parse_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "docling_cache"
+    monkeypatch.setattr("src.parse_cache.PARSE_CACHE_DIR", str(cache_dir))
+    monkeypatch.setattr("src.ingestion.PARSE_CACHE_DIR", str(cache_dir))
+    return cache_dir
+
+@pytest.fixture(autouse=True)
+def tmp_bm25_index(tmp_path, monkeypatch):
+    index_path = tmp_path / "bm25_index"
+    monkeypatch.setattr("src.bm25_index.BM25_INDEX_PATH", str(index_path))
+    return index_path
+
+@pytest.fixture(autouse=True)
+def tmp_active_index(tmp_path, monkeypatch):
+    pointer_path = tmp_path / "active_index.json"
+    monkeypatch.setattr("src.active_index.ACTIVE_INDEX_PATH", str(pointer_path))
+    monkeypatch.setattr("src.local_vectorstore.LOCAL_VECTOR_DIR", str(tmp_path / "local_vectorstore"))
+    return pointer_path
 
 @pytest.fixture
-def mock_docling_loader():
-    with patch("src.ingestion.DoclingLoader") as mock:
+def mock_document_converter():
+    with patch("src.ingestion.DocumentConverter") as mock:
         yield mock
 
 @pytest.fixture
@@ -25,7 +67,7 @@ def mock_milvus():
 
 @pytest.fixture
 def mock_openai_embeddings():
-    with patch("src.ingestion.OpenAIEmbeddings") as mock:
+    with patch("src.ingestion.get_embeddings") as mock:
         yield mock
 
 def test_load_pdfs_no_files(tmp_path):
@@ -36,7 +78,7 @@ def test_load_pdfs_no_files(tmp_path):
     docs = load_pdfs(data_dir=str(data_dir))
     assert docs == []
 
-def test_load_pdfs_with_files(tmp_path, mock_docling_loader, mock_huggingface_tokenizer, mock_hybrid_chunker):
+def test_load_pdfs_with_files(tmp_path, mock_document_converter, mock_huggingface_tokenizer, mock_hybrid_chunker):
     # Create a directory with some files
     data_dir = tmp_path / "data"
     data_dir.mkdir()
@@ -46,23 +88,108 @@ def test_load_pdfs_with_files(tmp_path, mock_docling_loader, mock_huggingface_to
     (data_dir / "doc2.pdf").touch()
     (data_dir / "image.png").touch() # Should be ignored
     
-    mock_loader_instance = mock_docling_loader.return_value
-    mock_loader_instance.load.return_value = ["chunk1", "chunk2"]
+    mock_converter = mock_document_converter.return_value
+    mock_converter.convert.return_value.document.num_pages.return_value = 2
+    mock_chunker = mock_hybrid_chunker.return_value
+    mock_chunker.chunk.return_value = [MagicMock()]
+    mock_chunker.contextualize.side_effect = ["chunk1", "chunk2"]
     
-    docs = load_pdfs(data_dir=str(data_dir))
+    with patch("src.ingestion._worker_converter", None):
+        docs = load_pdfs(data_dir=str(data_dir), max_workers=1)
+    
+    # Check that only PDFs were converted, in a deterministic order
+    converted = [c.kwargs["source"] for c in mock_converter.convert.call_args_list]
+    assert converted == [str(data_dir / "doc1.pdf"), str(data_dir / "doc2.pdf")]
     
-    # Verify DoclingLoader initialization with filtered list
-    call_args = mock_docling_loader.call_args
-    assert call_args is not None
-    file_paths = call_args.kwargs['file_path']
+    assert [d.page_content for d in docs] == ["chunk1", "chunk2"]
+    assert [d.metadata["doc_key"] for d in docs] == ["doc1.pdf", "doc2.pdf"]
+    assert [d.metadata["chunk_id"] for d in docs] == [compute_chunk_id("doc1.pdf", "chunk1"),
+                                                      compute_chunk_id("doc2.pdf", "chunk2")]
+
+def test_parse_pdfs_reuses_cached_parse(tmp_path, mock_document_converter, mock_huggingface_tokenizer, mock_hybrid_chunker):
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-1.7 fake")
+    mock_converter = mock_document_converter.return_value
+    mock_converter.convert.return_value.document.num_pages.return_value = 4
+    mock_chunker = mock_hybrid_chunker.return_value
+    mock_chunker.chunk.return_value = [MagicMock()]
+    mock_chunker.contextualize.return_value = "text"
+    cached_doc = MagicMock()
+    cached_doc.num_pages.return_value = 4
     
-    # Check that only PDFs are included
-    assert len(file_paths) == 2
-    assert any("doc1.pdf" in str(p) for p in file_paths)
-    assert any("doc2.pdf" in str(p) for p in file_paths)
-    assert not any("image.png" in str(p) for p in file_paths)
+    with patch("src.ingestion._worker_converter", None), \
+         patch("src.ingestion.load_parsed_document", side_effect=[None, cached_doc]) as mock_load, \
+         patch("src.ingestion.save_parsed_document") as mock_save:
+        _, first = parse_pdfs([str(pdf)], max_workers=1)
+        docs, second = parse_pdfs([str(pdf)], max_workers=1)
     
-    assert docs == ["chunk1", "chunk2"]
+    # Only the first run parses; the second re-chunks the cached document
+    assert mock_converter.convert.call_count == 1
+    mock_save.assert_called_once()
+    file_hash = mock_load.call_args.args[0]
+    assert file_hash == mock_save.call_args.args[1]
+    assert first["cache_hits"] == 0 and second["cache_hits"] == 1
+    mock_chunker.chunk.assert_called_with(cached_doc)
+    assert [d.page_content for d in docs] == ["text"]
+
+def test_parse_pdfs_reports_corrupt_file(tmp_path, mock_document_converter, mock_huggingface_tokenizer, mock_hybrid_chunker):
+    good, bad = str(tmp_path / "good.pdf"), str(tmp_path / "bad.pdf")
+    mock_converter = mock_document_converter.return_value
+    good_result = MagicMock()
+    good_result.document.num_pages.return_value = 3
+    mock_converter.convert.side_effect = [ValueError("broken xref"), good_result]
+    mock_chunker = mock_hybrid_chunker.return_value
+    mock_chunker.chunk.return_value = [MagicMock()]
+    mock_chunker.contextualize.return_value = "text"
+    
+    with patch("src.ingestion._worker_converter", None):
+        docs, stats = parse_pdfs([bad, good], max_workers=1)
+    
+    assert [d.metadata["doc_key"] for d in docs] == ["good.pdf"]
+    assert stats["pages"] == 3
+    assert stats["failed"] == [{"file_path": bad, "error": "ValueError: broken xref"}]
+
+def _shard_chunk(text, page_no, headings=None):
+    dl_meta = {"doc_items": [{"prov": [{"page_no": page_no}]}]}
+    if headings:
+        dl_meta["headings"] = headings
+    return Document(page_content=text, metadata={"source": "big.pdf", "dl_meta": dl_meta})
+
+def _shard_result(page_range, docs, error=None):
+    return {"file_path": "big.pdf", "page_range": page_range, "docs": docs, "num_pages": 50,
+            "parse_time": 1.0, "chunk_time": 0.1, "error": error}
+
+def test_plan_parse_tasks_shards_large_pdfs():
+    with patch("src.ingestion._count_pages", side_effect=[120, 10]), \
+         patch("src.ingestion.SHARD_MIN_PAGES", 100), patch("src.ingestion.SHARD_PAGES", 50):
+        tasks = _plan_parse_tasks(["big.pdf", "small.pdf"], shard=True)
+
+    assert tasks == [("big.pdf", (1, 50)), ("big.pdf", (51, 100)), ("big.pdf", (101, 120)),
+                     ("small.pdf", None)]
+
+def test_merge_shard_results_restores_pages_and_headings():
+    first = [_shard_chunk("Intro\nintro text", 3, ["Intro"]), _shard_chunk("Dosing\nx", 50, ["Dosing"])]
+    # Second shard numbered from page 1 and starting mid-section without headings
+    second = [_shard_chunk("continued", 1), _shard_chunk("Toxicity\ny", 2, ["Toxicity"])]
+
+    merged = _merge_shard_results([_shard_result((1, 50), first), _shard_result((51, 100), second)])
+
+    assert len(merged) == 1
+    docs = merged[0]["docs"]
+    assert merged[0]["num_pages"] == 100 and merged[0]["shards"] == 2
+    assert [d.metadata["dl_meta"]["doc_items"][0]["prov"][0]["page_no"] for d in docs] == [3, 50, 51, 52]
+    assert docs[2].metadata["dl_meta"]["headings"] == ["Dosing"]
+    assert docs[2].page_content == "Dosing\ncontinued"
+    assert docs[3].page_content == "Toxicity\ny"
+
+def test_merge_shard_results_fails_whole_file():
+    merged = _merge_shard_results([
+        _shard_result((1, 50), [_shard_chunk("a", 1)]),
+        _shard_result((51, 100), [], error="RuntimeError: bad page"),
+    ])
+
+    assert merged[0]["docs"] == []
+    assert "RuntimeError: bad page" in merged[0]["error"]
 
 def test_build_vectorstore(mock_milvus, mock_openai_embeddings):
     splits = ["split1", "split2"]
@@ -76,13 +203,17 @@ def test_build_vectorstore(mock_milvus, mock_openai_embeddings):
 @patch("src.ingestion.load_pdfs")
 @patch("src.ingestion.build_vectorstore")
 def test_ingest_docs_success(mock_build, mock_load):
-    mock_load.return_value = ["doc1"]
+    doc = Document(page_content="doc1", metadata={"doc_key": "doc1.pdf"})
+    mock_load.return_value = [doc]
     mock_build.return_value = "vectorstore"
     
     result = ingest_docs()
     
     mock_load.assert_called_once()
-    mock_build.assert_called_once_with(["doc1"])
+    # Built into the next generation, which then becomes the active one
+    active = get_active_index()
+    mock_build.assert_called_once_with([doc], location=active)
+    assert active.generation == 1
     assert result == "vectorstore"
 
 @patch("src.ingestion.load_pdfs")
@@ -93,3 +224,189 @@ def test_ingest_docs_no_docs(mock_load):
     
     mock_load.assert_called_once()
     assert result is None
+    assert get_active_index().generation == 0
+
+def test_plan_incremental_ingest():
+    manifest = {"files": {
+        "same.pdf": {"sha256": "aaa"},
+        "changed.pdf": {"sha256": "bbb"},
+        "deleted.pdf": {"sha256": "ccc"},
+    }}
+    pdf_files = ["./data/same.pdf", "./data/changed.pdf", "./data/new.pdf"]
+    hashes = {"same.pdf": "aaa", "changed.pdf": "bbb2", "new.pdf": "ddd"}
+
+    to_ingest, to_remove = plan_incremental_ingest(pdf_files, manifest, hashes)
+
+    assert to_ingest == ["./data/changed.pdf", "./data/new.pdf"]
+    assert to_remove == ["changed.pdf", "deleted.pdf"]
+
+def test_update_vectorstore_deletes_by_doc_key(mock_milvus, mock_openai_embeddings):
+    mock_store = mock_milvus.return_value
+    mock_store.delete.return_value = True
+
+    vectorstore = update_vectorstore(["split1"], ["a.pdf", "b.pdf"])
+
+    mock_store.delete.assert_called_once_with(expr='doc_key in ["a.pdf", "b.pdf"]')
+    mock_store.add_documents.assert_called_once_with(["split1"])
+    mock_milvus.from_documents.assert_not_called()
+    assert vectorstore == mock_store
+
+@patch("src.ingestion.load_pdfs")
+@patch("src.ingestion.update_vectorstore")
+@patch("src.ingestion.build_vectorstore")
+def test_ingest_docs_incremental_only_changed(mock_build, mock_update, mock_load, tmp_path, monkeypatch, tmp_manifest, tmp_bm25_index):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "old.pdf").write_bytes(b"old")
+    (data_dir / "new.pdf").write_bytes(b"new")
+    milvus_db = tmp_path / "milvus.db"
+    milvus_db.touch()
+    monkeypatch.setattr("src.ingestion.MILVUS_URI", str(milvus_db))
+
+    # First run: full rebuild writes the manifest
+    mock_load.return_value = [Document(page_content="old guideline text", metadata={"doc_key": "old.pdf"})]
+    (data_dir / "new.pdf").unlink()
+    ingest_docs(data_dir=str(data_dir), incremental=True)
+    mock_build.assert_called_once()
+    manifest = json.loads(tmp_manifest.read_text())
+    assert manifest["config"] == get_chunking_config()
+    assert list(manifest["files"]) == ["old.pdf"]
+
+    # Second run: only the new file is parsed, nothing is dropped
+    (data_dir / "new.pdf").write_bytes(b"new")
+    mock_load.reset_mock()
+    mock_load.return_value = [Document(page_content="new guideline text", metadata={"doc_key": "new.pdf"})]
+    ingest_docs(data_dir=str(data_dir), incremental=True)
+    mock_load.assert_called_once_with(file_paths=[str(data_dir / "new.pdf")])
+    mock_update.assert_called_once_with(mock_load.return_value, [], location=None)
+    assert mock_build.call_count == 1
+    assert sorted(json.loads(tmp_manifest.read_text())["files"]) == ["new.pdf", "old.pdf"]
+    # The BM25 index follows the same change set
+    index = BM25Index.load(get_active_index().bm25_path)
+    assert [d.metadata["doc_key"] for d in index.docs] == ["old.pdf", "new.pdf"]
+
+@patch("src.ingestion.load_pdfs")
+@patch("src.ingestion.update_vectorstore")
+@patch("src.ingestion.build_vectorstore")
+def test_incremental_ingest_keeps_old_version_when_reparse_fails(mock_build, mock_update, mock_load, tmp_path, monkeypatch, tmp_manifest):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.pdf").write_bytes(b"v1")
+    milvus_db = tmp_path / "milvus.db"
+    milvus_db.touch()
+    monkeypatch.setattr("src.ingestion.MILVUS_URI", str(milvus_db))
+    mock_load.return_value = [Document(page_content="a guideline text v1", metadata={"doc_key": "a.pdf"})]
+    ingest_docs(data_dir=str(data_dir), incremental=True)
+    first_entry = json.loads(tmp_manifest.read_text())["files"]["a.pdf"]
+
+    # The new version fails to parse: its old chunks are not deleted
+    (data_dir / "a.pdf").write_bytes(b"v2, corrupt")
+    mock_load.return_value = []
+    ingest_docs(data_dir=str(data_dir), incremental=True)
+    mock_update.assert_called_once_with([], [], location=None)
+    assert len(BM25Index.load(get_active_index().bm25_path)) == 1
+    # ...and its manifest entry stays, so the next run retries the new version
+    assert json.loads(tmp_manifest.read_text())["files"]["a.pdf"] == first_entry
+
+@patch("src.ingestion._copy_vectors")
+@patch("src.ingestion.load_pdfs")
+@patch("src.ingestion.update_vectorstore")
+@patch("src.ingestion.build_vectorstore")
+def test_staged_ingest_swaps_generations_and_keeps_the_previous_one(mock_build, mock_update, mock_load, mock_copy, tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr("src.ingestion.MILVUS_URI", str(tmp_path / "missing.db"))
+    monkeypatch.setattr("src.ingestion._vectorstore_exists", lambda: True)
+    mock_load.side_effect = lambda *args, file_paths=None, **kwargs: [
+        Document(page_content=f"{os.path.basename(path)} guideline text", metadata={"doc_key": os.path.basename(path)})
+        for path in (file_paths or [str(data_dir / name) for name in sorted(os.listdir(data_dir))])]
+
+    generations = []
+    for name in ["a.pdf", "b.pdf", "c.pdf"]:
+        (data_dir / name).write_bytes(name.encode())
+        ingest_docs(data_dir=str(data_dir), incremental=True, staged=True)
+        generations.append(get_active_index())
+
+    # Every run filled a new generation instead of updating the served one in place
+    assert [g.generation for g in generations] == [1, 2, 3]
+    # Only the first run (no manifest yet) was a full build; later runs copied the
+    # active generation and applied just the new file to the copy
+    assert [call.kwargs["location"] for call in mock_build.call_args_list] == generations[:1]
+    assert [call.args for call in mock_copy.call_args_list] == [(generations[0], generations[1]),
+                                                                 (generations[1], generations[2])]
+    assert [(call.args[0][0].metadata["doc_key"], call.kwargs["location"]) for call in mock_update.call_args_list] == [
+        ("b.pdf", generations[1]), ("c.pdf", generations[2])]
+    assert sorted(d.metadata["doc_key"] for d in BM25Index.load(generations[-1].bm25_path).docs) == ["a.pdf", "b.pdf", "c.pdf"]
+    # The previous generation is kept for retrievers built before the swap, older ones are dropped
+    assert len(BM25Index.load(generations[1].bm25_path)) == 2
+    assert not os.path.exists(generations[0].bm25_path)
+
+    # Nothing changed: no new generation
+    with patch("src.ingestion._open_vectorstore") as mock_open:
+        assert ingest_docs(data_dir=str(data_dir), incremental=True, staged=True) == mock_open.return_value
+    assert get_active_index() == generations[-1]
+
+@patch("src.ingestion.load_pdfs", return_value=[])
+def test_full_rebuild_without_chunks_drops_the_staging_generation(mock_load, tmp_path):
+    with patch("src.ingestion._drop_index") as mock_drop:
+        assert ingest_docs(data_dir=str(tmp_path)) is None
+    # Once for leftovers before the build, once for the abandoned staging generation
+    assert [call.args[0].generation for call in mock_drop.call_args_list] == [1, 1]
+    assert get_active_index().generation == 0
+
+def test_chunking_config_tracks_dedup_settings(monkeypatch):
+    monkeypatch.setattr("src.ingestion.INGEST_DEDUP", "near")
+    monkeypatch.setattr("src.ingestion.DEDUP_THRESHOLD", 0.9)
+    deduped = get_chunking_config()
+    monkeypatch.setattr("src.ingestion.DEDUP_THRESHOLD", 0.8)
+    assert get_chunking_config() != deduped
+    # Changing the dedup mode forces the rebuild path
+    monkeypatch.setattr("src.ingestion.INGEST_DEDUP", "exact")
+    undeduped = get_chunking_config()
+    assert undeduped != deduped and undeduped["dedup_threshold"] is None
+
+def _parsed(file_name, texts):
+    docs = [Document(page_content=t, metadata={"source": file_name, "doc_key": file_name}) for t in texts]
+    return {"file_path": file_name, "docs": docs, "num_pages": 1, "error": None}
+
+def test_stream_ingest_batches_in_order():
+    vectorstore = MagicMock()
+    vectorstore.embeddings.embed_documents.side_effect = lambda texts: [[float(len(t))] for t in texts]
+    results = [_parsed("a.pdf", ["a1", "a2", "a3"]), _parsed("b.pdf", ["b1", "b2"])]
+
+    with patch("src.ingestion.iter_parsed_pdfs", return_value=(r for r in results)):
+        stats = stream_ingest(["a.pdf", "b.pdf"], vectorstore, batch_size=2, queue_depth=1)
+
+    inserted = [call.kwargs["texts"] for call in vectorstore.add_embeddings.call_args_list]
+    assert inserted == [["a1", "a2"], ["a3", "b1"], ["b2"]]
+    assert stats["chunks"] == 5
+    assert stats["doc_keys"] == {"a.pdf", "b.pdf"}
+
+def test_stream_ingest_propagates_stage_errors():
+    vectorstore = MagicMock()
+    vectorstore.embeddings.embed_documents.side_effect = RuntimeError("embedding API down")
+
+    with patch("src.ingestion.iter_parsed_pdfs", return_value=(r for r in [_parsed("a.pdf", ["a1"])])):
+        with pytest.raises(RuntimeError, match="embedding API down"):
+            stream_ingest(["a.pdf"], vectorstore, batch_size=1)
+
+    vectorstore.add_embeddings.assert_not_called()
+
+def test_stream_ingest_replaces_only_files_that_parsed():
+    vectorstore = MagicMock()
+    vectorstore.delete.return_value = True
+    vectorstore.embeddings.embed_documents.side_effect = lambda texts: [[1.0] for _ in texts]
+    failed = {"file_path": "b.pdf", "docs": [], "num_pages": 0, "error": "corrupt"}
+    bm25_index = BM25Index([Document(page_content="old a guideline text", metadata={"doc_key": "a.pdf"}),
+                            Document(page_content="old b guideline text", metadata={"doc_key": "b.pdf"})])
+
+    with patch("src.ingestion.iter_parsed_pdfs",
+               return_value=(r for r in [_parsed("a.pdf", ["new a guideline text"]), failed])):
+        stats = stream_ingest(["a.pdf", "b.pdf"], vectorstore, batch_size=1, bm25_index=bm25_index,
+                              replace_doc_keys=["a.pdf", "b.pdf"])
+
+    # a.pdf's old chunks go right before its new ones; b.pdf keeps its indexed version
+    assert [call[0] for call in vectorstore.method_calls if call[0] in ("delete", "add_embeddings")] == ["delete", "add_embeddings"]
+    vectorstore.delete.assert_called_once_with(expr='doc_key in ["a.pdf"]')
+    assert stats["doc_keys"] == {"a.pdf"}
+    assert sorted(d.page_content for d in bm25_index.docs) == ["new a guideline text", "old b guideline text"]
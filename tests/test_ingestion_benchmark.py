@@ -0,0 +1,48 @@
+import json
+from unittest.mock import patch
+from langchain_core.documents import Document
+from src.ingestion_benchmark import run_benchmark, start_stub_embedding_server
+from src.tracked_embeddings import TrackedOpenAIEmbeddings
+
+def _stub_embeddings(base_url):
+    return TrackedOpenAIEmbeddings(model="stub", base_url=base_url, api_key="stub",
+                                   use_cache=False, check_embedding_ctx_length=False)
+
+def test_stub_server_is_deterministic_and_reports_usage():
+    server, base_url = start_stub_embedding_server(dim=8)
+    try:
+        embeddings = _stub_embeddings(base_url)
+        first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+        usage = embeddings._usage_client.get_and_reset_usage()
+    finally:
+        server.shutdown()
+    
+    assert len(first[0]) == 8
+    assert first[0] == first[2] and first[0] != first[1]
+    assert usage["prompt_tokens"] > 0
+
+def test_run_benchmark_reports_each_stage(tmp_path):
+    docs = [Document(page_content=f"chunk {i}", metadata={"source": "a.pdf", "doc_key": "a.pdf"}) for i in range(3)]
+    
+    def fake_parse(pdf_files, max_workers, stats):
+        stats.update({"files": 1, "pages": 2, "wall_time": 0.5, "parse_time": 0.4,
+                      "chunk_time": 0.1, "pages_per_second": 4.0, "workers": 1})
+        yield {"docs": docs}
+    
+    server, base_url = start_stub_embedding_server(dim=8)
+    try:
+        with patch("src.ingestion_benchmark.ingestion.iter_parsed_pdfs", side_effect=fake_parse), \
+             patch("src.ingestion_benchmark.Milvus") as mock_milvus:
+            results = run_benchmark(["a.pdf"], _stub_embeddings(base_url), str(tmp_path / "bench.db"))
+    finally:
+        server.shutdown()
+    
+    stages = results["stages"]
+    assert results["corpus"]["chunks"] == 3
+    assert stages["parse"]["pages_per_second"] == 4.0
+    assert stages["chunk"]["chunks_per_second"] == 30.0
+    assert stages["embed"]["tokens"] > 0 and stages["embed"]["tokens_per_second"] > 0
+    assert stages["insert"]["rows"] == 3
+    assert mock_milvus.return_value.add_embeddings.call_args.kwargs["texts"] == ["chunk 0", "chunk 1", "chunk 2"]
+    assert results["peak_rss_mb"] > 0
+    json.dumps(results)
@@ -0,0 +1,39 @@
+import threading
+from src.ingestion_jobs import IngestionJobRunner, FAILED, SUCCEEDED
+
+def test_job_swaps_retriever_after_ingestion():
+    retrievers = iter(["old", "new"])
+    release = threading.Event()
+    
+    def ingest(progress_callback):
+        progress_callback("Parsing PDFs", 0.5)
+        release.wait(5)
+    
+    runner = IngestionJobRunner(retriever_factory=lambda: next(retrievers), ingest_fn=ingest)
+    assert runner.get_retriever() == "old"
+    
+    job = runner.submit("new.pdf")
+    # Queries keep using the old index while the job runs
+    assert runner.get_retriever() == "old"
+    assert runner.has_pending_jobs()
+    
+    release.set()
+    assert runner.wait(timeout=5)
+    assert job.status == SUCCEEDED and job.progress == 1.0
+    assert runner.get_retriever() == "new"
+    assert runner.index_version == 1
+
+def test_failed_job_keeps_current_retriever():
+    def ingest(progress_callback):
+        raise RuntimeError("embedding API down")
+    
+    runner = IngestionJobRunner(retriever_factory=lambda: object(), ingest_fn=ingest)
+    current = runner.get_retriever()
+    job = runner.submit("broken.pdf")
+    
+    assert runner.wait(timeout=5)
+    assert job.status == FAILED
+    assert "embedding API down" in job.error
+    assert runner.get_retriever() is current
+    assert runner.index_version == 0
+    assert runner.list_jobs() == [job]
@@ -0,0 +1,101 @@
+import asyncio
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from src.local_vectorstore import LocalVectorStore, parse_doc_key_filter
+
+class KeywordEmbeddings(Embeddings):
+    """One dimension per vocabulary word, so similarities are predictable."""
+    vocabulary = ["egfr", "alk", "kras", "braf"]
+
+    def embed_documents(self, texts):
+        return [[float(text.lower().count(word)) + 0.01 for word in self.vocabulary] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def make_store(tmp_path, dtype="float32"):
+    store = LocalVectorStore(KeywordEmbeddings(), path=str(tmp_path / "store"), dtype=dtype)
+    store.add_texts(["egfr egfr", "alk", "kras"], metadatas=[{"doc_key": "a.pdf"}, {"doc_key": "b.pdf"}, {"doc_key": "b.pdf"}])
+    return store
+
+def test_exact_top_k_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 16))
+    store = LocalVectorStore(KeywordEmbeddings(), path=str(tmp_path / "store"), dtype="float32")
+    store.add_embeddings([f"chunk {i}" for i in range(50)], vectors.tolist(), [{"doc_key": f"{i % 5}.pdf"} for i in range(50)])
+
+    queries = rng.standard_normal((3, 16))
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    results = store.search_batch_with_score(queries.tolist(), k=4)
+    for query, hits in zip(queries, results):
+        expected = np.argsort(-(normed @ (query / np.linalg.norm(query))))[:4]
+        assert [doc.page_content for doc, _ in hits] == [f"chunk {i}" for i in expected]
+        assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+def test_search_filters_and_metadata(tmp_path):
+    store = make_store(tmp_path, dtype="float16")
+    docs = store.similarity_search("egfr", k=2)
+    assert docs[0].page_content == "egfr egfr"
+    assert docs[0].metadata == {"doc_key": "a.pdf"}
+
+    filtered = store.similarity_search("egfr", k=5, expr='doc_key in ["b.pdf"]')
+    assert {doc.page_content for doc in filtered} == {"alk", "kras"}
+    assert store.similarity_search("egfr", k=5, expr='doc_key in ["missing.pdf"]') == []
+    assert asyncio.run(store.asimilarity_search("alk", k=1))[0].page_content == "alk"
+
+def test_reopen_append_and_delete(tmp_path):
+    store = make_store(tmp_path)
+    reader = LocalVectorStore(KeywordEmbeddings(), path=str(tmp_path / "store"))
+    assert len(reader) == 3
+    assert isinstance(reader._vectors, np.memmap)
+
+    store.add_texts(["braf"], metadatas=[{"doc_key": "c.pdf"}])
+    store.delete(expr='doc_key in ["b.pdf"]')
+    assert [doc.page_content for doc in store.similarity_search("alk kras braf egfr", k=5)] == ["braf", "egfr egfr"]
+    # An open reader keeps its snapshot until it reopens
+    assert len(reader.similarity_search("alk", k=5)) == 3
+
+    reopened = LocalVectorStore(KeywordEmbeddings(), path=str(tmp_path / "store"))
+    assert len(reopened) == 2
+    assert LocalVectorStore.exists(str(tmp_path / "store"))
+    assert len(LocalVectorStore(KeywordEmbeddings(), path=str(tmp_path / "store"), drop_old=True)) == 0
+
+def test_copy_to_is_independent_of_the_source(tmp_path):
+    store = make_store(tmp_path)
+    store.delete(expr='doc_key in ["b.pdf"]')  # the copy only needs the current generation
+    store.copy_to(str(tmp_path / "staging"))
+
+    copy = LocalVectorStore(KeywordEmbeddings(), path=str(tmp_path / "staging"))
+    copy.add_texts(["braf"], metadatas=[{"doc_key": "c.pdf"}])
+    assert {doc.page_content for doc in copy.similarity_search("egfr braf", k=5)} == {"egfr egfr", "braf"}
+    assert len(LocalVectorStore(KeywordEmbeddings(), path=str(tmp_path / "store"))) == 1
+
+def test_parse_doc_key_filter():
+    assert parse_doc_key_filter('doc_key in ["a.pdf", "b.pdf"]') == {"a.pdf", "b.pdf"}
+    assert parse_doc_key_filter('(doc_key in ["a.pdf", "b.pdf"]) and (doc_key == "b.pdf")') == {"b.pdf"}
+    with pytest.raises(ValueError):
+        parse_doc_key_filter('page > 3')
+
+@pytest.mark.parametrize("compact_dim,quantization", [(128, "none"), (0, "int8"), (0, "binary"), (192, "int8")])
+def test_compact_first_pass_rescored_with_full_precision(tmp_path, compact_dim, quantization):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((300, 256))
+    path = str(tmp_path / "store")
+    exact = LocalVectorStore(KeywordEmbeddings(), path=path, dtype="float32")
+    exact.add_embeddings([f"chunk {i}" for i in range(300)], vectors.tolist(), [{"doc_key": "a.pdf"}] * 300)
+    compact = LocalVectorStore(KeywordEmbeddings(), path=path, compact_dim=compact_dim, quantization=quantization, rescore_factor=8)
+
+    queries = (vectors[:20] + 0.3 * rng.standard_normal((20, 256))).tolist()
+    expected = exact.search_batch_with_score(queries, k=5)
+    results = compact.search_batch_with_score(queries, k=5)
+    overlap = [len({d.page_content for d, _ in a} & {d.page_content for d, _ in b}) / 5 for a, b in zip(expected, results)]
+    assert np.mean(overlap) >= 0.6
+    assert [hits[0][0].page_content for hits in results] == [hits[0][0].page_content for hits in expected]
+    # Returned scores are exact cosine similarities, not first-pass approximations
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = np.asarray(queries[0]) / np.linalg.norm(queries[0])
+    for doc, score in results[0]:
+        assert score == pytest.approx(normed[int(doc.page_content.split()[1])] @ query, abs=1e-5)
+    usage = compact.memory_usage()
+    assert 0 < usage["compact_bytes"] < usage["full_precision_bytes"]
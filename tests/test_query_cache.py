@@ -0,0 +1,44 @@
+import os
+import time
+from src.query_cache import TTLCache, bump_index_version, get_index_version, normalize_query, retrieval_cache
+
+def test_normalize_query():
+    assert normalize_query("  What is   EGFR?? ") == normalize_query("what is egfr") == "what is egfr"
+
+def test_lru_eviction_ttl_and_stats():
+    cache = TTLCache(max_entries=2, ttl=0.05)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]) == (1, 2, 1, 1)
+    assert stats["hit_rate"] == 1 / 3
+    
+    disabled = TTLCache(max_entries=0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None
+
+def test_bump_index_version_clears_retrieval_cache():
+    retrieval_cache.put("key", ["doc"])
+    version = get_index_version()
+    assert bump_index_version() == version + 1
+    assert retrieval_cache.get("key") is None
+
+def test_index_version_bumped_by_another_process_is_picked_up(tmp_path, monkeypatch):
+    path = tmp_path / "index_version"
+    monkeypatch.setattr("src.query_cache.INDEX_VERSION_PATH", str(path))
+    assert get_index_version() == 0
+    assert bump_index_version() == 1
+    assert path.read_text() == "1"
+    
+    # e.g. the ingestion CLI running next to the app, which replaces the file atomically
+    tmp = tmp_path / "index_version.tmp"
+    tmp.write_text("7")
+    os.replace(tmp, path)
+    assert get_index_version() == 7
+    assert bump_index_version() == 8
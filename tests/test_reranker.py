@@ -0,0 +1,109 @@
+import asyncio
+import sys
+import threading
+import time
+import types
+import pytest
+from unittest.mock import MagicMock, patch
+from langchain_core.documents import Document
+import src.reranker as reranker
+from src.reranker import arerank_documents, get_ranker, rerank_documents, warm_ranker
+from src.retrieval import RerankingRetriever
+
+class FakeRanker:
+    """Scores passages by their length (longest first), optionally slowly."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def rerank(self, request):
+        self.batches.append(len(request.passages))
+        time.sleep(self.delay)
+        scored = [{**p, "score": len(p["text"])} for p in request.passages]
+        return sorted(scored, key=lambda p: p["score"], reverse=True)
+
+@pytest.fixture(autouse=True)
+def fake_flashrank():
+    module = types.ModuleType("flashrank")
+    module.RerankRequest = lambda query, passages: types.SimpleNamespace(query=query, passages=passages)
+    with patch.dict(sys.modules, {"flashrank": module}):
+        yield
+
+def candidates():
+    return [Document(page_content="a", metadata={"chunk_id": "1"}),
+            Document(page_content="ccc", metadata={"chunk_id": "2"}),
+            Document(page_content="bb", metadata={"chunk_id": "3"})]
+
+def test_rerank_scores_in_one_batch_and_keeps_top_n():
+    ranker = FakeRanker()
+    with patch("src.reranker.get_ranker", return_value=ranker):
+        docs, reranked = rerank_documents("query", candidates(), top_n=2, timeout_ms=1000)
+    assert reranked
+    assert ranker.batches == [3]
+    assert [d.page_content for d in docs] == ["ccc", "bb"]
+    assert docs[0].metadata == {"chunk_id": "2", "rerank_score": 3.0}
+
+def test_rerank_falls_back_to_fusion_order():
+    with patch("src.reranker.get_ranker", return_value=FakeRanker(delay=0.2)):
+        start = time.perf_counter()
+        docs, reranked = rerank_documents("query", candidates(), top_n=2, timeout_ms=20)
+        assert time.perf_counter() - start < 0.15
+        assert not reranked
+        assert [d.page_content for d in docs] == ["a", "ccc"]
+
+        docs, reranked = asyncio.run(arerank_documents("query", candidates(), top_n=2, timeout_ms=20))
+        assert not reranked and [d.page_content for d in docs] == ["a", "ccc"]
+    reranker._rerank_executor.submit(lambda: None).result()  # let the timed-out batch finish
+
+    with patch("src.reranker.get_ranker", return_value=None):
+        assert rerank_documents("query", candidates(), top_n=1) == (candidates()[:1], False)
+
+def test_rerank_skips_while_a_timed_out_batch_is_running():
+    ranker = FakeRanker(delay=0.2)
+    with patch("src.reranker.get_ranker", return_value=ranker):
+        assert not rerank_documents("query", candidates(), top_n=2, timeout_ms=20)[1]
+        # The timed-out batch still occupies the rerank thread: don't queue behind it
+        start = time.perf_counter()
+        docs, reranked = rerank_documents("query", candidates(), top_n=2, timeout_ms=1000)
+        assert time.perf_counter() - start < 0.1
+        assert not reranked and [d.page_content for d in docs] == ["a", "ccc"]
+        assert ranker.batches == [3]
+
+        reranker._rerank_executor.submit(lambda: None).result()
+        assert rerank_documents("query", candidates(), top_n=2, timeout_ms=1000)[1]
+        assert ranker.batches == [3, 3]
+
+def test_ranker_is_loaded_in_the_background(monkeypatch):
+    loaded = threading.Event()
+    release = threading.Event()
+
+    def slow_ranker(**kwargs):
+        release.wait(1)
+        loaded.set()
+        return FakeRanker()
+    sys.modules["flashrank"].Ranker = slow_ranker
+    monkeypatch.setattr(reranker, "_ranker", None)
+    monkeypatch.setattr(reranker, "_ranker_failed", False)
+    monkeypatch.setattr(reranker, "_warmup_thread", None)
+
+    warm_ranker()
+    # A request arriving while the model loads keeps the fusion order instead of waiting
+    start = time.perf_counter()
+    docs, reranked = rerank_documents("query", candidates(), top_n=2, timeout_ms=1000)
+    assert time.perf_counter() - start < 0.1
+    assert not reranked and [d.page_content for d in docs] == ["a", "ccc"]
+
+    release.set()
+    assert loaded.wait(1)
+    reranker._warmup_thread.join(1)
+    assert isinstance(get_ranker(block=False), FakeRanker)
+    assert rerank_documents("query", candidates(), top_n=2, timeout_ms=1000)[1]
+
+def test_reranking_retriever_passes_sources_and_reranks():
+    inner = MagicMock()
+    inner.invoke.return_value = candidates()
+    retriever = RerankingRetriever.construct(retriever=inner, top_n=1, timeout_ms=1000)
+    with patch("src.reranker.get_ranker", return_value=FakeRanker()):
+        docs = retriever.invoke("query", sources=["a.pdf"])
+    inner.invoke.assert_called_once_with("query", sources=["a.pdf"])
+    assert [d.page_content for d in docs] == ["ccc"]
@@ -1,13 +1,36 @@
+import asyncio
+import time
 import pytest
-from unittest.mock import MagicMock, patch
+from typing import List
+from unittest.mock import AsyncMock, MagicMock, patch
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.documents import Document
+from langchain_milvus import Milvus
+from src.bm25_index import BM25Index
+from src.query_cache import bump_index_version, retrieval_cache
 from src.retrieval import (
+    CachedRetriever,
+    RerankingRetriever,
+    SourceFilteredRetriever,
+    TimedEnsembleRetriever,
+    TimedMultiQueryRetriever,
     get_vectorstore,
     get_retriever,
     get_bm25_retriever,
     get_ensemble_retriever,
-    get_advanced_retriever
+    get_advanced_retriever,
+    reciprocal_rank_fusion,
+    retrieval_confidence,
+    source_filter_expr
 )
 
+@pytest.fixture(autouse=True)
+def tmp_bm25_index(tmp_path, monkeypatch):
+    index_path = tmp_path / "bm25_index"
+    monkeypatch.setattr("src.bm25_index.BM25_INDEX_PATH", str(index_path))
+    return index_path
+
 @pytest.fixture
 def mock_milvus():
     with patch("src.retrieval.Milvus") as mock:
@@ -15,27 +38,27 @@ def mock_milvus():
 
 @pytest.fixture
 def mock_openai_embeddings():
-    with patch("src.retrieval.OpenAIEmbeddings") as mock:
+    with patch("src.retrieval.get_embeddings") as mock:
         yield mock
 
 @pytest.fixture
 def mock_bm25_retriever():
-    with patch("src.retrieval.BM25Retriever") as mock:
+    with patch("src.retrieval.get_bm25_retriever") as mock:
         yield mock
 
 @pytest.fixture
 def mock_ensemble_retriever():
-    with patch("src.retrieval.EnsembleRetriever") as mock:
+    with patch("src.retrieval.TimedEnsembleRetriever") as mock:
         yield mock
 
 @pytest.fixture
 def mock_multi_query_retriever():
-    with patch("src.retrieval.MultiQueryRetriever") as mock:
+    with patch("src.retrieval.TimedMultiQueryRetriever") as mock:
         yield mock
 
 @pytest.fixture
 def mock_chat_openai():
-    with patch("src.retrieval.ChatOpenAI") as mock:
+    with patch("src.retrieval.get_llm") as mock:
         yield mock
 
 def test_get_vectorstore(mock_milvus, mock_openai_embeddings):
@@ -58,11 +81,15 @@ def test_get_retriever(mock_milvus, mock_openai_embeddings):
     )
     assert retriever == mock_retriever
 
-def test_get_bm25_retriever(mock_bm25_retriever):
-    docs = [MagicMock(), MagicMock()]
-    get_bm25_retriever(docs, k=3)
+def test_get_bm25_retriever():
+    docs = [
+        Document(page_content="osimertinib for EGFR exon 19 deletion", metadata={"doc_key": "nscl.pdf"}),
+        Document(page_content="diversity action plans for phase 3 trials", metadata={"doc_key": "fda.pdf"}),
+    ]
+    retriever = get_bm25_retriever(docs, k=3)
     
-    mock_bm25_retriever.from_documents.assert_called_once_with(docs, k=3)
+    assert retriever.k == 3
+    assert retriever.invoke("EGFR deletion") == [docs[0]]
 
 def test_get_ensemble_retriever_success(mock_milvus, mock_bm25_retriever, mock_ensemble_retriever, mock_openai_embeddings):
     # Mock vectorstore behavior
@@ -70,10 +97,12 @@ def test_get_ensemble_retriever_success(mock_milvus, mock_bm25_retriever, mock_e
     # Ensure docs have content > 10 chars to pass the filter
     mock_docs = [MagicMock(page_content="content_long_enough_1"), MagicMock(page_content="content_long_enough_2")]
     mock_vectorstore.similarity_search.return_value = mock_docs
+    # get_vectorstore wraps similarity_search with timing, keep the original mock
+    mock_search = mock_vectorstore.similarity_search
     
     # Mock retrievers
     mock_bm25 = MagicMock()
-    mock_bm25_retriever.from_documents.return_value = mock_bm25
+    mock_bm25_retriever.return_value = mock_bm25
     
     mock_vector_retriever = MagicMock()
     mock_vectorstore.as_retriever.return_value = mock_vector_retriever
@@ -81,16 +110,32 @@ def test_get_ensemble_retriever_success(mock_milvus, mock_bm25_retriever, mock_e
     ensemble = get_ensemble_retriever(k=5)
     
     # Verify vectorstore interaction
-    mock_vectorstore.similarity_search.assert_called_once()
+    mock_search.assert_called_once()
     
     # Verify BM25 creation
-    mock_bm25_retriever.from_documents.assert_called_once_with(mock_docs, k=5)
+    mock_bm25_retriever.assert_called_once_with(mock_docs, k=5)
     
     # Verify Ensemble creation
-    mock_ensemble_retriever.assert_called_once_with(
-        retrievers=[mock_bm25, mock_vector_retriever],
-        weights=[0.5, 0.5]
+    mock_ensemble_retriever.construct.assert_called_once_with(
+        bm25_retriever=mock_bm25,
+        vector_retriever=mock_vector_retriever,
+        weights=[0.5, 0.5],
+        k=5,
     )
+    assert ensemble == mock_ensemble_retriever.construct.return_value
+
+def test_get_ensemble_retriever_uses_prebuilt_bm25_index(mock_milvus, mock_bm25_retriever, mock_ensemble_retriever, mock_openai_embeddings, tmp_bm25_index):
+    BM25Index([Document(page_content="osimertinib for EGFR mutations", metadata={"doc_key": "nscl.pdf"})]).save()
+    mock_search = mock_milvus.return_value.similarity_search
+    
+    get_ensemble_retriever(k=5)
+    
+    # No collection scan or BM25 rebuild at startup
+    mock_search.assert_not_called()
+    mock_bm25_retriever.assert_not_called()
+    bm25 = mock_ensemble_retriever.construct.call_args.kwargs["bm25_retriever"]
+    assert bm25.k == 5
+    assert [d.page_content for d in bm25.docs] == ["osimertinib for EGFR mutations"]
 
 def test_get_ensemble_retriever_fallback_no_docs(mock_milvus, mock_bm25_retriever, mock_ensemble_retriever, mock_openai_embeddings):
     """Test fallback to vector retriever when no valid docs found for BM25."""
@@ -104,12 +149,13 @@ def test_get_ensemble_retriever_fallback_no_docs(mock_milvus, mock_bm25_retrieve
     
     retriever = get_ensemble_retriever(k=5)
     
-    # Verify we got the vector retriever directly, not an ensemble
-    assert retriever == mock_vector_retriever
+    # Verify we got the vector retriever (wrapped for source filters), not an ensemble
+    assert isinstance(retriever, SourceFilteredRetriever)
+    assert retriever.vector_retriever == mock_vector_retriever
     
     # Verify BM25 was NOT initialized
-    mock_bm25_retriever.from_documents.assert_not_called()
-    mock_ensemble_retriever.assert_not_called()
+    mock_bm25_retriever.assert_not_called()
+    mock_ensemble_retriever.construct.assert_not_called()
 
 def test_get_ensemble_retriever_fallback_exception(mock_milvus, mock_bm25_retriever, mock_ensemble_retriever, mock_openai_embeddings):
     """Test fallback to vector retriever when Milvus query fails."""
@@ -121,8 +167,8 @@ def test_get_ensemble_retriever_fallback_exception(mock_milvus, mock_bm25_retrie
     
     retriever = get_ensemble_retriever(k=5)
     
-    assert retriever == mock_vector_retriever
-    mock_bm25_retriever.from_documents.assert_not_called()
+    assert retriever.vector_retriever == mock_vector_retriever
+    mock_bm25_retriever.assert_not_called()
 
 def test_get_advanced_retriever(mock_multi_query_retriever, mock_chat_openai, mock_milvus, mock_ensemble_retriever):
     # Mock dependencies to avoid complex setup
@@ -134,4 +180,221 @@ def test_get_advanced_retriever(mock_multi_query_retriever, mock_chat_openai, mo
         
         mock_get_ensemble.assert_called_once_with(k=5, filter=None)
         mock_chat_openai.assert_called_once()
-        mock_multi_query_retriever.from_llm.assert_called_once()
+        mock_multi_query_retriever.construct.assert_called_once_with(
+            base_retriever=mock_base_retriever, llm=mock_chat_openai.return_value, k=5
+        )
+        assert isinstance(advanced_retriever, CachedRetriever)
+        assert advanced_retriever.retriever == mock_multi_query_retriever.construct.return_value
+
+def test_get_advanced_retriever_with_rerank_retrieves_wide(mock_multi_query_retriever, mock_chat_openai, mock_milvus, mock_ensemble_retriever):
+    with patch("src.retrieval.get_ensemble_retriever") as mock_get_ensemble, \
+            patch("src.retrieval.RERANK_CANDIDATES", 20):
+        advanced_retriever = get_advanced_retriever(k=3, rerank=True)
+        
+        mock_get_ensemble.assert_called_once_with(k=20, filter=None)
+        assert mock_multi_query_retriever.construct.call_args.kwargs["k"] == 20
+        reranker = advanced_retriever.retriever
+        assert isinstance(reranker, RerankingRetriever)
+        assert reranker.top_n == 3
+        assert reranker.retriever == mock_multi_query_retriever.construct.return_value
+
+
+class SlowRetriever(BaseRetriever):
+    docs: List[Document]
+    delay: float
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        time.sleep(self.delay)
+        return self.docs
+
+def test_ensemble_runs_legs_concurrently():
+    bm25_doc = Document(page_content="bm25 hit")
+    vector_doc = Document(page_content="vector hit")
+    ensemble = TimedEnsembleRetriever.construct(
+        bm25_retriever=SlowRetriever(docs=[bm25_doc], delay=0.3),
+        vector_retriever=SlowRetriever(docs=[vector_doc], delay=0.3),
+        weights=[0.6, 0.4],
+    )
+    
+    start = time.perf_counter()
+    docs = ensemble.invoke("query")
+    elapsed = time.perf_counter() - start
+    
+    # Roughly max(BM25, vector), not their sum
+    assert elapsed < 0.5
+    assert docs == [bm25_doc, vector_doc]
+
+def test_ensemble_retrieve_batch_embeds_and_searches_once():
+    bm25_docs = [Document(page_content="EGFR osimertinib", metadata={"doc_key": "a.pdf"}),
+                 Document(page_content="PD-L1 pembrolizumab", metadata={"doc_key": "a.pdf"})]
+    vectorstore = MagicMock(spec=Milvus)
+    vectorstore.configure_mock(col=MagicMock(), collection_name="test", _vector_field="vector",
+                               search_params=None, timeout=None)
+    vectorstore.client = MagicMock()
+    vectorstore.embeddings = MagicMock()
+    vectorstore.embeddings.embed_documents.return_value = [[0.1], [0.2]]
+    vectorstore.client.search.return_value = [[{"entity": {"text": "v1"}}], [{"entity": {"text": "v2"}}]]
+    vectorstore._parse_document.side_effect = lambda entity: Document(page_content=entity["text"])
+    vector_retriever = MagicMock(vectorstore=vectorstore, search_kwargs={"k": 3, "expr": 'doc_key == "a.pdf"'})
+    ensemble = TimedEnsembleRetriever.construct(
+        bm25_retriever=BM25Index(bm25_docs).as_retriever(k=3),
+        vector_retriever=vector_retriever,
+        weights=[0.6, 0.4],
+    )
+    
+    results = ensemble.retrieve_batch(["osimertinib", "pembrolizumab"])
+    
+    vectorstore.embeddings.embed_documents.assert_called_once_with(["osimertinib", "pembrolizumab"])
+    vectorstore.client.search.assert_called_once()
+    _, kwargs = vectorstore.client.search.call_args
+    assert kwargs["data"] == [[0.1], [0.2]]
+    assert kwargs["limit"] == 3 and kwargs["filter"] == 'doc_key == "a.pdf"'
+    assert [[d.page_content for d in docs] for docs in results] == [
+        ["EGFR osimertinib", "v1"], ["PD-L1 pembrolizumab", "v2"]
+    ]
+    vector_retriever.invoke.assert_not_called()
+
+def test_async_ensemble_runs_legs_concurrently():
+    bm25_doc = Document(page_content="bm25 hit")
+    vector_doc = Document(page_content="vector hit")
+    ensemble = TimedEnsembleRetriever.construct(
+        bm25_retriever=SlowRetriever(docs=[bm25_doc], delay=0.3),
+        vector_retriever=SlowRetriever(docs=[vector_doc], delay=0.3),
+        weights=[0.6, 0.4],
+    )
+    
+    async def run_sessions():
+        return await asyncio.gather(*(ensemble.ainvoke(f"query {i}") for i in range(4)))
+    
+    start = time.perf_counter()
+    results = asyncio.run(run_sessions())
+    elapsed = time.perf_counter() - start
+    
+    # Four sessions, both legs each, all overlapped
+    assert elapsed < 1.0
+    assert results == [[bm25_doc, vector_doc]] * 4
+
+def test_async_multi_query_awaits_llm_and_batched_retrieval():
+    llm = MagicMock()
+    llm.ainvoke = AsyncMock(return_value=MagicMock(content="variation one\nvariation two\n"))
+    shared = Document(page_content="shared")
+    base_retriever = MagicMock()
+    base_retriever.aretrieve_batch = AsyncMock(return_value=[[shared], [shared, Document(page_content="other")]])
+    retriever = TimedMultiQueryRetriever.construct(base_retriever=base_retriever, llm=llm)
+    
+    docs = asyncio.run(retriever.ainvoke("question"))
+    
+    llm.ainvoke.assert_awaited_once()
+    llm.invoke.assert_not_called()
+    base_retriever.aretrieve_batch.assert_awaited_once_with(["variation one", "variation two"])
+    assert [d.page_content for d in docs] == ["shared", "other"]
+
+def test_retrieval_confidence_signals():
+    docs = [Document(page_content=text) for text in ["a", "b", "c"]]
+    agreeing = retrieval_confidence(docs, docs)
+    assert agreeing["top_score"] == pytest.approx(1.0)
+    assert agreeing["agreement"] == 1.0
+    
+    disjoint = retrieval_confidence(docs[:1], docs[1:])
+    assert disjoint["top_score"] == pytest.approx(0.5)
+    assert disjoint["agreement"] == 0.0
+    assert retrieval_confidence([], [])["top_score"] == 0.0
+
+def test_adaptive_multi_query_fast_path_and_expansion():
+    original = [Document(page_content="original hit")]
+    variation = [Document(page_content="variation hit")]
+    llm = MagicMock()
+    llm.invoke.return_value = MagicMock(content="variation one\nvariation two\nvariation three\n")
+    base_retriever = MagicMock()
+    base_retriever.retrieve_batch.return_value = [variation, variation]
+    retriever = TimedMultiQueryRetriever.construct(base_retriever=base_retriever, llm=llm, k=5, adaptive=True,
+                                                   num_variations=2, min_top_score=0.9, min_agreement=0.4)
+    
+    # Decisive original results: no query generation
+    base_retriever.retrieve_with_confidence.return_value = (original, {"top_score": 1.0, "agreement": 0.8, "margin": 0.5})
+    assert retriever.invoke("question", sources=["a.pdf"]) == original
+    base_retriever.retrieve_with_confidence.assert_called_once_with("question", sources=["a.pdf"])
+    llm.invoke.assert_not_called()
+    
+    # Weak agreement: expand with 2 variations and fuse them with the original results
+    base_retriever.retrieve_with_confidence.return_value = (original, {"top_score": 1.0, "agreement": 0.2, "margin": 0.5})
+    docs = retriever.invoke("question")
+    assert "2 different versions" in llm.invoke.call_args.args[0]
+    base_retriever.retrieve_batch.assert_called_once_with(["variation one", "variation two"])
+    # Found by both variations, so it outranks the original query's hit
+    assert [d.page_content for d in docs] == ["variation hit", "original hit"]
+
+def test_source_filter_pushed_down_to_both_legs():
+    bm25_retriever = BM25Index([Document(page_content="egfr testing in a.pdf", metadata={"doc_key": "a.pdf"}),
+                                Document(page_content="egfr testing in b.pdf", metadata={"doc_key": "b.pdf"})]).as_retriever(k=3)
+    vectorstore = MagicMock()
+    vectorstore.similarity_search.return_value = []
+    vector_retriever = VectorStoreRetriever.construct(vectorstore=vectorstore, search_type="similarity",
+                                                      search_kwargs={"k": 3, "expr": "page > 1"})
+    ensemble = TimedEnsembleRetriever.construct(
+        bm25_retriever=bm25_retriever, vector_retriever=vector_retriever, weights=[0.6, 0.4]
+    )
+    
+    docs = ensemble.invoke("egfr", sources=["b.pdf"])
+    
+    assert [d.metadata["doc_key"] for d in docs] == ["b.pdf"]
+    vectorstore.similarity_search.assert_called_once_with(
+        "egfr", k=3, expr='(page > 1) and (doc_key in ["b.pdf"])'
+    )
+    assert source_filter_expr(None) is None
+    assert source_filter_expr(["a.pdf", "b.pdf"]) == 'doc_key in ["a.pdf", "b.pdf"]'
+
+def test_vector_only_fallback_pushes_source_filter_down():
+    vectorstore = MagicMock()
+    vectorstore.similarity_search.return_value = []
+    vector_retriever = VectorStoreRetriever.construct(vectorstore=vectorstore, search_type="similarity",
+                                                      search_kwargs={"k": 3})
+    retriever = SourceFilteredRetriever.construct(vector_retriever=vector_retriever)
+    
+    retriever.invoke("egfr", sources=["b.pdf"])
+    vectorstore.similarity_search.assert_called_once_with("egfr", k=3, expr='doc_key in ["b.pdf"]')
+    
+    # No selection (all documents): no expression, so collections without doc_key still work
+    vectorstore.similarity_search.reset_mock()
+    retriever.invoke("egfr")
+    vectorstore.similarity_search.assert_called_once_with("egfr", k=3)
+
+def test_rrf_dedupes_by_chunk_id_and_truncates_after_fusion():
+    def chunk(text, doc_key="a.pdf"):
+        # A fresh object per call, as each retriever returns its own copies
+        return Document(page_content=text, metadata={"doc_key": doc_key})
+    
+    bm25 = [chunk("shared"), chunk("bm25 only"), chunk("tail")]
+    vector = [chunk("vector only"), chunk("shared"), chunk("tail", doc_key="b.pdf")]
+    
+    fused = reciprocal_rank_fusion([bm25, vector], weights=[0.5, 0.5], limit=3)
+    
+    # "shared" is in both lists; same text in another document is a different chunk
+    assert [d.page_content for d in fused] == ["shared", "vector only", "bm25 only"]
+    assert len(reciprocal_rank_fusion([bm25, vector])) == 5
+    
+    ensemble = TimedEnsembleRetriever.construct(
+        bm25_retriever=SlowRetriever(docs=bm25, delay=0.0),
+        vector_retriever=SlowRetriever(docs=vector, delay=0.0),
+        weights=[0.5, 0.5],
+        k=2,
+    )
+    assert [d.page_content for d in ensemble.invoke("query")] == ["shared", "vector only"]
+
+def test_cached_retriever_keys_on_query_sources_and_index_version():
+    retrieval_cache.clear()
+    inner = MagicMock()
+    inner.invoke.side_effect = lambda query, **kwargs: [Document(page_content=f"{query} {kwargs}")]
+    retriever = CachedRetriever.construct(retriever=inner, k=3)
+    
+    first = retriever.invoke("What is EGFR?", sources=["a.pdf", "b.pdf"])
+    assert retriever.invoke("  what is egfr ", sources=["b.pdf", "a.pdf"]) == first
+    assert inner.invoke.call_count == 1
+    
+    retriever.invoke("What is EGFR?", sources=["a.pdf"])
+    assert inner.invoke.call_count == 2
+    
+    # Ingestion bumps the index version: nothing cached before is served
+    bump_index_version()
+    retriever.invoke("What is EGFR?", sources=["a.pdf", "b.pdf"])
+    assert inner.invoke.call_count == 3
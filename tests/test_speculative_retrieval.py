@@ -0,0 +1,59 @@
+import time
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from src.speculative_retrieval import SpeculativeRetrieval, speculation_stats
+
+def make_retriever(delay=0.0):
+    retriever = MagicMock()
+    def invoke(query, **kwargs):
+        time.sleep(delay)
+        return [Document(page_content=f"docs for {query}")]
+    retriever.invoke.side_effect = invoke
+    return retriever
+
+def make_embeddings(raw_vector, rewritten_vector):
+    # The raw question is the first text embedded (in the background, at start())
+    embeddings = MagicMock()
+    embeddings.embed_query.side_effect = [raw_vector, rewritten_vector]
+    return embeddings
+
+def test_identical_rewrite_reuses_speculative_results():
+    before = speculation_stats()
+    retriever = make_retriever(delay=0.05)
+    embeddings = make_embeddings([1.0, 0.0], [0.0, 1.0])
+    speculation = SpeculativeRetrieval(retriever, "What is EGFR?", sources=["a.pdf"], embeddings=embeddings).start()
+    time.sleep(0.05)  # the rewrite
+
+    docs = speculation.resolve("what is egfr")
+    assert docs == [Document(page_content="docs for What is EGFR?")]
+    assert speculation.outcome == "identical"
+    retriever.invoke.assert_called_once_with("What is EGFR?", sources=["a.pdf"])
+    # Only the background embedding of the raw question, nothing after the rewrite
+    speculation._question_vector.result()
+    embeddings.embed_query.assert_called_once_with("What is EGFR?")
+    embeddings.embed_documents.assert_not_called()
+
+    after = speculation_stats()
+    assert after["identical"] == before["identical"] + 1
+    assert after["time_saved"] > before["time_saved"]
+
+def test_similar_rewrite_reused_and_different_rewrite_retrieved_again():
+    retriever = make_retriever()
+    similar = SpeculativeRetrieval(retriever, "and its dose?", embeddings=make_embeddings([1.0, 0.1], [1.0, 0.0]), threshold=0.9).start()
+    assert similar.resolve("What is the osimertinib dose?") == [Document(page_content="docs for and its dose?")]
+    assert similar.outcome == "similar"
+    assert retriever.invoke.call_count == 1
+
+    different = SpeculativeRetrieval(retriever, "and its dose?", embeddings=make_embeddings([1.0, 0.0], [0.0, 1.0]), threshold=0.9).start()
+    assert different.resolve("What is the osimertinib dose?") == [Document(page_content="docs for What is the osimertinib dose?")]
+    assert different.outcome == "re-retrieved"
+    assert "second_retrieval" in different.timings
+    assert [c.args[0] for c in different.embeddings.embed_query.call_args_list] == ["and its dose?", "What is the osimertinib dose?"]
+    different.embeddings.embed_documents.assert_not_called()
+
+def test_failed_speculation_falls_back_to_rewritten_query():
+    retriever = MagicMock()
+    retriever.invoke.side_effect = [RuntimeError("embedding API down"), [Document(page_content="ok")]]
+    speculation = SpeculativeRetrieval(retriever, "What is EGFR?", embeddings=MagicMock()).start()
+    assert speculation.resolve("What is EGFR?") == [Document(page_content="ok")]
+    assert speculation.outcome == "re-retrieved"
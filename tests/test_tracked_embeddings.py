@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+from unittest.mock import MagicMock, patch
+from langchain_openai import OpenAIEmbeddings
+from src.query_cache import query_embedding_cache
+from src.tracked_embeddings import TrackedOpenAIEmbeddings, TokenRateLimiter
+
+def _fake_api(embeddings):
+    """Stand-in for the OpenAI call: one vector per text, usage seen by the HTTP client."""
+    def embed(self, batch):
+        time.sleep(0.01)
+        response = MagicMock(content=json.dumps({"usage": {"prompt_tokens": len(batch), "total_tokens": len(batch)}}))
+        embeddings._usage_client._extract_usage(response)
+        return [[float(text)] for text in batch]
+    return embed
+
+def test_concurrent_batches_keep_order_and_sum_usage():
+    with patch("src.tracked_embeddings.EMBEDDING_BATCH_SIZE", 3):
+        embeddings = TrackedOpenAIEmbeddings(model="test-model", api_key="sk-test",
+                                             use_cache=False, max_concurrency=4)
+        texts = [str(i) for i in range(10)]
+
+        with patch.object(OpenAIEmbeddings, "embed_documents", autospec=True,
+                          side_effect=_fake_api(embeddings)) as mock_embed, \
+             patch.object(TrackedOpenAIEmbeddings, "_report_usage") as mock_report:
+            result = embeddings.embed_documents(texts)
+
+    assert result == [[float(i)] for i in range(10)]
+    assert [len(call.args[1]) for call in mock_embed.call_args_list] == [3, 3, 3, 1]
+    assert mock_report.call_args.args[1] == {"prompt_tokens": 10, "total_tokens": 10}
+
+def test_async_batches_keep_order_and_sum_usage():
+    with patch("src.tracked_embeddings.EMBEDDING_BATCH_SIZE", 3):
+        embeddings = TrackedOpenAIEmbeddings(model="test-model", api_key="sk-test",
+                                             use_cache=False, max_concurrency=2)
+        texts = [str(i) for i in range(10)]
+        in_flight = []
+
+        async def fake_aembed(self, batch):
+            in_flight.append(1)
+            assert len(in_flight) <= 2
+            await asyncio.sleep(0.01)
+            response = MagicMock(content=json.dumps({"usage": {"prompt_tokens": len(batch), "total_tokens": len(batch)}}))
+            embeddings._usage_client._extract_usage(response)
+            in_flight.pop()
+            return [[float(text)] for text in batch]
+
+        with patch.object(OpenAIEmbeddings, "aembed_documents", autospec=True,
+                          side_effect=fake_aembed) as mock_embed, \
+             patch.object(TrackedOpenAIEmbeddings, "_report_usage") as mock_report:
+            result = asyncio.run(embeddings.aembed_documents(texts))
+
+    assert result == [[float(i)] for i in range(10)]
+    assert [len(call.args[1]) for call in mock_embed.call_args_list] == [3, 3, 3, 1]
+    assert mock_report.call_args.args[1] == {"prompt_tokens": 10, "total_tokens": 10}
+
+def test_token_rate_limiter_blocks_when_budget_spent():
+    limiter = TokenRateLimiter(tokens_per_minute=6000)  # 100 tokens/s
+
+    assert limiter.acquire(6000) == 0.0
+    start = time.monotonic()
+    waited = limiter.acquire(10)
+    assert waited > 0
+    assert time.monotonic() - start >= 0.09
+
+def test_embed_query_served_from_query_cache():
+    query_embedding_cache.clear()
+    with patch("src.tracked_embeddings.get_embedding_cache", return_value=None):
+        embeddings = TrackedOpenAIEmbeddings(model="test-model", api_key="sk-test")
+    
+    with patch.object(OpenAIEmbeddings, "embed_documents", autospec=True,
+                      side_effect=lambda self, texts: [[1.0, 2.0] for _ in texts]) as mock_embed:
+        first = embeddings.embed_query("What is EGFR?")
+        assert embeddings.embed_query("what is egfr") == first
+        assert asyncio.run(embeddings.aembed_query("WHAT IS EGFR")) == first
+    
+    assert mock_embed.call_count == 1